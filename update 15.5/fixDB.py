@@ -1,34 +1,38 @@
 import sqlite3
+import sys
+
+from omron_corrections import setup_corrections, declare_job, run_job
+
+DB_NAME = 'omron.db'
+
+def fix_reversed_data(start='0000-00-00', end='9999-99-99'):
+    """Declares and runs the reversed-wiring corrections. Safe to re-run: finished jobs are skipped."""
+    db = sqlite3.connect(DB_NAME)
+    setup_corrections(db)
+
+    # 1. Flip any negative power or current to positive (every unit)
+    units = [row[0] for row in db.execute("SELECT DISTINCT unit_id FROM readings")]
+    jobs = []
+    for unit_id in units:
+        name = f"abs_current_power:{unit_id}:{start}:{end}"
+        declare_job(db, name, 'abs_current_power', unit_id, start, end)
+        jobs.append(name)
 
-def fix_reversed_data():
-    db = sqlite3.connect('omron.db')
-    cursor = db.cursor()
-    
-    # 1. Flip any negative power or current to positive
-    cursor.execute("""
-        UPDATE readings 
-        SET val_current = ABS(val_current),
-            val_power_kw = ABS(val_power_kw)
-        WHERE val_current < 0 OR val_power_kw < 0
-    """)
-    
     # 2. Fix the Energy Trend
-    # If Unit 02 energy has been decreasing, we find the max value 
-    # and subtract the current value from it to simulate an 'increase'
-    cursor.execute("SELECT MAX(val_energy_kwh) FROM readings WHERE unit_id = 'unit02'")
-    max_val = cursor.fetchone()[0] or 0
-    
-    if max_val > 0:
-        # This logic is a 'best effort' to make the energy look like it's increasing
-        cursor.execute("""
-            UPDATE readings 
-            SET val_energy_kwh = ? + (? - val_energy_kwh)
-            WHERE unit_id = 'unit02'
-        """, (max_val, max_val))
-        
-    db.commit()
+    # Unit 02 energy was decreasing; its maximum is captured once when the job is declared
+    # and each row is mirrored around it exactly once
+    name = f"invert_energy:unit02:{start}:{end}"
+    declare_job(db, name, 'invert_energy', 'unit02', start, end)
+    jobs.append(name)
     db.close()
+
+    for name in jobs:
+        run_job(DB_NAME, name)
     print("Database cleanup complete.")
 
 if __name__ == "__main__":
-    fix_reversed_data()
+    # python fixDB.py [start_date end_date]   (end is exclusive, e.g. 2026-01-01 2026-02-01)
+    if len(sys.argv) == 3:
+        fix_reversed_data(sys.argv[1], sys.argv[2])
+    else:
+        fix_reversed_data()
@@ -0,0 +1,211 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+from omron_rollup import unit_ids
+from omron_deadband import COMPRESSION_MODE, HEARTBEAT_INTERVAL, expand_steps
+
+# --- Configuration ---
+# Closed days are compressed with the swinging-door algorithm before retention
+# deletes the raw rows. Linear interpolation between archived points never
+# deviates from an original sample by more than the bound given here.
+ARCHIVE_DEVIATION = {
+    'val_voltage': 0.5,       # V
+    'val_current': 0.02,      # A
+    'val_power_kw': 0.005,    # kW
+    'val_energy_kwh': 0.001,  # kWh
+}
+# Seconds without samples that end a segment (outages are not interpolated over). Rows can be a
+# deadband heartbeat apart on a steady signal, so only a longer silence counts as an outage.
+ARCHIVE_GAP = HEARTBEAT_INTERVAL + 10
+
+TS_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def setup_archive(conn):
+    """Creates the archive point table and the per-day bookkeeping table."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive_points (
+            unit_id TEXT NOT NULL,
+            field TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            value REAL NOT NULL,
+            PRIMARY KEY (unit_id, field, timestamp)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive_days (
+            unit_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            field TEXT NOT NULL,
+            raw_rows INTEGER NOT NULL,
+            points INTEGER NOT NULL,
+            max_error REAL NOT NULL,
+            PRIMARY KEY (unit_id, day, field)
+        ) WITHOUT ROWID
+    ''')
+    conn.commit()
+
+def swinging_door(times, values, deviation, gap=ARCHIVE_GAP):
+    """Returns the indexes of the points to keep so that linear interpolation stays within `deviation`."""
+    n = len(times)
+    if n <= 2:
+        return list(range(n))
+
+    kept = [0]
+    anchor = 0
+    slope_upper = float('-inf')  # Lower edge of the open door (slopes reaching value - deviation)
+    slope_lower = float('inf')   # Upper edge of the open door (slopes reaching value + deviation)
+
+    i = 1
+    while i < n:
+        if times[i] - times[i - 1] > gap:
+            # Outage: close the segment on the last sample before it and restart after it
+            if kept[-1] != i - 1:
+                kept.append(i - 1)
+            kept.append(i)
+            anchor = i
+            slope_upper, slope_lower = float('-inf'), float('inf')
+            i += 1
+            continue
+
+        # The segment anchor -> i is valid if its slope passes through every earlier door
+        dt = times[i] - times[anchor]
+        slope = (values[i] - values[anchor]) / dt
+        if not slope_upper <= slope <= slope_lower:
+            # Doors closed: the previous point ends this segment and becomes the new anchor
+            anchor = i - 1
+            kept.append(anchor)
+            dt = times[i] - times[anchor]
+            slope_upper, slope_lower = float('-inf'), float('inf')
+
+        slope_upper = max(slope_upper, (values[i] - values[anchor] - deviation) / dt)
+        slope_lower = min(slope_lower, (values[i] - values[anchor] + deviation) / dt)
+        i += 1
+
+    if kept[-1] != n - 1:
+        kept.append(n - 1)
+    return kept
+
+def max_reconstruction_error(times, values, kept):
+    """Largest |original - interpolated| over all samples, used to verify the stated bound."""
+    worst = 0.0
+    for a, b in zip(kept, kept[1:]):
+        span = times[b] - times[a]
+        for i in range(a + 1, b):
+            estimate = values[a] + (values[b] - values[a]) * (times[i] - times[a]) / span if span else values[a]
+            worst = max(worst, abs(values[i] - estimate))
+    return worst
+
+def archive_day(conn, unit_id, day):
+    """Compresses one closed unit-day from the raw table into archive_points."""
+    next_day = (datetime.strptime(day, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT timestamp, {', '.join(ARCHIVE_DEVIATION)}
+        FROM readings
+        WHERE unit_id = ? AND timestamp >= ? AND timestamp < ?
+        ORDER BY timestamp ASC
+    """, (unit_id, day, next_day))
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    if COMPRESSION_MODE != 'off':
+        # Stored rows are steps held until the next row; compress the series they stand for
+        fields = ('timestamp',) + tuple(ARCHIVE_DEVIATION)
+        rows = [tuple(row[f] for f in fields) for row in expand_steps([dict(zip(fields, row)) for row in rows])]
+
+    stamps = [row[0] for row in rows]
+    times = [datetime.strptime(ts, TS_FORMAT).timestamp() for ts in stamps]
+    report = {}
+    for col, (field, deviation) in enumerate(ARCHIVE_DEVIATION.items(), start=1):
+        values = [row[col] for row in rows]
+        kept = swinging_door(times, values, deviation)
+        error = max_reconstruction_error(times, values, kept)
+        cursor.executemany("""
+            INSERT OR REPLACE INTO archive_points (unit_id, field, timestamp, value)
+            VALUES (?, ?, ?, ?)
+        """, [(unit_id, field, stamps[i], values[i]) for i in kept])
+        cursor.execute("""
+            INSERT OR REPLACE INTO archive_days (unit_id, day, field, raw_rows, points, max_error)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (unit_id, day, field, len(rows), len(kept), error))
+        report[field] = (len(kept), round(error, 6))
+    conn.commit()
+    return len(rows), report
+
+def forget_day(cursor, unit_id, day):
+    """Drops the archive of one unit-day so archive_closed_days() rebuilds it from the raw rows. Caller commits."""
+    next_day = (datetime.strptime(day, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    for field in ARCHIVE_DEVIATION:
+        cursor.execute("DELETE FROM archive_points WHERE unit_id = ? AND field = ? AND timestamp >= ? AND timestamp < ?",
+                       (unit_id, field, day, next_day))
+    cursor.execute("DELETE FROM archive_days WHERE unit_id = ? AND day = ?", (unit_id, day))
+
+def archive_closed_days(conn):
+    """Archives every closed day (before today) that has raw rows but no archive entry yet."""
+    cursor = conn.cursor()
+    today = datetime.now().strftime('%Y-%m-%d')
+    for unit_id in unit_ids(cursor):
+        cursor.execute("SELECT MIN(timestamp) FROM readings WHERE unit_id = ?", (unit_id,))
+        first_ts = cursor.fetchone()[0]
+        day = datetime.strptime(first_ts[:10], '%Y-%m-%d')
+        while day.strftime('%Y-%m-%d') < today:
+            day_text = day.strftime('%Y-%m-%d')
+            cursor.execute("SELECT 1 FROM archive_days WHERE unit_id = ? AND day = ? LIMIT 1", (unit_id, day_text))
+            if cursor.fetchone() is None:
+                result = archive_day(conn, unit_id, day_text)
+                if result:
+                    raw_rows, report = result
+                    print(f"[{datetime.now()}] --- ARCHIVE: {unit_id} {day_text} {raw_rows} rows -> {report} ---")
+            day += timedelta(days=1)
+
+def get_archived_readings(conn, unit_id, start, end):
+    """Reconstructs readings in [start, end) from archive points, interpolating each field linearly.
+
+    Rows come back in the same dict shape as the raw table (id is None).
+    """
+    cursor = conn.cursor()
+    series = {}
+    for field in ARCHIVE_DEVIATION:
+        # One extra point on each side so values at the range edges can be interpolated
+        cursor.execute("""
+            SELECT timestamp, value FROM (
+                SELECT timestamp, value FROM archive_points
+                WHERE unit_id = ? AND field = ? AND timestamp < ?
+                ORDER BY timestamp DESC LIMIT 1
+            )
+            UNION ALL
+            SELECT timestamp, value FROM archive_points
+            WHERE unit_id = ? AND field = ? AND timestamp >= ? AND timestamp < ?
+            UNION ALL
+            SELECT timestamp, value FROM (
+                SELECT timestamp, value FROM archive_points
+                WHERE unit_id = ? AND field = ? AND timestamp >= ?
+                ORDER BY timestamp ASC LIMIT 1
+            )
+        """, (unit_id, field, start, unit_id, field, start, end, unit_id, field, end))
+        series[field] = sorted(tuple(point) for point in cursor.fetchall())
+
+    stamps = sorted({ts for points in series.values() for ts, _ in points if start <= ts < end})
+    rows = [{'id': None, 'timestamp': ts, 'unit_id': unit_id} for ts in stamps]
+    for field, points in series.items():
+        j = 0
+        for row in rows:
+            ts = row['timestamp']
+            while j + 1 < len(points) and points[j + 1][0] <= ts:
+                j += 1
+            t0, v0 = points[j]
+            if t0 == ts or j + 1 >= len(points) or t0 > ts:
+                row[field] = v0
+                continue
+            t1, v1 = points[j + 1]
+            x0 = datetime.strptime(t0, TS_FORMAT).timestamp()
+            x1 = datetime.strptime(t1, TS_FORMAT).timestamp()
+            x = datetime.strptime(ts, TS_FORMAT).timestamp()
+            row[field] = round(v0 + (v1 - v0) * (x - x0) / (x1 - x0), 4)
+    return rows
+
+if __name__ == "__main__":
+    # Manual run: python omron_archive.py
+    with sqlite3.connect('omron.db') as conn:
+        setup_archive(conn)
+        archive_closed_days(conn)
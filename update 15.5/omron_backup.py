@@ -0,0 +1,321 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from omron_rollup import RESOLUTIONS, ROLLUP_FIELDS
+
+# --- Configuration ---
+# Snapshots are taken with the SQLite online backup API while the collector keeps
+# writing: a few pages per step, then a pause. Every snapshot is integrity-checked,
+# gzipped and listed with its SHA-256 in the manifest. Incremental snapshots hold
+# only readings above the previous snapshot's id high-water mark, so for readings
+# they are append-only: rows removed by retention since the full snapshot come back
+# on restore, and a correction job that finished since then forces a full snapshot.
+# The small bookkeeping tables are copied whole every time.
+BACKUP_DIR = 'backups'
+BACKUP_MANIFEST = 'manifest.jsonl'
+BACKUP_PAGES = 256             # Pages copied per backup step
+BACKUP_STEP_PAUSE = 0.05       # Seconds between steps so writers and readers get the lock
+BACKUP_ROWS = 5000             # Rows per chunk for incremental snapshots
+BACKUP_FULL_EVERY_DAYS = 7     # scheduled_backup(): full snapshot this often, incremental otherwise
+BACKUP_KEEP_FULL = 4           # Full snapshots (with their incrementals) kept by prune_backups()
+BACKUP_WHOLE_TABLES = ('outages', 'correction_jobs')  # Updated in place; small enough to copy whole
+
+READINGS_COLUMNS = 'id, timestamp, val_voltage, val_current, val_power_kw, val_energy_kwh, unit_id'
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _integrity_ok(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+    finally:
+        conn.close()
+
+def _compress(src_path, dst_path):
+    with open(src_path, 'rb') as src, gzip.open(dst_path, 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+def read_manifest(directory=BACKUP_DIR):
+    path = os.path.join(directory, BACKUP_MANIFEST)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def _append_manifest(directory, entry):
+    with open(os.path.join(directory, BACKUP_MANIFEST), 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+def _high_water_mark(conn):
+    row = conn.execute("SELECT id, timestamp FROM readings ORDER BY id DESC LIMIT 1").fetchone()
+    return (row[0], row[1]) if row else (0, None)
+
+def _changed_rollups(src, since):
+    """Rollup rows with bucket >= since, read with primary-key seeks per (resolution, unit, field)."""
+    rows = []
+    for resolution in RESOLUTIONS:
+        unit_id = ''
+        while True:
+            unit_id = src.execute("SELECT MIN(unit_id) FROM rollups WHERE resolution = ? AND unit_id > ?",
+                                  (resolution, unit_id)).fetchone()[0]
+            if unit_id is None:
+                break
+            for field in ROLLUP_FIELDS:
+                rows += src.execute("""
+                    SELECT * FROM rollups WHERE resolution = ? AND unit_id = ? AND field = ? AND bucket >= ?
+                """, (resolution, unit_id, field, since)).fetchall()
+    return rows
+
+def _history_rewritten(src, since):
+    """True when a correction job finished after `since` (it updated readings an incremental cannot carry)."""
+    if not src.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'correction_jobs'").fetchone():
+        return False
+    return src.execute("SELECT 1 FROM correction_jobs WHERE finished_at >= ? LIMIT 1", (since,)).fetchone() is not None
+
+def _finish(directory, tmp_path, name, entry):
+    """Verifies, compresses and records one snapshot. Returns the manifest entry."""
+    if not _integrity_ok(tmp_path):
+        raise sqlite3.DatabaseError(f"integrity_check failed for {name}, snapshot discarded")
+    final_path = os.path.join(directory, name + '.gz')
+    _compress(tmp_path, final_path + '.tmp')
+    os.replace(final_path + '.tmp', final_path)
+    entry.update({
+        'file': name + '.gz',
+        'bytes': os.path.getsize(final_path),
+        'sha256': _sha256(final_path),
+        'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    })
+    _append_manifest(directory, entry)
+    return entry
+
+def full_backup(db_name, directory=BACKUP_DIR, pages=BACKUP_PAGES, pause=BACKUP_STEP_PAUSE):
+    """Copies the whole database page by page with the online backup API."""
+    os.makedirs(directory, exist_ok=True)
+    name = f"full_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
+    started = time.time()
+    steps = 0
+
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+        time.sleep(pause)
+
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        tmp_path = os.path.join(tmp, name)
+        src = sqlite3.connect(db_name, timeout=5)
+        dst = sqlite3.connect(tmp_path)
+        try:
+            # Without a read transaction held on the source, every commit from the collector
+            # restarts the copy from page 1; inside one, WAL gives the backup a fixed snapshot
+            src.execute('BEGIN')
+            src.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            snapshot_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            src.backup(dst, pages=pages, progress=progress)
+            src.rollback()
+            # The copy is a consistent snapshot, so its own maximum id is the high-water mark
+            hwm_id, hwm_ts = _high_water_mark(dst)
+        finally:
+            dst.close()
+            src.close()
+        entry = _finish(directory, tmp_path, name, {
+            'kind': 'full', 'base': None, 'readings_hwm': hwm_id, 'hwm_timestamp': hwm_ts,
+            'snapshot_at': snapshot_at,
+        })
+
+    print(f"[{datetime.now()}] --- BACKUP: full snapshot {entry['file']} ({entry['bytes'] // 1024} KiB, "
+          f"{steps} steps, {time.time() - started:.1f}s) ---")
+    return entry
+
+def incremental_backup(db_name, directory=BACKUP_DIR, chunk=BACKUP_ROWS, pause=BACKUP_STEP_PAUSE):
+    """Copies readings above the last snapshot's high-water mark, the rollup buckets they touched
+    and the BACKUP_WHOLE_TABLES. Falls back to a full snapshot when corrections rewrote history."""
+    manifest = read_manifest(directory)
+    if not manifest:
+        return full_backup(db_name, directory)
+    previous = manifest[-1]
+    base = previous['file'] if previous['kind'] == 'full' else previous['base']
+    base_entry = next(e for e in reversed(manifest) if e['file'] == base)
+    src = sqlite3.connect(db_name, timeout=5)
+    try:
+        rewritten = _history_rewritten(src, base_entry.get('snapshot_at', base_entry['created']))
+    finally:
+        src.close()
+    if rewritten:
+        print(f"[{datetime.now()}] BACKUP: corrections changed readings since {base}, taking a full snapshot")
+        return full_backup(db_name, directory)
+    name = f"incr_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
+    started = time.time()
+
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        tmp_path = os.path.join(tmp, name)
+        src = sqlite3.connect(db_name, timeout=5)
+        dst = sqlite3.connect(tmp_path)
+        try:
+            whole = [name for (name,) in src.execute(
+                f"SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ({', '.join('?' * len(BACKUP_WHOLE_TABLES))})",
+                BACKUP_WHOLE_TABLES)]
+            tables = ['readings', 'rollups'] + whole
+            # Indexes of the whole tables travel along so restore() can recreate them as they were
+            schema = src.execute(f"""
+                SELECT sql FROM sqlite_master
+                WHERE sql IS NOT NULL AND (
+                    (type = 'table' AND name IN ({', '.join('?' * len(tables))}))
+                    OR (type = 'index' AND tbl_name IN ({', '.join('?' * len(whole)) or "''"})))
+                ORDER BY type DESC
+            """, tables + whole).fetchall()
+            for (sql,) in schema:
+                dst.execute(sql)
+
+            last_id = previous['readings_hwm']
+            # Fixed upper bound: the collector keeps appending, and chasing its tail would never finish
+            target_id = src.execute("SELECT COALESCE(MAX(id), 0) FROM readings").fetchone()[0]
+            copied = 0
+            while last_id < target_id:
+                rows = src.execute(f"""
+                    SELECT {READINGS_COLUMNS} FROM readings WHERE id > ? AND id <= ? ORDER BY id LIMIT ?
+                """, (last_id, target_id, chunk)).fetchall()
+                if not rows:
+                    break
+                dst.executemany(f"INSERT INTO readings ({READINGS_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                dst.commit()
+                last_id = rows[-1][0]
+                copied += len(rows)
+                time.sleep(pause)
+            hwm_ts = dst.execute("SELECT MAX(timestamp) FROM readings").fetchone()[0] or previous['hwm_timestamp']
+
+            # Rollup buckets are updated in place; every bucket from the previous mark's day on is re-sent
+            since = (previous['hwm_timestamp'] or '0000-00-00')[:10]
+            rollups = _changed_rollups(src, since)
+            if rollups:
+                dst.executemany(f"INSERT INTO rollups VALUES ({', '.join('?' * len(rollups[0]))})", rollups)
+            for table in whole:
+                rows = src.execute(f"SELECT * FROM {table}").fetchall()
+                if rows:
+                    dst.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(rows[0]))})", rows)
+            dst.commit()
+        finally:
+            dst.close()
+            src.close()
+        entry = _finish(directory, tmp_path, name, {
+            'kind': 'incremental', 'base': base, 'readings_hwm': last_id, 'hwm_timestamp': hwm_ts,
+            'readings': copied, 'rollups': len(rollups),
+        })
+
+    print(f"[{datetime.now()}] --- BACKUP: incremental {entry['file']} ({copied} readings, "
+          f"{len(rollups)} rollup rows, {time.time() - started:.1f}s) ---")
+    return entry
+
+def verify_backup(entry, directory=BACKUP_DIR):
+    """Re-checks a snapshot's SHA-256 and its integrity after decompression."""
+    path = os.path.join(directory, entry['file'])
+    if _sha256(path) != entry['sha256']:
+        return False
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = os.path.join(tmp, 'check.db')
+        with gzip.open(path, 'rb') as src, open(plain, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        return _integrity_ok(plain)
+
+def restore(target_path, directory=BACKUP_DIR, upto=None):
+    """Rebuilds a database from the newest full snapshot and its incrementals (up to file `upto`)."""
+    manifest = read_manifest(directory)
+    if upto:
+        manifest = manifest[:[e['file'] for e in manifest].index(upto) + 1]
+    fulls = [e for e in manifest if e['kind'] == 'full']
+    if not fulls:
+        raise FileNotFoundError("No full snapshot in the manifest")
+    base = fulls[-1]
+    chain = [base] + [e for e in manifest if e['kind'] == 'incremental' and e['base'] == base['file']]
+
+    for entry in chain:
+        if not verify_backup(entry, directory):
+            raise sqlite3.DatabaseError(f"{entry['file']} failed verification")
+
+    with gzip.open(os.path.join(directory, base['file']), 'rb') as src, open(target_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    conn = sqlite3.connect(target_path)
+    with tempfile.TemporaryDirectory() as tmp:
+        for entry in chain[1:]:
+            plain = os.path.join(tmp, entry['file'][:-3])
+            with gzip.open(os.path.join(directory, entry['file']), 'rb') as src, open(plain, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            conn.execute("ATTACH DATABASE ? AS incr", (plain,))
+            conn.execute(f"INSERT OR IGNORE INTO readings ({READINGS_COLUMNS}) SELECT {READINGS_COLUMNS} FROM incr.readings")
+            conn.execute("INSERT OR REPLACE INTO rollups SELECT * FROM incr.rollups")
+            # Whole tables replace their older copy, schema included (columns may have been added since)
+            for table, in conn.execute(f"""
+                SELECT name FROM incr.sqlite_master WHERE type = 'table' AND name IN ({', '.join('?' * len(BACKUP_WHOLE_TABLES))})
+            """, BACKUP_WHOLE_TABLES).fetchall():
+                conn.execute(f"DROP TABLE IF EXISTS main.{table}")
+                for (sql,) in conn.execute("""
+                    SELECT sql FROM incr.sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL ORDER BY type DESC
+                """, (table,)).fetchall():
+                    conn.execute(sql)
+                conn.execute(f"INSERT INTO main.{table} SELECT * FROM incr.{table}")
+            conn.commit()
+            conn.execute("DETACH DATABASE incr")
+    conn.close()
+    print(f"[{datetime.now()}] --- BACKUP: restored {base['file']} + {len(chain) - 1} incrementals to {target_path} ---")
+
+def prune_backups(directory=BACKUP_DIR, keep=BACKUP_KEEP_FULL):
+    """Deletes snapshot chains older than the newest `keep` full snapshots."""
+    manifest = read_manifest(directory)
+    fulls = [e['file'] for e in manifest if e['kind'] == 'full']
+    if len(fulls) <= keep:
+        return 0
+    expired = set(fulls[:-keep])
+    kept, removed = [], 0
+    for entry in manifest:
+        if entry['file'] in expired or entry.get('base') in expired:
+            path = os.path.join(directory, entry['file'])
+            if os.path.exists(path):
+                os.remove(path)
+            removed += 1
+        else:
+            kept.append(entry)
+    tmp_path = os.path.join(directory, BACKUP_MANIFEST + '.tmp')
+    with open(tmp_path, 'w') as f:
+        f.writelines(json.dumps(entry) + '\n' for entry in kept)
+    os.replace(tmp_path, os.path.join(directory, BACKUP_MANIFEST))
+    return removed
+
+def scheduled_backup(db_name, directory=BACKUP_DIR):
+    """Daily job: a full snapshot every BACKUP_FULL_EVERY_DAYS days, incrementals in between."""
+    try:
+        fulls = [e for e in read_manifest(directory) if e['kind'] == 'full']
+        due = (not fulls or datetime.strptime(fulls[-1]['created'], '%Y-%m-%d %H:%M:%S')
+               < datetime.now() - timedelta(days=BACKUP_FULL_EVERY_DAYS))
+        entry = full_backup(db_name, directory) if due else incremental_backup(db_name, directory)
+        prune_backups(directory)
+        return entry
+    except (sqlite3.Error, OSError) as e:
+        print(f"[{datetime.now()}] Backup Error: {e}")
+        return None
+
+if __name__ == "__main__":
+    # python omron_backup.py [full | incremental | verify | restore <target.db>]
+    command = sys.argv[1] if len(sys.argv) > 1 else 'incremental'
+    if command == 'full':
+        full_backup('omron.db')
+    elif command == 'incremental':
+        incremental_backup('omron.db')
+    elif command == 'verify':
+        for item in read_manifest():
+            print(f"{item['file']}: {'OK' if verify_backup(item) else 'FAILED'}")
+    elif command == 'restore':
+        restore(sys.argv[2])
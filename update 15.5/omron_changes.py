@@ -0,0 +1,67 @@
+import sqlite3
+import time
+
+# --- Configuration ---
+# readings.id is AUTOINCREMENT: ids are never reused and, with a single writer,
+# become visible in increasing order. That makes the id itself the change cursor:
+# a consumer that stores the last id it processed never sees a row twice or skips one.
+CHANGES_DEFAULT_LIMIT = 1000
+CHANGES_MAX_LIMIT = 20000
+CHANGES_POLL = 1.0  # Seconds between polls when following the feed
+
+READINGS_COLUMNS = ('id', 'timestamp', 'val_voltage', 'val_current', 'val_power_kw', 'val_energy_kwh', 'unit_id')
+
+def get_changes(conn, since=0, limit=CHANGES_DEFAULT_LIMIT, units=None):
+    """Returns rows with id > since (oldest first) and the cursor to pass next time.
+
+    {'changes': [row dicts], 'next': cursor, 'more': True if another batch is waiting}
+    """
+    limit = max(1, min(int(limit), CHANGES_MAX_LIMIT))
+    cursor = conn.cursor()
+    sql = f"SELECT {', '.join(READINGS_COLUMNS)} FROM readings WHERE id > ?"
+    params = [int(since)]
+    if units:
+        sql += f" AND unit_id IN ({', '.join('?' * len(units))})"
+        params += list(units)
+    # One extra row tells the consumer whether to call again right away
+    cursor.execute(sql + " ORDER BY id ASC LIMIT ?", params + [limit + 1])
+    rows = [dict(zip(READINGS_COLUMNS, row)) for row in cursor.fetchall()]
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'changes': rows,
+        'next': rows[-1]['id'] if rows else int(since),
+        'more': more,
+    }
+
+def iter_changes(db_name, since=0, batch=CHANGES_DEFAULT_LIMIT, units=None, follow=False, poll=CHANGES_POLL):
+    """Yields (cursor, row) for every change after `since`; with follow=True waits for new rows forever."""
+    while True:
+        conn = sqlite3.connect(db_name, timeout=5)
+        try:
+            page = get_changes(conn, since, batch, units)
+        finally:
+            conn.close()
+        for row in page['changes']:
+            yield row['id'], row
+        since = page['next']
+        if page['more']:
+            continue
+        if not follow:
+            return
+        time.sleep(poll)
+
+def iter_change_batches(db_name, since=0, batch=CHANGES_DEFAULT_LIMIT, units=None):
+    """Yields whole pages (list of rows, next cursor) until the feed is drained."""
+    while True:
+        conn = sqlite3.connect(db_name, timeout=5)
+        try:
+            page = get_changes(conn, since, batch, units)
+        finally:
+            conn.close()
+        if not page['changes']:
+            return
+        yield page['changes'], page['next']
+        since = page['next']
+        if not page['more']:
+            return
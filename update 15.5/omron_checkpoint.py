@@ -0,0 +1,137 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# --- Configuration ---
+# Writers never checkpoint (wal_autocheckpoint=0); this thread does it instead,
+# so a commit from the 1 Hz loop never pays for copying the WAL into the database.
+CHECKPOINT_POLL = 5              # Seconds between WAL size checks
+CHECKPOINT_INTERVAL = 60         # PASSIVE checkpoint at least this often
+CHECKPOINT_WAL_BYTES = 4 * 1024 * 1024  # TRUNCATE as soon as the WAL file passes this size
+CHECKPOINT_TRUNCATE_INTERVAL = 3600     # and at least once an hour
+CHECKPOINT_BUSY_TIMEOUT = 0.05   # TRUNCATE blocks writers while it waits; keep that wait below the collector's budget
+CHECKPOINT_STALL_CYCLES = 3      # Warn when frames stay pending this many checkpoints in a row
+# Rewritten whenever days that are already closed change (spool replay, corrections,
+# outages, retention), so readers can key cached past ranges on it without a query
+HISTORY_SUFFIX = '-history'
+
+def connect_writer(db_name, timeout=5.0):
+    """Opens a connection for writing with automatic checkpoints turned off."""
+    conn = sqlite3.connect(db_name, timeout=timeout)
+    conn.execute('PRAGMA wal_autocheckpoint=0')
+    return conn
+
+def wal_size(db_name):
+    """Current size of the -wal file in bytes (0 when it does not exist)."""
+    try:
+        return os.path.getsize(db_name + '-wal')
+    except OSError:
+        return 0
+
+def mark_history_changed(db_name):
+    """Bumps the generation of the closed days of db_name."""
+    with open(db_name + HISTORY_SUFFIX, 'w') as f:
+        f.write(str(time.time_ns()))
+
+def history_version(db_name):
+    """Generation of the closed days ('0' until something rewrote them)."""
+    try:
+        with open(db_name + HISTORY_SUFFIX) as f:
+            return f.read() or '0'
+    except OSError:
+        return '0'
+
+class CheckpointManager:
+    """Background checkpointing on a schedule and on WAL size thresholds, with metrics."""
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.lock = threading.Lock()
+        self.last_passive = time.time()
+        self.last_truncate = time.time()
+        self.stalled = 0
+        self._metrics = {
+            'wal_bytes': 0,
+            'checkpoints': 0,
+            'last_mode': None,
+            'last_duration_ms': 0.0,
+            'max_duration_ms': 0.0,
+            'frames_in_wal': 0,
+            'frames_pending': 0,
+            'busy': 0,
+            'last_checkpoint': None,
+        }
+
+    def metrics(self):
+        with self.lock:
+            result = dict(self._metrics)
+        result['wal_bytes'] = wal_size(self.db_name)
+        return result
+
+    def checkpoint(self, mode='PASSIVE'):
+        """Runs one checkpoint. Returns (busy, frames in WAL, frames checkpointed)."""
+        started = time.perf_counter()
+        try:
+            conn = sqlite3.connect(self.db_name, timeout=CHECKPOINT_BUSY_TIMEOUT)
+            try:
+                busy, log_frames, done_frames = conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+            finally:
+                conn.close()
+        except sqlite3.OperationalError as e:
+            print(f"[{datetime.now()}] CHECKPOINT {mode} skipped: {e}")
+            busy, log_frames, done_frames = 1, -1, -1
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        pending = max(log_frames - done_frames, 0) if log_frames >= 0 else 0
+        with self.lock:
+            m = self._metrics
+            m['checkpoints'] += 1
+            m['last_mode'] = mode
+            m['last_duration_ms'] = round(duration_ms, 2)
+            m['max_duration_ms'] = max(m['max_duration_ms'], round(duration_ms, 2))
+            m['frames_in_wal'] = max(log_frames, 0)
+            m['frames_pending'] = pending
+            m['busy'] += 1 if busy else 0
+            m['last_checkpoint'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        # Frames stay pending while a reader holds an old snapshot open
+        self.stalled = self.stalled + 1 if pending else 0
+        if self.stalled == CHECKPOINT_STALL_CYCLES:
+            print(f"[{datetime.now()}] CHECKPOINT: {pending} frames still pending after "
+                  f"{self.stalled} checkpoints, a long-running reader is holding the WAL")
+        return busy, log_frames, done_frames
+
+    def run_once(self, now=None):
+        """Decides whether a checkpoint is due and runs it. Returns the mode used or None."""
+        now = now or time.time()
+        size = wal_size(self.db_name)
+        with self.lock:
+            self._metrics['wal_bytes'] = size
+
+        # SQLite reuses the WAL file from the start without shrinking it, so its size only
+        # tracks unflushed data if checkpoints that find it large also reset it (TRUNCATE)
+        if size >= CHECKPOINT_WAL_BYTES or (size and now - self.last_truncate >= CHECKPOINT_TRUNCATE_INTERVAL):
+            mode = 'TRUNCATE'
+        elif size and now - self.last_passive >= CHECKPOINT_INTERVAL:
+            mode = 'PASSIVE'
+        else:
+            return None
+
+        busy, log_frames, done_frames = self.checkpoint(mode)
+        self.last_passive = now
+        if mode == 'TRUNCATE' and not busy:
+            self.last_truncate = now
+            print(f"[{datetime.now()}] --- CHECKPOINT TRUNCATE: WAL was {size // 1024} KiB, "
+                  f"{done_frames}/{log_frames} frames in {self._metrics['last_duration_ms']} ms ---")
+        return mode
+
+    def run(self, stop_event=None):
+        """Background loop for the collector process."""
+        while stop_event is None or not stop_event.is_set():
+            time.sleep(CHECKPOINT_POLL)
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[{datetime.now()}] CHECKPOINT Error: {e}")
@@ -0,0 +1,271 @@
+import os
+import math
+import mmap
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+from omron_rollup import unit_ids
+from omron_deadband import SAMPLE_INTERVAL, HEARTBEAT_INTERVAL
+
+try:
+    import numpy as np
+except ImportError:  # The Pi image does not always ship NumPy; memoryviews work without it
+    np = None
+
+# --- Configuration ---
+# One file per closed unit-day: columnar/<unit_id>/<YYYY-MM-DD>.col
+# Layout (little-endian): 16-byte header, int64 epoch seconds[n], then float64[n] per field.
+COLUMNAR_DIR = 'columnar'
+FIELDS = ('val_voltage', 'val_current', 'val_power_kw', 'val_energy_kwh')
+MAGIC = b'OMRC'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQ')  # magic, version, field count, row count
+COLUMNAR_OPEN_DAYS = 64  # Mapped unit-days kept open by a reader (least recently used are dropped)
+
+TS_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_open_days = OrderedDict()  # path -> ColumnarDay, most recently used last
+_open_days_lock = threading.Lock()
+
+def day_path(unit_id, day, directory=COLUMNAR_DIR):
+    return os.path.join(directory, unit_id, f"{day}.col")
+
+def write_day(conn, unit_id, day, directory=COLUMNAR_DIR):
+    """Writes one closed unit-day from the raw table. Files are written once and never modified."""
+    path = day_path(unit_id, day, directory)
+    if os.path.exists(path):
+        return None
+
+    next_day = (datetime.strptime(day, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT timestamp, {', '.join(FIELDS)}
+        FROM readings
+        WHERE unit_id = ? AND timestamp >= ? AND timestamp < ?
+        ORDER BY timestamp ASC
+    """, (unit_id, day, next_day))
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+
+    stamps = array('q', (int(datetime.strptime(row[0], TS_FORMAT).timestamp()) for row in rows))
+    columns = [_float_column(rows, i) for i in range(1, len(FIELDS) + 1)]
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Unique per writer: the rollover and maintenance threads can write the same day at once
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f"{day}.col.", suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(FIELDS), len(rows)))
+        for column in [stamps] + columns:
+            if sys.byteorder == 'big':
+                column.byteswap()
+            column.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)  # Readers only ever see complete files
+    return len(rows)
+
+def remove_day(unit_id, day, directory=COLUMNAR_DIR):
+    """Deletes one unit-day file whose raw rows changed; the next write_closed_days() rewrites it."""
+    try:
+        os.remove(day_path(unit_id, day, directory))
+        return True
+    except FileNotFoundError:
+        return False
+
+def prune_days(before_day, directory=COLUMNAR_DIR):
+    """Deletes the files of days before `before_day` (retention). Returns the number removed."""
+    removed = 0
+    if not os.path.isdir(directory):
+        return 0
+    for unit_id in os.listdir(directory):
+        unit_dir = os.path.join(directory, unit_id)
+        if not os.path.isdir(unit_dir):
+            continue
+        for name in os.listdir(unit_dir):
+            # '<day>.col' and leftover '<day>.col.<random>.tmp' files of interrupted writes
+            if name[:10] < before_day[:10]:
+                os.remove(os.path.join(unit_dir, name))
+                removed += 1
+    return removed
+
+def write_closed_days(conn, directory=COLUMNAR_DIR):
+    """Writes a file for every closed day that still has raw rows and no file yet."""
+    cursor = conn.cursor()
+    today = datetime.now().strftime('%Y-%m-%d')
+    for unit_id in unit_ids(cursor):
+        cursor.execute("SELECT MIN(timestamp) FROM readings WHERE unit_id = ?", (unit_id,))
+        day = datetime.strptime(cursor.fetchone()[0][:10], '%Y-%m-%d')
+        while day.strftime('%Y-%m-%d') < today:
+            day_text = day.strftime('%Y-%m-%d')
+            written = write_day(conn, unit_id, day_text, directory)
+            if written:
+                print(f"[{datetime.now()}] --- COLUMNAR: {unit_id} {day_text} ({written} rows) ---")
+            day += timedelta(days=1)
+
+class ColumnarDay:
+    """Memory-mapped view of one unit-day file. Columns are zero-copy views into the mapping."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.identity = _identity(os.fstat(f.fileno()))
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, field_count, self.count = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION or field_count != len(FIELDS):
+            raise ValueError(f"{path}: not a version {VERSION} columnar file")
+
+        offset = HEADER.size
+        self.timestamps = self._column('q', offset)
+        self.columns = {}
+        for field in FIELDS:
+            offset += self.count * 8
+            self.columns[field] = self._column('d', offset)
+
+    def _column(self, typecode, offset):
+        if np is not None:
+            dtype = '<i8' if typecode == 'q' else '<f8'
+            return np.frombuffer(self.mm, dtype=dtype, count=self.count, offset=offset)
+        return memoryview(self.mm)[offset:offset + self.count * 8].cast(typecode)
+
+    def slice(self, start_epoch, end_epoch):
+        """Returns {'t': ..., field: ...} for start_epoch <= t < end_epoch without copying."""
+        if np is not None:
+            lo, hi = np.searchsorted(self.timestamps, [start_epoch, end_epoch])
+        else:
+            lo = bisect_left(self.timestamps, start_epoch)
+            hi = bisect_left(self.timestamps, end_epoch)
+        result = {'t': self.timestamps[lo:hi]}
+        for field, column in self.columns.items():
+            result[field] = column[lo:hi]
+        return result
+
+def _identity(st):
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+def open_day(unit_id, day, directory=COLUMNAR_DIR):
+    """Returns the cached ColumnarDay for a unit-day, or None if the day has no file.
+
+    A cached mapping is only reused while the file is the same one (a late replay
+    deletes and rewrites closed days). Dropped mappings are unmapped once the last
+    slice taken from them is released.
+    """
+    path = day_path(unit_id, day, directory)
+    try:
+        identity = _identity(os.stat(path))
+    except OSError:
+        identity = None
+    with _open_days_lock:
+        columnar = _open_days.pop(path, None)
+        if identity is None:
+            return None
+        if columnar is None or columnar.identity != identity:
+            columnar = ColumnarDay(path)
+        _open_days[path] = columnar
+        while len(_open_days) > COLUMNAR_OPEN_DAYS:
+            _open_days.popitem(last=False)
+    return columnar
+
+def _concat(parts, typecode):
+    if np is not None:
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+    if len(parts) == 1:
+        return parts[0]
+    joined = array(typecode)
+    for part in parts:
+        joined.frombytes(part.tobytes())
+    return joined
+
+def read_columns(conn, unit_id, start, end, directory=COLUMNAR_DIR):
+    """Returns {'t': epoch seconds, field: values} for [start, end) ('YYYY-MM-DD[ HH:MM:SS]').
+
+    Closed days come from the memory-mapped files; days without a file (today,
+    or days not yet written) are read from SQLite. A single-day range is a
+    zero-copy slice of the mapping.
+    """
+    start_epoch = _to_epoch(start)
+    end_epoch = _to_epoch(end)
+    parts = []
+
+    day = datetime.strptime(start[:10], '%Y-%m-%d')
+    while day.timestamp() < end_epoch:
+        day_text = day.strftime('%Y-%m-%d')
+        columnar = open_day(unit_id, day_text, directory)
+        if columnar is not None:
+            parts.append(columnar.slice(start_epoch, end_epoch))
+        else:
+            parts.append(_read_sqlite_day(conn, unit_id, day_text, start_epoch, end_epoch))
+        day += timedelta(days=1)
+
+    parts = [p for p in parts if len(p['t'])] or [_empty()]
+    result = {'t': _concat([p['t'] for p in parts], 'q')}
+    for field in FIELDS:
+        result[field] = _concat([p[field] for p in parts], 'd')
+    return result
+
+def take(columns, indices):
+    """Rows `indices` (ascending) of a read_columns result, keeping each column's array type."""
+    if np is not None:
+        indices = np.asarray(indices, dtype=np.intp)
+        return {key: np.asarray(column)[indices] for key, column in columns.items()}
+    return {key: array('q' if key == 't' else 'd', (column[i] for i in indices)) for key, column in columns.items()}
+
+def expand_column_steps(columns, interval=SAMPLE_INTERVAL, heartbeat=HEARTBEAT_INTERVAL):
+    """Column form of omron_deadband.expand_steps: each row repeats every `interval` seconds
+    until the next one, except across gaps longer than the heartbeat (real outages)."""
+    stamps = columns['t']
+    indices, expanded_stamps = [], []
+    for i in range(len(stamps)):
+        count = 1
+        if i + 1 < len(stamps):
+            gap = int(stamps[i + 1] - stamps[i])
+            if gap <= heartbeat + interval:
+                count = max(-(-gap // interval), 1)
+        indices += [i] * count
+        expanded_stamps += range(int(stamps[i]), int(stamps[i]) + count * interval, interval)
+    expanded = take(columns, indices)
+    expanded['t'] = np.asarray(expanded_stamps, dtype='<i8') if np is not None else array('q', expanded_stamps)
+    return expanded
+
+def _float_column(rows, i):
+    # NULL (a value the meter did not deliver) is stored and served as NaN, never dropped
+    return array('d', (math.nan if row[i] is None else row[i] for row in rows))
+
+def _to_epoch(text):
+    return int(datetime.strptime(text, TS_FORMAT if len(text) > 10 else '%Y-%m-%d').timestamp())
+
+def _empty():
+    if np is not None:
+        return {'t': np.empty(0, dtype='<i8'), **{field: np.empty(0, dtype='<f8') for field in FIELDS}}
+    return {'t': array('q'), **{field: array('d') for field in FIELDS}}
+
+def _read_sqlite_day(conn, unit_id, day, start_epoch, end_epoch):
+    lo = max(day, datetime.fromtimestamp(start_epoch).strftime(TS_FORMAT))
+    hi = min((datetime.strptime(day, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d'),
+             datetime.fromtimestamp(end_epoch).strftime(TS_FORMAT))
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT timestamp, {', '.join(FIELDS)}
+        FROM readings
+        WHERE unit_id = ? AND timestamp >= ? AND timestamp < ?
+        ORDER BY timestamp ASC
+    """, (unit_id, lo, hi))
+    rows = cursor.fetchall()
+    stamps = array('q', (int(datetime.strptime(row[0], TS_FORMAT).timestamp()) for row in rows))
+    part = {'t': np.frombuffer(stamps, dtype='<i8') if np is not None and len(stamps) else stamps}
+    for i, field in enumerate(FIELDS, start=1):
+        values = _float_column(rows, i)
+        part[field] = np.frombuffer(values, dtype='<f8') if np is not None and len(values) else values
+    return part
+
+if __name__ == "__main__":
+    # Manual run: python omron_columnar.py
+    with sqlite3.connect('omron.db') as conn:
+        write_closed_days(conn)
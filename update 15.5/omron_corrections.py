@@ -0,0 +1,186 @@
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from omron_rollup import rebuild_rollups
+from omron_archive import forget_day
+from omron_columnar import remove_day, COLUMNAR_DIR
+from omron_checkpoint import mark_history_changed
+from omron_deadband import COMPRESSION_MODE
+
+# --- Configuration ---
+# A correction job is declared once (kind, unit, time range) and then applied in
+# id-ordered batches up to the highest id at declaration. The batch and the job's
+# bookmark commit together, so a row is never corrected twice, rows written after
+# the declaration are never touched, and a finished job is a no-op when run again.
+CORRECTION_BATCH_SIZE = 1000
+CORRECTION_PAUSE = 0.1       # Seconds between batches so the collector keeps writing
+CORRECTION_LOCK_TIMEOUT = 5
+
+def _abs_current_power(params):
+    return ("val_current = ABS(val_current), val_power_kw = ABS(val_power_kw)",
+            "(val_current < 0 OR val_power_kw < 0)", ())
+
+def _prepare_invert_energy(cursor, unit_id, start, end):
+    # Captured once when the job is declared; re-reading it after a partial run would change the answer
+    cursor.execute("""
+        SELECT MAX(val_energy_kwh) FROM readings
+        WHERE unit_id = ? AND timestamp >= ? AND timestamp < ?
+    """, (unit_id, start, end))
+    return {'max_kwh': cursor.fetchone()[0] or 0}
+
+def _invert_energy(params):
+    # Mirrors a decreasing energy counter around its maximum so it increases
+    return ("val_energy_kwh = ? + (? - val_energy_kwh)", "1", (params['max_kwh'], params['max_kwh']))
+
+# kind -> (prepare(cursor, unit, start, end) -> params or None, build(params) -> (SET, WHERE, args))
+CORRECTIONS = {
+    'abs_current_power': (None, _abs_current_power),
+    'invert_energy': (_prepare_invert_energy, _invert_energy),
+}
+
+def setup_corrections(conn):
+    """Creates the job table (declaration, frozen parameters and progress per job)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS correction_jobs (
+            name TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            unit_id TEXT NOT NULL,
+            start_ts TEXT NOT NULL,
+            end_ts TEXT NOT NULL,
+            params TEXT NOT NULL,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            target_id INTEGER,
+            rows_changed INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_at TEXT NOT NULL,
+            finished_at TEXT
+        )
+    ''')
+    if 'target_id' not in [info[1] for info in conn.execute("PRAGMA table_info(correction_jobs)")]:
+        # Older jobs get their ceiling frozen when they next run
+        conn.execute("ALTER TABLE correction_jobs ADD COLUMN target_id INTEGER")
+    conn.commit()
+
+def declare_job(conn, name, kind, unit_id, start, end):
+    """Registers a job once; declaring an existing name again leaves it (and its progress) unchanged."""
+    prepare, _ = CORRECTIONS[kind]
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM correction_jobs WHERE name = ?", (name,))
+    if cursor.fetchone():
+        return False
+    params = prepare(cursor, unit_id, start, end) if prepare else {}
+    # Readings the collector inserts while the job runs have larger ids and stay untouched
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM readings")
+    target_id = cursor.fetchone()[0]
+    cursor.execute("""
+        INSERT INTO correction_jobs (name, kind, unit_id, start_ts, end_ts, params, target_id, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (name, kind, unit_id, start, end, json.dumps(params), target_id,
+          datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    conn.commit()
+    return True
+
+def run_job(db_name, name, batch_size=CORRECTION_BATCH_SIZE, pause=CORRECTION_PAUSE):
+    """Applies a declared job in bounded batches, then refreshes its rollups. Returns rows changed by this run."""
+    conn = sqlite3.connect(db_name, timeout=CORRECTION_LOCK_TIMEOUT)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT kind, unit_id, start_ts, end_ts, params, last_id, target_id, rows_changed, status
+            FROM correction_jobs WHERE name = ?
+        """, (name,))
+        row = cursor.fetchone()
+        if row is None:
+            raise ValueError(f"Unknown correction job: {name}")
+        kind, unit_id, start, end, params, last_id, target_id, total, status = row
+        if status == 'done':
+            print(f"[{datetime.now()}] CORRECTION {name}: already applied, nothing to do")
+            return 0
+        if target_id is None:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM readings")
+            target_id = cursor.fetchone()[0]
+            cursor.execute("UPDATE correction_jobs SET target_id = ? WHERE name = ?", (target_id, name))
+            conn.commit()
+
+        set_sql, where_sql, set_args = CORRECTIONS[kind][1](json.loads(params))
+        changed = 0
+        started = time.time()
+        while True:
+            cursor.execute("BEGIN IMMEDIATE")
+            # Keyset batch: ids only grow, so the bookmark splits done rows from pending ones
+            cursor.execute("""
+                SELECT MAX(id) FROM (
+                    SELECT id FROM readings
+                    WHERE id > ? AND id <= ? AND unit_id = ? AND timestamp >= ? AND timestamp < ?
+                    ORDER BY id LIMIT ?
+                )
+            """, (last_id, target_id, unit_id, start, end, batch_size))
+            upper = cursor.fetchone()[0]
+            if upper is None:
+                conn.commit()
+                break
+            cursor.execute(f"""
+                UPDATE readings SET {set_sql}
+                WHERE id > ? AND id <= ? AND id <= ? AND unit_id = ? AND timestamp >= ? AND timestamp < ?
+                AND {where_sql}
+            """, set_args + (last_id, upper, target_id, unit_id, start, end))
+            changed += cursor.rowcount
+            last_id = upper
+            cursor.execute("""
+                UPDATE correction_jobs SET last_id = ?, rows_changed = ?, status = 'running' WHERE name = ?
+            """, (last_id, total + changed, name))
+            conn.commit()
+            time.sleep(pause)
+
+        print(f"[{datetime.now()}] CORRECTION {name}: {changed} rows changed in {time.time() - started:.1f}s")
+        # Keyed on the job total: a run that resumes after the last batch still refreshes,
+        # and the job is only marked done once its rollups match the corrected rows
+        if total + changed:
+            refresh_rollups(conn, unit_id, start, end)
+            invalidate_copies(conn, db_name, unit_id, start, end)
+        cursor.execute("""
+            UPDATE correction_jobs SET status = 'done', finished_at = ? WHERE name = ?
+        """, (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), name))
+        conn.commit()
+        if total + changed:
+            mark_history_changed(db_name)
+        return changed
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def _corrected_days(cursor, unit_id, start, end):
+    cursor.execute("""
+        SELECT MIN(timestamp), MAX(timestamp) FROM readings
+        WHERE unit_id = ? AND timestamp >= ? AND timestamp < ?
+    """, (unit_id, start, end))
+    first, last = cursor.fetchone()
+    if first is None:
+        return
+    day = datetime.strptime(first[:10], '%Y-%m-%d')
+    while day.strftime('%Y-%m-%d') <= last[:10]:
+        yield day.strftime('%Y-%m-%d')
+        day += timedelta(days=1)
+
+def invalidate_copies(conn, db_name, unit_id, start, end):
+    """Drops the columnar files and archive entries of the corrected days; maintenance rebuilds them from raw."""
+    directory = os.path.join(os.path.dirname(os.path.abspath(db_name)), COLUMNAR_DIR)
+    cursor = conn.cursor()
+    for day in list(_corrected_days(cursor, unit_id, start, end)):
+        remove_day(unit_id, day, directory)
+        forget_day(cursor, unit_id, day)
+    conn.commit()
+
+def refresh_rollups(conn, unit_id, start, end):
+    """Rebuilds rollups for the corrected range one day at a time."""
+    if COMPRESSION_MODE != 'off':
+        # Rollups hold samples the deadband kept out of readings; rebuilding from raw would drop them
+        print(f"[{datetime.now()}] CORRECTION: rollups for {unit_id} {start}..{end} not rebuilt (compression is on)")
+        return
+    for day in list(_corrected_days(conn.cursor(), unit_id, start, end)):
+        rebuild_rollups(conn, unit_id, day, day)
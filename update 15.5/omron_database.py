@@ -1,17 +1,61 @@
 import sqlite3
 import time
 import os
-from datetime import datetime
+import threading
+import itertools
+from contextlib import closing
+from datetime import datetime, timedelta
 from omron_modbus import OmronModbusClient, OmronReadError
+from omron_rollup import (
+    setup_rollups, update_rollups, catch_up_rollups,
+    promote_expiring_days, cleanup_rollups, get_rollup_history, get_rollup_buckets
+)
+from omron_deadband import DeadbandFilter, COMPRESSION_MODE, expand_steps, expand_step_points, StepFill
+from omron_archive import setup_archive, archive_closed_days, get_archived_readings
+from omron_columnar import (
+    write_closed_days, prune_days, remove_day, COLUMNAR_DIR, open_day, read_columns, take, expand_column_steps
+)
+from omron_spool import Spool, run_replayer, setup_spool, batch_replayed, mark_replayed
+from omron_gaps import setup_gaps, GapTracker, prune_outages, shrink_replayed
+from omron_checkpoint import CheckpointManager, connect_writer, mark_history_changed
+from omron_backup import scheduled_backup
+from omron_downsample import lttb, epoch, LTTB_FIELD, LTTB_FIELDS, LTTB_DEFAULT_POINTS
+from omron_readpool import read_connection
+from omron_latest import LatestWriter
 
 DB_NAME = 'omron.db'
 TARGET_INTERVAL = 1.0  # Target speed: 1 second per cycle
+DB_WRITE_BUDGET = 0.2  # Seconds an INSERT may wait on a locked database before the sample is spooled
 CLEANUP_THRESHOLD = 3600 # Run cleanup roughly every hour (3600 seconds)
+READINGS_COLUMNS = ('id', 'timestamp', 'val_voltage', 'val_current', 'val_power_kw', 'val_energy_kwh', 'unit_id')
 
-def setup_database():
+# --- Tiered retention ---
+# Days each resolution is kept (None = forever). The 1m/1h/1d rollups are
+# maintained at ingest, so ageing data out of a tier only deletes rows.
+RETENTION_TIERS = {
+    'raw': 30,
+    '1m': 180,
+    '1h': None,
+    '1d': None,
+}
+ROLLUP_SECONDS = {'1m': 60, '1h': 3600, '1d': 86400}
+ROLLUP_MAX_POINTS = 5000  # A rollup tier is skipped for ranges that would return more buckets than this
+
+# --- Retention tuning ---
+# Expired rows are removed in small batches so the collector never waits on the write lock
+CLEANUP_BATCH_SIZE = 500       # Starting rows per DELETE transaction
+CLEANUP_BATCH_MIN = 50
+CLEANUP_BATCH_MAX = 5000
+CLEANUP_BATCH_BUDGET = 0.05    # Seconds one batch may hold the write lock
+CLEANUP_PAUSE = 0.2            # Sleep between batches (lets the 1s inserts through)
+VACUUM_STEP_PAGES = 64         # Pages handed back to the filesystem per incremental_vacuum step
+
+def setup_database(db_name=DB_NAME):
     """Initializes the database with WAL mode for microservice compatibility."""
-    conn = sqlite3.connect(DB_NAME)
+    conn = sqlite3.connect(db_name)
     cursor = conn.cursor()
+    # auto_vacuum only takes effect if set before the first table is created
+    cursor.execute('PRAGMA auto_vacuum=INCREMENTAL;')
     cursor.execute('PRAGMA journal_mode=WAL;')
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS readings (
@@ -26,70 +70,470 @@ def setup_database():
     ''')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_unit_timestamp ON readings (unit_id, timestamp)')
     conn.commit()
+    setup_rollups(conn)
+    setup_archive(conn)
+    setup_gaps(conn)
+    setup_spool(conn)
+
+    cursor.execute('PRAGMA auto_vacuum')
+    if cursor.fetchone()[0] != 2:
+        print(f"[{datetime.now()}] NOTE: {db_name} was created without incremental vacuum. "
+              f"Run convert_to_incremental_vacuum() once with the collector stopped.")
     conn.close()
 
-def cleanup_old_data(days=30):
-    """Deletes records older than 30 days to preserve space."""
+def convert_to_incremental_vacuum():
+    """One-off conversion of an existing database to auto_vacuum=INCREMENTAL (full VACUUM, stop the collector first)."""
+    conn = sqlite3.connect(DB_NAME)
+    conn.execute('PRAGMA auto_vacuum=INCREMENTAL;')
+    conn.execute('VACUUM;')
+    mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    conn.close()
+    print(f"[{datetime.now()}] auto_vacuum mode is now {mode} (2 = INCREMENTAL)")
+
+def _next_unit(cursor, after):
+    """Walks the distinct unit_ids with index seeks instead of a full DISTINCT scan."""
+    cursor.execute("SELECT MIN(unit_id) FROM readings WHERE unit_id > ?", (after,))
+    return cursor.fetchone()[0]
+
+def _incremental_vacuum(conn):
+    """Returns free pages to the filesystem a few at a time. Returns the number of pages reclaimed."""
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA auto_vacuum')
+    if cursor.fetchone()[0] != 2:
+        return 0
+
+    reclaimed = 0
+    while True:
+        cursor.execute('PRAGMA freelist_count')
+        before = cursor.fetchone()[0]
+        if before == 0:
+            break
+        # cursor.execute() steps this pragma once and frees a single page; executescript runs it to completion
+        conn.executescript(f'PRAGMA incremental_vacuum({VACUUM_STEP_PAGES});')
+        cursor.execute('PRAGMA freelist_count')
+        after = cursor.fetchone()[0]
+        if after >= before:
+            break
+        reclaimed += before - after
+        time.sleep(CLEANUP_PAUSE)
+    return reclaimed
+
+def cleanup_old_data(days=30, db_name=DB_NAME, pause=CLEANUP_PAUSE, now=None):
+    """Deletes records older than `days` (before `now`) in small, time-boxed batches, then frees pages incrementally."""
+    cutoff = ((now or datetime.now()) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    stats = {'rows_deleted': 0, 'batches': 0, 'pages_reclaimed': 0, 'outages_deleted': 0,
+             'day_files_removed': 0, 'seconds': 0.0}
+    started = time.time()
+    batch_size = CLEANUP_BATCH_SIZE
+
+    conn = None
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = connect_writer(db_name, timeout=CLEANUP_BATCH_BUDGET * 10)
         cursor = conn.cursor()
-        cursor.execute("DELETE FROM readings WHERE timestamp < datetime('now', ?, 'localtime')", (f"-{days} day",))
-        deleted_count = cursor.rowcount
+
+        unit_id = _next_unit(cursor, '')
+        while unit_id is not None:
+            while True:
+                # Keyset batch: the oldest expired rows of this unit, bounded by idx_unit_timestamp
+                batch_start = time.time()
+                cursor.execute('''
+                    DELETE FROM readings WHERE id IN (
+                        SELECT id FROM readings
+                        WHERE unit_id = ? AND timestamp < ?
+                        ORDER BY timestamp LIMIT ?
+                    )
+                ''', (unit_id, cutoff, batch_size))
+                deleted = cursor.rowcount
+                conn.commit()
+                batch_time = time.time() - batch_start
+
+                stats['rows_deleted'] += deleted
+                stats['batches'] += 1
+                if deleted < batch_size:
+                    break
+
+                # Keep every batch inside its time budget
+                if batch_time > CLEANUP_BATCH_BUDGET:
+                    batch_size = max(CLEANUP_BATCH_MIN, batch_size // 2)
+                elif batch_time < CLEANUP_BATCH_BUDGET / 2:
+                    batch_size = min(CLEANUP_BATCH_MAX, batch_size * 2)
+                time.sleep(pause)
+
+            unit_id = _next_unit(cursor, unit_id)
+
+        # The outage index covers the same window as the raw data
+        stats['outages_deleted'] = prune_outages(conn, cutoff)
         conn.commit()
-        conn.close()
-        if deleted_count > 0:
-            print(f"[{datetime.now()}] --- CLEANUP: Deleted {deleted_count} old records ---")
-    except sqlite3.Error as e:
+        if stats['rows_deleted'] > 0:
+            stats['pages_reclaimed'] = _incremental_vacuum(conn)
+        if stats['rows_deleted'] > 0:
+            mark_history_changed(db_name)  # Past ranges near the cutoff now come from the rollups
+        # Columnar copies of the deleted days go with them
+        stats['day_files_removed'] = prune_days(cutoff, os.path.join(os.path.dirname(os.path.abspath(db_name)), COLUMNAR_DIR))
+    except (sqlite3.Error, OSError) as e:
         print(f"[{datetime.now()}] Database Cleanup Error: {e}")
+    finally:
+        # A failed background run must not leave its connection (and WAL read lock) behind
+        if conn is not None:
+            conn.close()
 
-def get_historical_readings(days=1, unit_id="unit01"):
-    """Fetches records for the last X days for the dashboard charts."""
+    stats['seconds'] = round(time.time() - started, 2)
+    if stats['rows_deleted'] > 0:
+        print(f"[{datetime.now()}] --- CLEANUP: Deleted {stats['rows_deleted']} old records "
+              f"in {stats['batches']} batches, reclaimed {stats['pages_reclaimed']} pages "
+              f"({stats['seconds']}s) ---")
+    return stats
+
+def write_day_files():
+    """Writes the columnar files of closed days (runs in the background at day rollover)."""
     try:
-        conn = sqlite3.connect(DB_NAME)
-        # Use Row factory so we can return dictionaries
-        conn.row_factory = sqlite3.Row
+        # The connection's own `with` only commits; closing() releases it (and its WAL read lock)
+        with closing(connect_writer(DB_NAME, timeout=CLEANUP_BATCH_BUDGET * 10)) as conn, conn:
+            write_closed_days(conn)
+    except (sqlite3.Error, OSError) as e:
+        print(f"[{datetime.now()}] Columnar Write Error: {e}")
+
+def run_maintenance(tiers=RETENTION_TIERS):
+    """Background job: writes day files, archives closed days, then ages data through the retention tiers."""
+    write_day_files()
+    try:
+        with closing(connect_writer(DB_NAME, timeout=CLEANUP_BATCH_BUDGET * 10)) as conn, conn:
+            archive_closed_days(conn)
+            # Raw rows are only deleted once their days are represented in the rollups
+            raw_cutoff = (datetime.now() - timedelta(days=tiers['raw'])).strftime('%Y-%m-%d %H:%M:%S')
+            promote_expiring_days(conn, raw_cutoff)
+    except sqlite3.Error as e:
+        print(f"[{datetime.now()}] Archive/Promotion Error: {e}")
+        return None
+
+    stats = cleanup_old_data(tiers['raw'])
+    try:
+        with closing(connect_writer(DB_NAME, timeout=CLEANUP_BATCH_BUDGET * 10)) as conn, conn:
+            for resolution in ROLLUP_SECONDS:
+                if tiers.get(resolution) is not None:
+                    deleted = cleanup_rollups(conn, resolution, tiers[resolution], pause=CLEANUP_PAUSE)
+                    if deleted:
+                        print(f"[{datetime.now()}] --- CLEANUP: Deleted {deleted} {resolution} rollup rows ---")
+    except sqlite3.Error as e:
+        print(f"[{datetime.now()}] Rollup Cleanup Error: {e}")
+    return stats
+
+def pick_resolution(unit_id, start_date, end_date, tiers=RETENTION_TIERS):
+    """Finest tier that still holds data for start_date: 'raw', 'archive' or a rollup resolution."""
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    span = (datetime.strptime(end_date, '%Y-%m-%d') - start).total_seconds() + 86400
+
+    with read_connection(DB_NAME) as conn:
         cursor = conn.cursor()
-        query = """
-            SELECT * FROM readings 
-            WHERE unit_id = ? 
-            AND timestamp >= datetime('now', ?, 'localtime') 
-            ORDER BY timestamp ASC
-        """
-        cursor.execute(query, (unit_id, f"-{days} day"))
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
+        cursor.execute("SELECT MIN(timestamp) FROM readings WHERE unit_id = ?", (unit_id,))
+        oldest_raw = cursor.fetchone()[0]
+        cursor.execute("SELECT MIN(day) FROM archive_days WHERE unit_id = ?", (unit_id,))
+        oldest_archive = cursor.fetchone()[0]
+
+    if oldest_raw and oldest_raw[:10] <= start_date:
+        return 'raw'
+    if oldest_archive and oldest_archive <= start_date:
+        return 'archive'
+    for resolution, seconds in ROLLUP_SECONDS.items():
+        days = tiers.get(resolution)
+        if days is not None and start < datetime.now() - timedelta(days=days):
+            continue
+        if span / seconds <= ROLLUP_MAX_POINTS:
+            return resolution
+    return '1d'
+
+def get_rollup_readings_by_range(start_date, end_date, unit_id="unit01", resolution='1h'):
+    """Fetches a rollup tier for specific dates, shaped like readings rows (averages plus _min/_max)."""
+    try:
+        end_next = (datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        with read_connection(DB_NAME) as conn:
+            return get_rollup_history(conn, resolution, unit_id, start_date, end_next)
     except Exception as e:
-        print(f"History Fetch Error: {e}")
+        print(f"Rollup Fetch Error: {e}")
         return []
 
-def get_historical_readings_by_range(start_date, end_date, unit_id="unit01", skip=1):
-    """Fetches records for specific dates with downsampling for the comparison view."""
+def get_historical_readings(days=1, unit_id="unit01"):
+    """Fetches records for the last X days for the dashboard charts."""
+    return get_historical_readings_multi(days, [unit_id])[unit_id]
+
+def get_historical_readings_multi(days=1, units=("unit01", "unit02")):
+    """Last X days of several units in one pass over idx_unit_timestamp: {unit_id: [rows]}."""
+    history = {unit_id: [] for unit_id in units}
     try:
-        conn = sqlite3.connect(DB_NAME)
-        conn.row_factory = sqlite3.Row
+        # Bounds are computed here in the collector's own text format, so the index range is exact
+        start = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+        end = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+        with read_connection(DB_NAME) as conn:
+            cursor = conn.cursor()
+            # Use Row factory so we can return dictionaries (on the cursor: the connection is shared)
+            cursor.row_factory = sqlite3.Row
+            # ORDER BY matches the index, so the IN list is read unit by unit without a sort
+            query = f"""
+                SELECT * FROM readings 
+                WHERE unit_id IN ({', '.join(['?'] * len(units))})
+                AND timestamp >= ? AND timestamp < ?
+                ORDER BY unit_id, timestamp ASC
+            """
+            cursor.execute(query, (*units, start, end))
+            for row in cursor:
+                history[row['unit_id']].append(dict(row))
+        # Deadband-compressed rows are turned back into a 1-second step series
+        if COMPRESSION_MODE != 'off':
+            history = {unit_id: expand_steps(rows) for unit_id, rows in history.items()}
+        return history
+    except Exception as e:
+        print(f"History Fetch Error: {e}")
+        return {unit_id: [] for unit_id in units}
+
+def get_latest_readings(units):
+    """Newest stored row of each unit from one statement: {unit_id: row or None}."""
+    latest = {unit_id: None for unit_id in units}
+    with read_connection(DB_NAME) as conn:
         cursor = conn.cursor()
-        query = """
-            SELECT * FROM readings 
-            WHERE unit_id = ? 
-            AND date(timestamp) BETWEEN ? AND ? 
-            AND (id % ? = 0)
-            ORDER BY timestamp ASC
-        """
-        cursor.execute(query, (unit_id, start_date, end_date, skip))
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(f"""
+            WITH u(unit_id) AS (VALUES {', '.join(['(?)'] * len(units))})
+            SELECT r.* FROM u
+            JOIN readings r ON r.id = (SELECT id FROM readings WHERE unit_id = u.unit_id ORDER BY timestamp DESC LIMIT 1)
+        """, units)
+        for row in cursor:
+            latest[row['unit_id']] = dict(row)
+    return latest
+
+def _picked_reading(r):
+    """Readings dict of an LTTB payload: an archive dict, a readings row, or a repeated (StepFill) row."""
+    if isinstance(r, StepFill):
+        row = dict(_picked_reading(r.payload))
+        row['timestamp'] = (datetime(1970, 1, 1) + timedelta(seconds=r.x)).strftime('%Y-%m-%d %H:%M:%S')
+        return row
+    return r if isinstance(r, dict) else dict(zip(READINGS_COLUMNS, r[2:]))
+
+def get_historical_readings_by_range(start_date, end_date, unit_id="unit01", points=None, field=LTTB_FIELD):
+    """Fetches records for specific dates, LTTB-downsampled to `points` rows for the charts.
+
+    Rows are streamed from the cursor, so memory stays bounded by the output size.
+    Dates older than the raw retention window fall through to the swinging-door archive.
+    """
+    try:
+        end_next = (datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        with read_connection(DB_NAME) as conn:
+            cursor = conn.cursor()
+
+            # Anything before the oldest raw row is served from the archive tier
+            cursor.execute("SELECT MIN(timestamp) FROM readings WHERE unit_id = ?", (unit_id,))
+            oldest_raw = cursor.fetchone()[0]
+            archived = []
+            if oldest_raw is None or start_date < oldest_raw:
+                archived = get_archived_readings(conn, unit_id, start_date, min(oldest_raw or end_next, end_next))
+
+            cursor.execute(f"""
+                SELECT CAST(strftime('%s', timestamp) AS INTEGER), {field}, {', '.join(READINGS_COLUMNS)}
+                FROM readings
+                WHERE unit_id = ? AND timestamp >= ? AND timestamp < ?
+                ORDER BY timestamp ASC
+            """, (unit_id, start_date, end_next))
+
+            if points:
+                raw = ((row[0], row[1], row) for row in cursor)
+                if COMPRESSION_MODE != 'off':
+                    # LTTB picks from the rebuilt step series, not from the sparse stored rows
+                    raw = expand_step_points(raw)
+                series = itertools.chain(((epoch(r['timestamp']), r[field], r) for r in archived), raw)
+                picked = lttb(series, points, epoch(start_date), epoch(end_next))
+                return [_picked_reading(r) for r in picked]
+
+            history = [dict(zip(READINGS_COLUMNS, row[2:])) for row in cursor]
+        if COMPRESSION_MODE != 'off':
+            history = expand_steps(history)
+        return archived + history
     except Exception as e:
         print(f"Range Fetch Error: {e}")
         return []
 
+def get_historical_columns(start_date, end_date, unit_id="unit01", points=None, field=LTTB_FIELD):
+    """Raw range as columns {'t': epoch seconds, field: values}, LTTB-thinned to `points`.
+
+    Closed days are slices of the memory-mapped columnar files, today comes from SQLite;
+    no per-row dicts are built. Returns None when the start is only in the archive tier.
+    """
+    try:
+        end_next = (datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        with read_connection(DB_NAME) as conn:
+            oldest_raw = conn.execute("SELECT MIN(timestamp) FROM readings WHERE unit_id = ?", (unit_id,)).fetchone()[0]
+            if oldest_raw is None or (start_date < oldest_raw and open_day(unit_id, start_date) is None):
+                return None
+            columns = read_columns(conn, unit_id, start_date, end_next)
+
+        # Same as the row path: the deadband's step series is rebuilt before LTTB picks from it
+        if COMPRESSION_MODE != 'off':
+            columns = expand_column_steps(columns)
+        if points and len(columns['t']) > points:
+            # Columnar timestamps are true epoch seconds, so the LTTB frame is too
+            start_x = datetime.strptime(start_date, '%Y-%m-%d').timestamp()
+            end_x = datetime.strptime(end_next, '%Y-%m-%d').timestamp()
+            series = zip(columns['t'].tolist(), columns[field].tolist(), itertools.count())
+            columns = take(columns, list(lttb(series, points, start_x, end_x)))
+        return columns
+    except Exception as e:
+        print(f"Column Fetch Error: {e}")
+        return None
+
+def pick_bucket_source(units, start_date, width, tiers=RETENTION_TIERS):
+    """Coarsest rollup tier no wider than `width` seconds that still covers start_date, else 'raw'."""
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    for resolution, seconds in reversed(ROLLUP_SECONDS.items()):
+        days = tiers.get(resolution)
+        if seconds <= width and (days is None or start >= datetime.now() - timedelta(days=days)):
+            return resolution
+
+    # Narrower than a minute: raw rows if they reach back that far for every unit, else the 1m tier
+    with read_connection(DB_NAME) as conn:
+        for unit_id in units:
+            oldest_raw = conn.execute("SELECT MIN(timestamp) FROM readings WHERE unit_id = ?", (unit_id,)).fetchone()[0]
+            if not oldest_raw or oldest_raw[:10] > start_date:
+                return '1m'
+    return 'raw'
+
+def get_bucketed_readings_by_range(start_date, end_date, unit_id="unit01", points=LTTB_DEFAULT_POINTS):
+    """Splits the range into at most `points` buckets with min/max/mean/first/last per field."""
+    return get_bucketed_readings_multi(start_date, end_date, [unit_id], points)[unit_id]
+
+def get_bucketed_readings_multi(start_date, end_date, units=("unit01", "unit02"), points=LTTB_DEFAULT_POINTS):
+    """Buckets of several units from one statement: {unit_id: rows}, with identical bucket timestamps.
+
+    Rows are readings-shaped: <field> is the bucket mean, <field>_min/_max/_first/_last the rest,
+    `n` the sample count. Everything is grouped in SQL; raw rows never reach Python.
+    """
+    try:
+        end_next = (datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        origin = int(epoch(start_date))
+        width = max(1, -(-(int(epoch(end_next)) - origin) // max(points, 1)))
+        resolution = pick_bucket_source(units, start_date, width)
+
+        with read_connection(DB_NAME) as conn:
+            if resolution != 'raw':
+                # Whole rollup rows per bucket keep min/max exact
+                seconds = ROLLUP_SECONDS[resolution]
+                width = -(-width // seconds) * seconds
+                return get_rollup_buckets(conn, resolution, units, start_date, end_next, origin, width)
+
+            stats = ', '.join(f"MIN({f}) AS {f}_min, MAX({f}) AS {f}_max, AVG({f}) AS {f}_avg" for f in LTTB_FIELDS)
+            params = {'origin': origin, 'width': width, 'start': start_date, 'end': end_next}
+            params.update({f"u{i}": unit_id for i, unit_id in enumerate(units)})
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                WITH g AS (
+                    SELECT unit_id, (CAST(strftime('%s', timestamp) AS INTEGER) - :origin) / :width AS b,
+                           COUNT(*) AS n, MIN(timestamp) AS first_ts, MAX(timestamp) AS last_ts, {stats}
+                    FROM readings
+                    WHERE unit_id IN ({', '.join(f":u{i}" for i in range(len(units)))})
+                    AND timestamp >= :start AND timestamp < :end
+                    GROUP BY unit_id, b
+                )
+                SELECT g.unit_id, datetime(:origin + g.b * :width, 'unixepoch'), g.n,
+                       {', '.join(f"g.{f}_avg, g.{f}_min, g.{f}_max, f.{f}, l.{f}" for f in LTTB_FIELDS)}
+                FROM g
+                JOIN readings f ON f.id = (SELECT id FROM readings WHERE unit_id = g.unit_id AND timestamp = g.first_ts ORDER BY id LIMIT 1)
+                JOIN readings l ON l.id = (SELECT id FROM readings WHERE unit_id = g.unit_id AND timestamp = g.last_ts ORDER BY id DESC LIMIT 1)
+            """, params)
+
+            history = {unit_id: [] for unit_id in units}
+            for row in cursor:
+                item = {'id': None, 'timestamp': row[1], 'unit_id': row[0], 'resolution': 'raw', 'n': row[2]}
+                for i, f in enumerate(LTTB_FIELDS):
+                    mean, vmin, vmax, first, last = row[3 + i * 5:8 + i * 5]
+                    item.update({f: round(mean, 4), f"{f}_min": vmin, f"{f}_max": vmax, f"{f}_first": first, f"{f}_last": last})
+                history[row[0]].append(item)
+        # Sorting the few output buckets here saves SQLite a temp B-tree over the grouped rows
+        for rows in history.values():
+            rows.sort(key=lambda item: item['timestamp'])
+        return history
+    except Exception as e:
+        print(f"Bucket Fetch Error: {e}")
+        return {unit_id: [] for unit_id in units}
+
+def align_buckets(history):
+    """Lines bucketed units up on shared timestamps: {'timestamp': [...], unit_id: [row or None, ...]}."""
+    stamps = sorted({row['timestamp'] for rows in history.values() for row in rows})
+    aligned = {'timestamp': stamps}
+    for unit_id, rows in history.items():
+        by_ts = {row['timestamp']: row for row in rows}
+        aligned[unit_id] = [by_ts.get(ts) for ts in stamps]
+    return aligned
+
+def store_reading(cursor, unit_label, reading, keep_raw=True):
+    """Inserts one sample and folds it into the rollup buckets (caller commits).
+
+    With keep_raw=False (sample suppressed by the deadband) only the rollups are
+    updated, so averages and counts still see every sample.
+    """
+    update_rollups(cursor, unit_label, reading)
+    if not keep_raw:
+        return
+    cursor.execute('''
+        INSERT INTO readings (
+            timestamp, val_voltage, val_current, 
+            val_power_kw, val_energy_kwh, unit_id
+        ) VALUES (?, ?, ?, ?, ?, ?)
+    ''', (reading['timestamp'], reading['val_voltage'], reading['val_current'], 
+          reading['val_power_kw'], reading['val_energy_kwh'], unit_label))
+
+def replay_spooled(batch, records, quarantine):
+    """Writes one spooled batch back in its original order, exactly once.
+
+    The batch marker commits in the same transaction as its rows, so a batch that is
+    handed over again after a crash is skipped. A record the database rejects goes to
+    quarantine() and the rest of the batch still lands.
+    """
+    conn = connect_writer(DB_NAME, timeout=5)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        if not batch_replayed(cursor, batch):
+            rejected = 0
+            for unit_label, reading, keep_raw in records:
+                cursor.execute("SAVEPOINT record")
+                try:
+                    store_reading(cursor, unit_label, reading, keep_raw=keep_raw)
+                except (sqlite3.IntegrityError, sqlite3.InterfaceError, ValueError) as e:
+                    # Only this record is undone; a locked or failing database still raises
+                    cursor.execute("ROLLBACK TO record")
+                    quarantine(unit_label, reading, keep_raw, e)
+                    rejected += 1
+                cursor.execute("RELEASE record")
+            for unit_label in {r[0] for r in records}:
+                shrink_replayed(cursor, unit_label, max(r[1]['timestamp'] for r in records if r[0] == unit_label))
+            mark_replayed(cursor, batch, len(records), rejected)
+        conn.commit()
+    finally:
+        conn.close()
+    mark_history_changed(DB_NAME)
+
+    # Columnar files of closed days that received late samples are rewritten at the next maintenance run
+    today = datetime.now().strftime('%Y-%m-%d')
+    for unit_label, day in {(r[0], r[1]['timestamp'][:10]) for r in records}:
+        if day < today:
+            remove_day(unit_label, day)
+
 def run_collector():
     """The main loop for the omron-data.service"""
     setup_database()
+    conn = connect_writer(DB_NAME)
+    catch_up_rollups(conn)
+    conn.close()
+    checkpoints = CheckpointManager(DB_NAME)
+    threading.Thread(target=checkpoints.run, daemon=True).start()
     client = OmronModbusClient()
+    deadband = DeadbandFilter()
+    spool = Spool()
+    threading.Thread(target=run_replayer, args=(spool, replay_spooled), daemon=True).start()
     units = [1, 2] 
+    latest = LatestWriter()
+    gaps = GapTracker(DB_NAME, timeout=DB_WRITE_BUDGET)
+    gaps.reconcile([f"unit0{slave_id}" for slave_id in units])
     cleanup_timer = 0
+    cleanup_thread = None
+    current_day = datetime.now().strftime('%Y-%m-%d')
     
     print(f"[{datetime.now()}] Data Collection Service Started (1s Target Interval)")
     
@@ -101,37 +545,64 @@ def run_collector():
             try:
                 data = client.read_data(slave_id)
                 
-                conn = sqlite3.connect(DB_NAME)
-                cursor = conn.cursor()
                 fixed_kw = abs(data['val_power_kw'])
-                
-                cursor.execute('''
-                    INSERT INTO readings (
-                        timestamp, val_voltage, val_current, 
-                        val_power_kw, val_energy_kwh, unit_id
-                    ) VALUES (?, ?, ?, ?, ?, ?)
-                ''', (data['timestamp'], data['val_voltage'], data['val_current'], 
-                      fixed_kw, data['val_energy_kwh'], unit_label))
-                
-                conn.commit()
-                conn.close()
+                data['val_power_kw'] = fixed_kw
+                keep_raw = deadband.should_store(unit_label, data)
+                row_id = None
+
+                if spool.pending():
+                    # A backlog exists: keep appending so samples reach the database in order
+                    spool.append(unit_label, data, keep_raw)
+                else:
+                    try:
+                        conn = connect_writer(DB_NAME, timeout=DB_WRITE_BUDGET)
+                        try:
+                            cursor = conn.cursor()
+                            store_reading(cursor, unit_label, data, keep_raw=keep_raw)
+                            conn.commit()
+                            row_id = cursor.lastrowid if keep_raw else None
+                        finally:
+                            conn.close()
+                    except sqlite3.OperationalError as e:
+                        spool.append(unit_label, data, keep_raw)
+                        print(f"[{datetime.now()}] SPOOLED {unit_label}: database busy ({e})")
+
+                gaps.record_success(unit_label, data['timestamp'])
+                # Live cards read this instead of the database
+                latest.publish(unit_label, data, row_id)
 
                 print(f"[{data['timestamp']}] {unit_label.upper()} | "
                       f"{data['val_voltage']}V | {data['val_current']}A | "
                       f"{fixed_kw}kW | {data['val_energy_kwh']}kWh")
 
             except OmronReadError as e:
+                deadband.reset(unit_label)
+                gaps.record_failure(unit_label, e)
                 print(f"[{datetime.now()}] ERROR: {e}")
             except Exception as e:
                 print(f"[{datetime.now()}] SYSTEM CRITICAL: {e}")
 
         # --- AUTO-DELETE LOGIC ---
-        # Checks every hour to see if old data needs purging
+        # Checks every hour to see if old data needs purging.
+        # Runs in the background so sampling keeps its 1-second pace.
         cleanup_timer += (time.time() - start_time)
         if cleanup_timer >= CLEANUP_THRESHOLD:
-            cleanup_old_data(30)
+            if cleanup_thread is None or not cleanup_thread.is_alive():
+                cleanup_thread = threading.Thread(target=run_maintenance, daemon=True)
+                cleanup_thread.start()
+            if deadband.mode != 'off':
+                print(f"[{datetime.now()}] --- DEADBAND: {deadband.stats()} ---")
+            print(f"[{datetime.now()}] --- CHECKPOINT: {checkpoints.metrics()} ---")
             cleanup_timer = 0
 
+        # --- DAY ROLLOVER ---
+        # Yesterday is closed: write its columnar files and take the daily snapshot, off the sampling path
+        today = datetime.now().strftime('%Y-%m-%d')
+        if today != current_day:
+            threading.Thread(target=write_day_files, daemon=True).start()
+            threading.Thread(target=scheduled_backup, args=(DB_NAME,), daemon=True).start()
+            current_day = today
+
         # --- SMART TIMING ---
         # Calculates exactly how long to sleep to maintain a 1-second pace
         elapsed = time.time() - start_time
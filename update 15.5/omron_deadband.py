@@ -0,0 +1,102 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+# --- Configuration ---
+# 'off'      : store every sample (original behaviour)
+# 'exact'    : store a sample only when some value differs from the last stored one (lossless)
+# 'deadband' : store a sample only when some value moves more than its tolerance below
+COMPRESSION_MODE = 'off'
+DEADBAND = {
+    'val_voltage': 0.5,       # V
+    'val_current': 0.01,      # A
+    'val_power_kw': 0.005,    # kW
+    'val_energy_kwh': 0.0,    # kWh (any change is stored)
+}
+HEARTBEAT_INTERVAL = 60  # Always store at least one sample per unit every 60 seconds
+SAMPLE_INTERVAL = 1      # Spacing used when rebuilding the step series on read
+
+TS_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+StepFill = namedtuple('StepFill', 'payload x')  # A stored row repeated at epoch second x
+
+class DeadbandFilter:
+    """Decides per unit whether a sample must be written to the readings table."""
+
+    def __init__(self, mode=COMPRESSION_MODE, tolerances=DEADBAND, heartbeat=HEARTBEAT_INTERVAL):
+        self.mode = mode
+        self.tolerances = tolerances
+        self.heartbeat = heartbeat
+        self.last = {}  # unit_id -> (datetime, reading) of the last stored sample
+        self.seen = 0
+        self.stored = 0
+
+    def should_store(self, unit_id, reading):
+        """Returns True if the sample must be stored and remembers it as the new reference."""
+        self.seen += 1
+        now = datetime.strptime(reading['timestamp'], TS_FORMAT)
+        previous = self.last.get(unit_id)
+
+        if self.mode == 'off' or previous is None or self._changed(previous, now, reading):
+            self.last[unit_id] = (now, reading)
+            self.stored += 1
+            return True
+        return False
+
+    def reset(self, unit_id):
+        """Forgets the reference so the first sample after a read error is always stored."""
+        self.last.pop(unit_id, None)
+
+    def _changed(self, previous, now, reading):
+        last_time, last_reading = previous
+        if (now - last_time).total_seconds() >= self.heartbeat:
+            return True
+        for field, tolerance in self.tolerances.items():
+            delta = abs(reading[field] - last_reading[field])
+            if self.mode == 'exact' and delta > 0:
+                return True
+            if self.mode == 'deadband' and delta > tolerance:
+                return True
+        return False
+
+    def stats(self):
+        """Samples seen vs. rows written since the collector started."""
+        ratio = self.stored / self.seen if self.seen else 1.0
+        return {'mode': self.mode, 'seen': self.seen, 'stored': self.stored, 'write_ratio': round(ratio, 3)}
+
+def expand_steps(rows, interval=SAMPLE_INTERVAL, heartbeat=HEARTBEAT_INTERVAL):
+    """Rebuilds the 1-sample-per-interval series from deadband-compressed rows (step function).
+
+    Each stored row is repeated until the next stored row. Gaps longer than the
+    heartbeat are real outages and are not filled.
+    """
+    expanded = []
+    for i, row in enumerate(rows):
+        expanded.append(row)
+        if i + 1 >= len(rows):
+            break
+        t = datetime.strptime(row['timestamp'], TS_FORMAT)
+        t_next = datetime.strptime(rows[i + 1]['timestamp'], TS_FORMAT)
+        if (t_next - t).total_seconds() > heartbeat + interval:
+            continue
+        t += timedelta(seconds=interval)
+        while t < t_next:
+            filled = dict(row)
+            filled['timestamp'] = t.strftime(TS_FORMAT)
+            expanded.append(filled)
+            t += timedelta(seconds=interval)
+    return expanded
+
+def expand_step_points(points, interval=SAMPLE_INTERVAL, heartbeat=HEARTBEAT_INTERVAL):
+    """Streaming expand_steps over (x, y, payload) points (x in epoch seconds), e.g. ahead of LTTB.
+
+    Repeated points carry a StepFill(payload, x) payload; gaps longer than the heartbeat stay gaps.
+    """
+    prev = None
+    for point in points:
+        if prev is not None and point[0] - prev[0] <= heartbeat + interval:
+            x = prev[0] + interval
+            while x < point[0]:
+                yield (x, prev[1], StepFill(prev[2], x))
+                x += interval
+        yield point
+        prev = point
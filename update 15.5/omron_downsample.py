@@ -0,0 +1,75 @@
+from datetime import datetime
+
+# --- Configuration ---
+LTTB_DEFAULT_POINTS = 1000   # Used when the client does not send its chart width
+LTTB_MAX_POINTS = 5000
+LTTB_FIELD = 'val_current'   # Series whose shape decides which rows are kept
+LTTB_FIELDS = ('val_voltage', 'val_current', 'val_power_kw', 'val_energy_kwh')
+LTTB_RAW_MAX_DAYS = 3        # Longer ranges are downsampled from the 1m rollups so the scan stays bounded
+
+TS_FORMAT = '%Y-%m-%d %H:%M:%S'
+_EPOCH = datetime(1970, 1, 1)
+
+def _pick(a, bucket, next_x, next_y):
+    """Point of `bucket` forming the largest triangle with the previous pick and the next bucket's average."""
+    ax, ay = a[0], a[1]
+    best, best_area = bucket[0], -1.0
+    for point in bucket:
+        area = abs((ax - next_x) * (point[1] - ay) - (ax - point[0]) * (next_y - ay))
+        if area > best_area:
+            best, best_area = point, area
+    return best
+
+def _average(bucket):
+    n = len(bucket)
+    return sum(p[0] for p in bucket) / n, sum(p[1] for p in bucket) / n
+
+def lttb(points, threshold, start_x, end_x):
+    """Largest-Triangle-Three-Buckets over an iterable of (x, y, payload), in one pass.
+
+    Buckets are fixed slices of [start_x, end_x), so only the bucket being decided
+    and the one after it are held in memory, and at most `threshold` payloads are
+    yielded however many points come in. First and last points are always kept.
+    """
+    it = iter(points)
+    first = next(it, None)
+    if first is None:
+        return
+    yield first[2]
+    if threshold < 3:
+        threshold = 3
+    width = max((end_x - start_x) / (threshold - 2), 1e-9)
+
+    a = first
+    last = None
+    pending = []  # [[bucket index, points], ...], at most three
+    for point in it:
+        if last is not None:
+            idx = int((last[0] - start_x) // width)
+            if pending and pending[-1][0] == idx:
+                pending[-1][1].append(last)
+            else:
+                pending.append([idx, [last]])
+                if len(pending) == 3:
+                    # A third bucket has started, so the second is complete: decide the first
+                    a = _pick(a, pending[0][1], *_average(pending[1][1]))
+                    yield a[2]
+                    pending.pop(0)
+        last = point  # Held back one step so the final point is never a bucket candidate
+
+    if last is None:
+        return
+    for i, (_, bucket) in enumerate(pending):
+        nx, ny = _average(pending[i + 1][1]) if i + 1 < len(pending) else (last[0], last[1])
+        a = _pick(a, bucket, nx, ny)
+        yield a[2]
+    yield last[2]
+
+def epoch(ts):
+    """Seconds since 1970 of a naive local timestamp, the same value as SQLite's strftime('%s', ts)."""
+    return (datetime.strptime(ts, TS_FORMAT if len(ts) > 10 else '%Y-%m-%d') - _EPOCH).total_seconds()
+
+def downsample_rows(rows, points, start, end, field=LTTB_FIELD):
+    """LTTB over already-built readings-shaped dicts (archive and rollup tiers)."""
+    series = ((epoch(row['timestamp']), row[field], row) for row in rows if row.get(field) is not None)
+    return list(lttb(series, points, epoch(start), epoch(end)))
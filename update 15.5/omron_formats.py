@@ -0,0 +1,73 @@
+import math
+import struct
+import sys
+from array import array
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:  # The Pi image does not always ship NumPy; the array module does the packing then
+    np = None
+
+# --- Configuration ---
+# History responses come in three shapes, chosen with ?format=:
+#   rows     list of readings-shaped dicts (the default, and what the templates embed)
+#   columns  {"t": [epoch seconds], "<key>": [values], ...}: every key once instead of once per row
+#   binary   for typed arrays in the browser, little-endian throughout:
+#            16-byte header (magic, version, column count, row count), one 32-byte descriptor
+#            per column (name, type), then the columns in descriptor order, each padded to 8 bytes
+#            so every one of them can be viewed in place with a typed array.
+HISTORY_FORMATS = ('rows', 'columns', 'binary')
+BINARY_MAGIC = b'OMRH'
+BINARY_VERSION = 1
+BINARY_MIMETYPE = 'application/octet-stream'
+BINARY_FLOAT64 = ('val_energy_kwh',)  # Cumulative counters need more than float32's ~7 digits
+
+TS_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_HEADER = struct.Struct('<4sHHI4x')  # magic, version, column count, row count
+_COLUMN = struct.Struct('<24sc7x')   # name, type: b'q' int64, b'd' float64, b'f' float32
+_NUMPY_TYPES = {'q': '<i8', 'd': '<f8', 'f': '<f4'}
+_ROW_KEYS = ('id', 'timestamp', 'unit_id', 'resolution')  # Per-row identity, not series
+
+def rows_to_columns(rows):
+    """Readings-shaped dicts -> {'t': epoch seconds, key: values} for every value key of the rows."""
+    keys = dict.fromkeys(key for row in rows for key in row if key not in _ROW_KEYS)
+    columns = {'t': [int(datetime.strptime(row['timestamp'], TS_FORMAT).timestamp()) for row in rows]}
+    for key in keys:
+        columns[key] = [row.get(key) for row in rows]
+    return columns
+
+def columns_to_lists(columns):
+    """JSON-ready copy of a columns dict (NumPy arrays, memoryviews and arrays become lists, NaN becomes null)."""
+    lists = {}
+    for key, column in columns.items():
+        values = column.tolist() if hasattr(column, 'tolist') else list(column)
+        lists[key] = values if key == 't' else [None if v != v else v for v in values]
+    return lists
+
+def _typecode(key):
+    if key == 't':
+        return 'q'
+    return 'd' if key.startswith(BINARY_FLOAT64) else 'f'
+
+def _pack(column, typecode):
+    if np is not None:
+        # None (a field missing from a rollup row) becomes NaN, which charts draw as a gap
+        return np.asarray(column, dtype=_NUMPY_TYPES[typecode]).tobytes()
+    if typecode != 'q':
+        column = (math.nan if v is None else v for v in column)
+    packed = array(typecode, column)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+def encode_binary(columns):
+    """Packs a columns dict ('t' first) into the binary history format described above."""
+    count = len(columns['t'])
+    parts = [_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(columns), count)]
+    parts += [_COLUMN.pack(key.encode(), _typecode(key).encode()) for key in columns]
+    for key, column in columns.items():
+        data = _pack(column, _typecode(key))
+        parts.append(data + b'\0' * (-len(data) % 8))
+    return b''.join(parts)
@@ -0,0 +1,176 @@
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta
+
+from omron_checkpoint import connect_writer, mark_history_changed
+
+# --- Configuration ---
+GAP_MIN_SECONDS = 5  # Silences shorter than this on restart are not recorded as outages
+
+TS_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def setup_gaps(conn):
+    """Creates the outage index (one row per interval a unit delivered no samples)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS outages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            unit_id TEXT NOT NULL,
+            start_ts TEXT NOT NULL,
+            end_ts TEXT,
+            reason TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_outage_unit_start ON outages (unit_id, start_ts)')
+    # Range queries seek on the end: only outages that end after the range start can overlap it
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_outage_unit_end ON outages (unit_id, end_ts, start_ts)')
+    conn.commit()
+
+def prune_outages(conn, cutoff):
+    """Deletes outages that ended before cutoff (called with the raw retention cutoff). Caller commits."""
+    cursor = conn.cursor()
+    deleted = 0
+    unit_id = ''
+    while True:
+        # One index seek per unit instead of a scan of the whole table
+        cursor.execute("SELECT MIN(unit_id) FROM outages WHERE unit_id > ?", (unit_id,))
+        unit_id = cursor.fetchone()[0]
+        if unit_id is None:
+            return deleted
+        cursor.execute("DELETE FROM outages WHERE unit_id = ? AND end_ts < ?", (unit_id, cutoff))
+        deleted += cursor.rowcount
+
+def shrink_replayed(cursor, unit_id, last):
+    """Moves the start of a service_down outage past samples replayed from the spool. Caller commits.
+
+    reconcile() only sees what reached the database before a restart, so time covered by
+    spooled samples would otherwise count as downtime.
+    """
+    cursor.execute("""
+        UPDATE outages SET start_ts = ?
+        WHERE unit_id = ? AND reason = 'service_down' AND start_ts < ? AND end_ts > ?
+    """, (last, unit_id, last, last))
+
+def classify_error(error):
+    """Maps a read error to an outage reason: timeout, crc or error."""
+    text = str(error).lower()
+    if 'no answer' in text or 'no communication' in text or 'timeout' in text:
+        return 'timeout'
+    if 'crc' in text or 'checksum' in text:
+        return 'crc'
+    return 'error'
+
+def _last_sample(cursor, unit_id):
+    # The 1m rollups see every sample, even ones the deadband kept out of readings
+    cursor.execute("""
+        SELECT MAX(last_ts) FROM rollups
+        WHERE resolution = '1m' AND unit_id = ? AND field = 'val_voltage'
+    """, (unit_id,))
+    return cursor.fetchone()[0]
+
+class GapTracker:
+    """Opens an outage when a unit stops answering and closes it on the next good sample."""
+
+    def __init__(self, db_name, timeout=0.2):
+        self.db_name = db_name
+        self.timeout = timeout
+        self.last_good = {}   # unit_id -> timestamp of the last good sample
+        self.open = {}        # unit_id -> outage row id (None until the INSERT succeeds)
+        self.pending = []     # statements to retry when the database was busy
+
+    def reconcile(self, units):
+        """Startup: closes outages left open by a crash and records the time the service was down."""
+        now = datetime.now().strftime(TS_FORMAT)
+        with closing(connect_writer(self.db_name)) as conn, conn:
+            cursor = conn.cursor()
+            for unit_id in units:
+                last = _last_sample(cursor, unit_id)
+                cursor.execute("""
+                    UPDATE outages SET end_ts = MAX(start_ts, COALESCE(?, start_ts))
+                    WHERE unit_id = ? AND end_ts IS NULL
+                """, (last, unit_id))
+                if last is None:
+                    continue
+                self.last_good[unit_id] = last
+                down = (datetime.strptime(now, TS_FORMAT) - datetime.strptime(last, TS_FORMAT)).total_seconds()
+                if down >= GAP_MIN_SECONDS:
+                    cursor.execute("""
+                        INSERT INTO outages (unit_id, start_ts, end_ts, reason)
+                        VALUES (?, ?, ?, 'service_down')
+                    """, (unit_id, last, now))
+                    print(f"[{datetime.now()}] GAP: {unit_id} had no samples from {last} to {now} (service down)")
+            conn.commit()
+        mark_history_changed(self.db_name)
+
+    def record_success(self, unit_id, timestamp):
+        self.last_good[unit_id] = timestamp
+        if unit_id in self.open:
+            outage_id = self.open.pop(unit_id)
+            self._execute("UPDATE outages SET end_ts = ? WHERE unit_id = ? AND end_ts IS NULL",
+                          (timestamp, unit_id))
+            print(f"[{datetime.now()}] GAP: {unit_id} back online at {timestamp} (outage {outage_id})")
+        elif self.pending:
+            self._execute(None, None)
+
+    def record_failure(self, unit_id, error):
+        if unit_id in self.open:
+            return
+        start = self.last_good.get(unit_id) or datetime.now().strftime(TS_FORMAT)
+        self.open[unit_id] = self._execute("""
+            INSERT INTO outages (unit_id, start_ts, end_ts, reason) VALUES (?, ?, NULL, ?)
+        """, (unit_id, start, classify_error(error)))
+
+    def _execute(self, sql, params):
+        """Runs queued statements plus this one; keeps them queued if the database is busy."""
+        if sql is not None:
+            self.pending.append((sql, params))
+        try:
+            conn = connect_writer(self.db_name, timeout=self.timeout)
+            try:
+                cursor = conn.cursor()
+                for queued_sql, queued_params in self.pending:
+                    cursor.execute(queued_sql, queued_params)
+                conn.commit()
+                self.pending = []
+                return cursor.lastrowid
+            finally:
+                conn.close()
+        except sqlite3.OperationalError as e:
+            print(f"[{datetime.now()}] GAP: outage index busy, will retry ({e})")
+            return None
+
+def get_availability(conn, unit_id, start, end):
+    """Availability and outage list for [start, end) computed from the outage index only."""
+    now = datetime.now().strftime(TS_FORMAT)
+    range_end = min(end, now)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT start_ts, end_ts, reason FROM outages
+        WHERE unit_id = ?1 AND end_ts > ?2 AND start_ts < ?3
+        UNION ALL
+        SELECT start_ts, end_ts, reason FROM outages
+        WHERE unit_id = ?1 AND end_ts IS NULL AND start_ts < ?3
+    """, (unit_id, start, range_end))
+
+    outages = []
+    downtime = 0.0
+    for start_ts, end_ts, reason in sorted(cursor.fetchall()):
+        clipped_end = min(end_ts or now, range_end)
+        clipped_start = max(start_ts, start)
+        if clipped_end <= clipped_start:
+            continue
+        seconds = (datetime.strptime(clipped_end, TS_FORMAT) - datetime.strptime(clipped_start, TS_FORMAT)).total_seconds()
+        downtime += seconds
+        outages.append({'start': start_ts, 'end': end_ts, 'reason': reason, 'seconds': int(seconds)})
+
+    total = (datetime.strptime(range_end, TS_FORMAT) - datetime.strptime(start, TS_FORMAT)).total_seconds()
+    availability = 100.0 * (1 - downtime / total) if total > 0 else 100.0
+    return {
+        'availability_pct': round(max(availability, 0.0), 3),
+        'downtime_seconds': int(downtime),
+        'outages': outages,
+    }
+
+def day_range(start_date, end_date):
+    """'YYYY-MM-DD' inclusive dates -> half-open [start, end) timestamps."""
+    end_next = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+    return f"{start_date} 00:00:00", end_next.strftime(TS_FORMAT)
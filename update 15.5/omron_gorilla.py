@@ -0,0 +1,317 @@
+import os
+import sqlite3
+import struct
+import tempfile
+import time
+from array import array
+from datetime import datetime, timedelta
+
+# --- Configuration ---
+# Gorilla-style block codec (Pelkonen et al., VLDB 2015): delta-of-delta
+# timestamps and XOR-compressed float64 values, one BLOB per unit per block.
+BLOCK_SECONDS = 600  # 10-minute blocks
+FIELDS = ('val_voltage', 'val_current', 'val_power_kw', 'val_energy_kwh')
+BLOCK_HEADER = struct.Struct('<qI')  # first timestamp (epoch seconds), sample count
+
+TS_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_pack_double = struct.Struct('<d')
+_pack_u64 = struct.Struct('<Q')
+
+def _bits(value):
+    return _pack_u64.unpack(_pack_double.pack(value))[0]
+
+def _float(bits):
+    return _pack_double.unpack(_pack_u64.pack(bits))[0]
+
+class BitWriter:
+    def __init__(self):
+        self.out = bytearray()
+        self.acc = 0
+        self.nbits = 0
+
+    def write(self, value, nbits):
+        self.acc = (self.acc << nbits) | (value & ((1 << nbits) - 1))
+        self.nbits += nbits
+        while self.nbits >= 8:
+            self.nbits -= 8
+            self.out.append((self.acc >> self.nbits) & 0xFF)
+        self.acc &= (1 << self.nbits) - 1
+
+    def getvalue(self):
+        if self.nbits:
+            return bytes(self.out) + bytes([(self.acc << (8 - self.nbits)) & 0xFF])
+        return bytes(self.out)
+
+class BitReader:
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.pos = offset * 8
+
+    def read(self, nbits):
+        # Take just the bytes spanning [pos, pos + nbits) and shift the bits out
+        start = self.pos >> 3
+        end = (self.pos + nbits + 7) >> 3
+        chunk = int.from_bytes(self.data[start:end], 'big')
+        shift = end * 8 - self.pos - nbits
+        self.pos += nbits
+        return (chunk >> shift) & ((1 << nbits) - 1)
+
+    def read_signed(self, nbits):
+        value = self.read(nbits)
+        return value - (1 << nbits) if value & (1 << (nbits - 1)) else value
+
+class _ValueEncoder:
+    """XOR encoding of one float series against its previous value."""
+
+    def __init__(self, writer, first):
+        self.writer = writer
+        self.prev = _bits(first)
+        self.leading = -1
+        self.trailing = 0
+        writer.write(self.prev, 64)
+
+    def add(self, value):
+        bits = _bits(value)
+        xor = bits ^ self.prev
+        self.prev = bits
+        w = self.writer
+        if xor == 0:
+            w.write(0, 1)
+            return
+        w.write(1, 1)
+        leading = min(64 - xor.bit_length(), 31)
+        trailing = (xor & -xor).bit_length() - 1
+        if self.leading >= 0 and leading >= self.leading and trailing >= self.trailing:
+            # Meaningful bits fit inside the previous window
+            w.write(0, 1)
+            w.write(xor >> self.trailing, 64 - self.leading - self.trailing)
+        else:
+            self.leading, self.trailing = leading, trailing
+            length = 64 - leading - trailing
+            w.write(1, 1)
+            w.write(leading, 5)
+            w.write(length & 0x3F, 6)  # 64 is stored as 0
+            w.write(xor >> trailing, length)
+
+class _ValueDecoder:
+    def __init__(self, reader):
+        self.reader = reader
+        self.prev = reader.read(64)
+        self.leading = 0
+        self.trailing = 0
+
+    def first(self):
+        return _float(self.prev)
+
+    def next(self):
+        r = self.reader
+        if r.read(1) == 0:
+            return _float(self.prev)
+        if r.read(1) == 1:
+            self.leading = r.read(5)
+            length = r.read(6) or 64
+            self.trailing = 64 - self.leading - length
+        meaningful = r.read(64 - self.leading - self.trailing)
+        self.prev ^= meaningful << self.trailing
+        return _float(self.prev)
+
+def encode_block(timestamps, columns):
+    """Packs epoch-second timestamps and per-field value lists into one Gorilla block."""
+    count = len(timestamps)
+    writer = BitWriter()
+    encoders = [_ValueEncoder(writer, column[0]) for column in columns]
+    prev_t, prev_delta = timestamps[0], 0
+
+    for i in range(1, count):
+        t = timestamps[i]
+        delta = t - prev_t
+        dod = delta - prev_delta
+        if dod == 0:
+            writer.write(0, 1)
+        elif -64 <= dod <= 63:
+            writer.write(0b10, 2)
+            writer.write(dod, 7)
+        elif -256 <= dod <= 255:
+            writer.write(0b110, 3)
+            writer.write(dod, 9)
+        elif -2048 <= dod <= 2047:
+            writer.write(0b1110, 4)
+            writer.write(dod, 12)
+        else:
+            writer.write(0b1111, 4)
+            writer.write(dod, 32)
+        prev_t, prev_delta = t, delta
+        for encoder, column in zip(encoders, columns):
+            encoder.add(column[i])
+
+    return BLOCK_HEADER.pack(timestamps[0], count) + writer.getvalue()
+
+def decode_block(blob):
+    """Streaming decoder: yields (timestamp, value, value, ...) tuples in stored order."""
+    first_t, count = BLOCK_HEADER.unpack_from(blob, 0)
+    if count == 0:
+        return
+    reader = BitReader(blob, BLOCK_HEADER.size)
+    decoders = [_ValueDecoder(reader) for _ in FIELDS]
+    yield (first_t,) + tuple(d.first() for d in decoders)
+
+    prev_t, prev_delta = first_t, 0
+    for _ in range(count - 1):
+        if reader.read(1) == 0:
+            dod = 0
+        elif reader.read(1) == 0:
+            dod = reader.read_signed(7)
+        elif reader.read(1) == 0:
+            dod = reader.read_signed(9)
+        elif reader.read(1) == 0:
+            dod = reader.read_signed(12)
+        else:
+            dod = reader.read_signed(32)
+        prev_delta += dod
+        prev_t += prev_delta
+        yield (prev_t,) + tuple(d.next() for d in decoders)
+
+def decode_arrays(blob):
+    """Decodes a block into {'t': array('q'), field: array('d')}."""
+    result = {'t': array('q'), **{field: array('d') for field in FIELDS}}
+    for point in decode_block(blob):
+        result['t'].append(point[0])
+        for field, value in zip(FIELDS, point[1:]):
+            result[field].append(value)
+    return result
+
+def setup_blocks(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS gorilla_blocks (
+            unit_id TEXT NOT NULL,
+            block_start INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (unit_id, block_start)
+        ) WITHOUT ROWID
+    ''')
+    conn.commit()
+
+def _epoch(ts):
+    return int(datetime.strptime(ts, TS_FORMAT).timestamp())
+
+def pack_range(conn, unit_id, start, end):
+    """Encodes raw rows in [start, end) into BLOCK_SECONDS blocks. Returns (rows, bytes)."""
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT timestamp, {', '.join(FIELDS)}
+        FROM readings
+        WHERE unit_id = ? AND timestamp >= ? AND timestamp < ?
+        ORDER BY timestamp ASC
+    """, (unit_id, start, end))
+
+    blocks = {}
+    for row in cursor.fetchall():
+        t = _epoch(row[0])
+        blocks.setdefault(t - t % BLOCK_SECONDS, []).append((t,) + tuple(row[1:]))
+
+    total_bytes = 0
+    rows = 0
+    for block_start, points in blocks.items():
+        blob = encode_block([p[0] for p in points], [[p[i] for p in points] for i in range(1, len(FIELDS) + 1)])
+        cursor.execute("""
+            INSERT OR REPLACE INTO gorilla_blocks (unit_id, block_start, count, data)
+            VALUES (?, ?, ?, ?)
+        """, (unit_id, block_start, len(points), blob))
+        total_bytes += len(blob)
+        rows += len(points)
+    conn.commit()
+    return rows, total_bytes
+
+def iter_blocks(conn, unit_id, start_epoch, end_epoch):
+    """Yields decoded points for [start_epoch, end_epoch) block by block."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT data FROM gorilla_blocks
+        WHERE unit_id = ? AND block_start >= ? AND block_start < ?
+        ORDER BY block_start ASC
+    """, (unit_id, start_epoch - start_epoch % BLOCK_SECONDS, end_epoch))
+    for (blob,) in cursor:
+        for point in decode_block(blob):
+            if start_epoch <= point[0] < end_epoch:
+                yield point
+
+def _table_bytes(conn, *names):
+    """Bytes of the b-tree pages of the named tables and indexes (dbstat)."""
+    marks = ', '.join('?' * len(names))
+    return conn.execute(f"SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name IN ({marks})", names).fetchone()[0]
+
+def benchmark(db_name, unit_id, day):
+    """Compares one unit-day stored as Gorilla blocks with the row-per-sample readings table.
+
+    The ratio is page bytes against page bytes: the readings table plus its index
+    against the gorilla_blocks table, both measured with dbstat.
+    """
+    next_day = (datetime.strptime(day, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    source = sqlite3.connect(db_name)
+    rows = source.execute(f"""
+        SELECT timestamp, {', '.join(FIELDS)}, unit_id FROM readings
+        WHERE unit_id = ? AND timestamp >= ? AND timestamp < ?
+        ORDER BY timestamp ASC
+    """, (unit_id, day, next_day)).fetchall()
+    source.close()
+    if not rows:
+        print(f"No rows for {unit_id} on {day}")
+        return None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Row-per-sample baseline: same schema and index as omron.db
+        raw_path = os.path.join(tmp, 'raw.db')
+        raw = sqlite3.connect(raw_path)
+        raw.execute('''CREATE TABLE readings (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL,
+                       val_voltage REAL NOT NULL, val_current REAL NOT NULL, val_power_kw REAL NOT NULL,
+                       val_energy_kwh REAL NOT NULL, unit_id TEXT NOT NULL)''')
+        raw.execute('CREATE INDEX idx_unit_timestamp ON readings (unit_id, timestamp)')
+        raw.executemany('''INSERT INTO readings (timestamp, val_voltage, val_current, val_power_kw, val_energy_kwh, unit_id)
+                           VALUES (?, ?, ?, ?, ?, ?)''', rows)
+        raw.commit()
+        raw.execute('VACUUM')
+        raw_bytes = _table_bytes(raw, 'readings', 'idx_unit_timestamp')
+
+        started = time.perf_counter()
+        raw_read = raw.execute('SELECT * FROM readings WHERE unit_id = ? ORDER BY timestamp', (unit_id,)).fetchall()
+        raw_read_s = time.perf_counter() - started
+        raw.close()
+
+        # Gorilla blocks
+        block_path = os.path.join(tmp, 'blocks.db')
+        blocks = sqlite3.connect(block_path)
+        blocks.execute(f"ATTACH DATABASE '{raw_path}' AS src")
+        blocks.execute('CREATE TABLE readings AS SELECT * FROM src.readings')
+        blocks.execute('DETACH DATABASE src')
+        setup_blocks(blocks)
+        started = time.perf_counter()
+        _, blob_bytes = pack_range(blocks, unit_id, day, next_day)
+        encode_s = time.perf_counter() - started
+        block_bytes = _table_bytes(blocks, 'gorilla_blocks')
+
+        start_epoch = _epoch(day + ' 00:00:00')
+        started = time.perf_counter()
+        decoded = sum(1 for _ in iter_blocks(blocks, unit_id, start_epoch, start_epoch + 86400))
+        decode_s = time.perf_counter() - started
+        blocks.close()
+
+    report = {
+        'rows': len(rows),
+        'raw_bytes': raw_bytes,
+        'gorilla_bytes': block_bytes,
+        'gorilla_blob_bytes': blob_bytes,
+        'ratio': round(raw_bytes / block_bytes, 1) if block_bytes else None,
+        'bytes_per_sample': round(blob_bytes / len(rows), 2),
+        'encode_us_per_sample': round(encode_s / len(rows) * 1e6, 1),
+        'decode_samples_per_s': int(decoded / decode_s) if decode_s else None,
+        'sqlite_read_samples_per_s': int(len(raw_read) / raw_read_s) if raw_read_s else None,
+    }
+    print(f"[{datetime.now()}] GORILLA BENCHMARK {unit_id} {day}: {report}")
+    return report
+
+if __name__ == "__main__":
+    # python omron_gorilla.py  -> benchmarks yesterday's unit01 data from omron.db
+    yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    benchmark('omron.db', 'unit01', yesterday)
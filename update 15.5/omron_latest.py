@@ -0,0 +1,108 @@
+import mmap
+import os
+import struct
+import time
+
+# --- Configuration ---
+# The collector writes each unit's newest sample into a small memory-mapped file;
+# the web gateway reads it from there instead of querying SQLite every second per
+# browser. Each slot is guarded by a sequence counter (seqlock): odd while being
+# written, so a reader that sees it change or odd simply reads again.
+LATEST_FILE = 'latest.bin'
+LATEST_SLOTS = 8             # Units the file can hold
+LATEST_STALE_SECONDS = 5     # Older publications are ignored and the database is asked instead
+LATEST_READ_RETRIES = 100
+
+# seq, unit_id, published_at, id, timestamp, voltage, current, power, energy
+_SLOT = struct.Struct('<Q16sdq19s5x4d')
+_SEQ = struct.Struct('<Q')
+
+class LatestWriter:
+    """Collector side: one slot per unit, claimed on the unit's first publication."""
+
+    def __init__(self, path=LATEST_FILE):
+        size = _SLOT.size * LATEST_SLOTS
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.slots = {}
+        for i in range(LATEST_SLOTS):
+            unit = _SLOT.unpack_from(self.map, i * _SLOT.size)[1].rstrip(b'\0').decode()
+            if unit:
+                self.slots[unit] = i
+
+    def _slot(self, unit_id):
+        if unit_id not in self.slots:
+            if len(self.slots) >= LATEST_SLOTS:
+                raise ValueError(f"{LATEST_FILE} is full ({LATEST_SLOTS} units)")
+            self.slots[unit_id] = len(self.slots)
+        return self.slots[unit_id]
+
+    def publish(self, unit_id, reading, row_id=None):
+        offset = self._slot(unit_id) * _SLOT.size
+        seq = _SEQ.unpack_from(self.map, offset)[0]
+        _SEQ.pack_into(self.map, offset, seq + 1)  # Odd: write in progress
+        _SLOT.pack_into(self.map, offset, seq + 1, unit_id.encode(), time.time(), row_id or 0,
+                        reading['timestamp'].encode(), reading['val_voltage'], reading['val_current'],
+                        reading['val_power_kw'], reading['val_energy_kwh'])
+        _SEQ.pack_into(self.map, offset, seq + 2)
+
+    def close(self):
+        self.map.close()
+
+class LatestReader:
+    """Web side: constant-time lookups, None when the file is missing or the slot is stale."""
+
+    def __init__(self, path=LATEST_FILE):
+        self.path = path
+        self.map = None
+        self.inode = None
+
+    def _mapping(self):
+        # Opened lazily and reopened if the collector recreated the file
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        if self.map is None or st.st_ino != self.inode or len(self.map) != st.st_size:
+            if st.st_size < _SLOT.size:
+                return None
+            with open(self.path, 'rb') as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.inode = st.st_ino
+        return self.map
+
+    def read(self, unit_id, max_age=LATEST_STALE_SECONDS):
+        m = self._mapping()
+        if m is None:
+            return None
+        wanted = unit_id.encode()
+        for offset in range(0, len(m) - _SLOT.size + 1, _SLOT.size):
+            for _ in range(LATEST_READ_RETRIES):
+                before = _SEQ.unpack_from(m, offset)[0]
+                if before & 1:
+                    continue
+                slot = _SLOT.unpack_from(m, offset)
+                if _SEQ.unpack_from(m, offset)[0] == before:
+                    break
+            else:
+                return None  # Writer kept the slot busy; let the caller use the database
+            seq, unit, published_at, row_id, ts, voltage, current, power, energy = slot
+            if unit.rstrip(b'\0') != wanted:
+                continue
+            if time.time() - published_at > max_age:
+                return None
+            return {
+                'id': row_id or None,
+                'timestamp': ts.decode(),
+                'val_voltage': voltage,
+                'val_current': current,
+                'val_power_kw': power,
+                'val_energy_kwh': energy,
+                'unit_id': unit_id,
+            }
+        return None
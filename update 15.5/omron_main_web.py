@@ -1,10 +1,33 @@
 # omron_main_web.py
-import sqlite3
-from flask import Flask, render_template, request, jsonify, redirect, url_for
-from datetime import datetime
+import hashlib
+import json
+import os
+import time
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response, make_response
+from datetime import datetime, timedelta
 from omron_database import (
     get_historical_readings, 
-    get_historical_readings_by_range
+    get_historical_readings_multi,
+    get_historical_readings_by_range,
+    get_historical_columns,
+    get_rollup_readings_by_range,
+    get_bucketed_readings_by_range,
+    get_bucketed_readings_multi,
+    get_latest_readings,
+    align_buckets,
+    pick_resolution
+)
+from omron_storage import get_backend
+from omron_readpool import read_connection
+from omron_checkpoint import history_version
+from omron_latest import LatestReader
+from omron_gaps import get_availability, day_range
+from omron_changes import get_changes, CHANGES_DEFAULT_LIMIT
+from omron_formats import (
+    rows_to_columns, columns_to_lists, encode_binary, HISTORY_FORMATS, BINARY_MIMETYPE
+)
+from omron_downsample import (
+    downsample_rows, LTTB_DEFAULT_POINTS, LTTB_MAX_POINTS, LTTB_FIELD, LTTB_FIELDS, LTTB_RAW_MAX_DAYS
 )
 
 app = Flask(__name__)
@@ -12,25 +35,139 @@ app = Flask(__name__)
 # --- Configuration ---
 PORT = 5200
 DB_MAIN = 'omron.db'
+STREAM_POLL = 0.25          # Seconds between checks of the collector's latest-reading file
+STREAM_KEEPALIVE = 15       # Comment line sent when idle so proxies keep the stream open
+STREAM_RETRY_MS = 2000      # Browser reconnect delay
+STREAM_BACKFILL_MAX = 3600  # Stored rows replayed on resume; longer gaps are left to the history charts
+# Conditional requests: every cacheable response carries a strong ETag, and a request whose
+# If-None-Match still matches gets an empty 304 without the database being queried.
+CACHE_LIVE = 'no-cache'                 # Latest / ranges reaching today: always revalidate
+CACHE_PAST = 'public, max-age=300'      # Ranges ending before today: keyed on the history generation, which
+                                        # spool replay, corrections, outages and retention bump
+SUMMARY_MAX_AGE = 300       # Seconds today's bar in the summary charts may lag behind
+
+storage = get_backend('sqlite', db_name=DB_MAIN)
+latest = LatestReader()
 
 def get_latest_from_db(unit_id):
-    """Fetches the single most recent row for a specific unit from the database."""
+    """Most recent reading: the collector's shared-memory copy, or the database when that is stale."""
     try:
-        conn = sqlite3.connect(DB_MAIN)
-        conn.row_factory = sqlite3.Row  # Crucial: allows access by column name
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM readings 
-            WHERE unit_id = ? 
-            ORDER BY timestamp DESC LIMIT 1
-        """, (unit_id,))
-        row = cursor.fetchone()
-        conn.close()
-        return dict(row) if row else None
+        return latest.read(unit_id) or storage.latest(unit_id)
     except Exception as e:
         print(f"Latest DB Read Error: {e}")
         return None
 
+def data_version():
+    """Changes with every commit (size and mtime of the database and its WAL), read without a query."""
+    version = []
+    for path in (DB_MAIN, DB_MAIN + '-wal'):
+        try:
+            st = os.stat(path)
+            version += [st.st_mtime_ns, st.st_size]
+        except OSError:
+            version += [0, 0]
+    return '-'.join(map(str, version))
+
+def conditional(key, cache_control, build):
+    """Answers 304 when If-None-Match holds the ETag for `key`; otherwise returns build() tagged with it.
+
+    `build` is only called on a miss, so a matching request never reaches the database.
+    """
+    etag = hashlib.sha1(key.encode()).hexdigest()[:20]
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = make_response(build())
+        if response.status_code != 200:
+            return response  # Errors are never cached
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def range_cache(end_date):
+    """(version key, Cache-Control) for a date range: a closed range follows the history generation, others the data."""
+    today = datetime.now().strftime('%Y-%m-%d')
+    if end_date < today:
+        return f"{today}:{history_version(DB_MAIN)}", CACHE_PAST
+    return data_version(), CACHE_LIVE
+
+def summary_cache():
+    """(version key, Cache-Control) for the summaries: the date plus a SUMMARY_MAX_AGE window for today's bar."""
+    now = time.time()
+    window = int(now // SUMMARY_MAX_AGE)
+    max_age = int((window + 1) * SUMMARY_MAX_AGE - now) + 1
+    return f"{datetime.now().strftime('%Y-%m-%d')}-{window}", f'public, max-age={max_age}'
+
+def _sse(cursor, row):
+    return f"id: {cursor}\nevent: reading\ndata: {json.dumps(row)}\n\n"
+
+def stream_events(units, since=None):
+    """Server-sent events: stored rows after `since` (readings.id), then each sample as the collector publishes it.
+
+    Units whose latest-reading slot is stale are followed through the change feed, each
+    from its own cursor. The event id is the lowest of those cursors, so a browser that
+    resumes with Last-Event-ID may see a row twice (the pages drop repeats) but never misses one.
+    """
+    yield f"retry: {STREAM_RETRY_MS}\n\n"
+    with read_connection(DB_MAIN) as db:
+        newest = db.execute("SELECT COALESCE(MAX(id), 0) FROM readings").fetchone()[0]
+        since = newest if since is None else max(since, newest - STREAM_BACKFILL_MAX)
+        page = get_changes(db, since, STREAM_BACKFILL_MAX, units)
+    cursors = {unit_id: page['next'] for unit_id in units}
+    last_ts = {unit_id: '' for unit_id in units}
+    for row in page['changes']:
+        last_ts[row['unit_id']] = row['timestamp']
+        yield _sse(row['id'], row)
+
+    idle_since = time.time()
+    while True:
+        events = []
+        consumed = {}
+        for unit_id in units:
+            row = latest.read(unit_id)
+            if row is None:
+                consumed[unit_id] = None
+            elif row['timestamp'] > last_ts[unit_id]:
+                events.append(row)
+        if consumed:
+            with read_connection(DB_MAIN) as db:
+                # Read first: every row at or below it is visible to the queries that follow
+                newest = db.execute("SELECT COALESCE(MAX(id), 0) FROM readings").fetchone()[0]
+                for unit_id in consumed:
+                    page = get_changes(db, cursors[unit_id], CHANGES_DEFAULT_LIMIT, [unit_id])
+                    events += page['changes']
+                    # Once caught up, the unit has no rows up to newest; its cursor need not scan them again
+                    consumed[unit_id] = page['next'] if page['more'] else max(page['next'], newest)
+
+        # Older ids first, so the cursor a client holds never jumps past an unsent row
+        for row in sorted(events, key=lambda r: (r['id'] or cursors[r['unit_id']], r['timestamp'])):
+            unit_id = row['unit_id']
+            cursors[unit_id] = max(cursors[unit_id], row['id'] or 0)  # Deadband-suppressed samples have no row id
+            if row['timestamp'] <= last_ts[unit_id]:
+                continue
+            last_ts[unit_id] = row['timestamp']
+            yield _sse(min(cursors.values()), row)
+            idle_since = time.time()
+        # Rows of a page that were not sent (already shown) are consumed as well
+        for unit_id, next_id in consumed.items():
+            cursors[unit_id] = max(cursors[unit_id], next_id)
+
+        if time.time() - idle_since >= STREAM_KEEPALIVE:
+            yield ": keepalive\n\n"
+            idle_since = time.time()
+        time.sleep(STREAM_POLL)
+
+def get_daily_rollups(unit_id, field, days):
+    """Returns {'MM/DD': rollup} for the last X days, read from the 1d rollup buckets."""
+    start = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+    end = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+    rows = storage.aggregate(unit_id, field, '1d', start, end)
+    return {f"{r['bucket'][5:7]}/{r['bucket'][8:10]}": r for r in rows}
+
+def _last_id(history):
+    """readings.id of the newest stored row in a history list (None when there is none)."""
+    return max((row['id'] for row in history if row.get('id')), default=None)
+
 # --- Web Routes ---
 
 @app.route('/')
@@ -53,14 +190,17 @@ def dashboard(unit_id):
         history=history_list,
         latest=history_list[-1] if history_list else None,
         history_hours=24,
-        read_interval_ms=1000  # Matches your new collector speed
+        read_interval_ms=1000,  # Matches your new collector speed
+        # The stream picks up right after the last row rendered into the page
+        stream_url=url_for('api_stream', units=unit_id, since=_last_id(history_list))
     )
 
 @app.route('/hikaku')
 def hikaku():
     """Comparison view for both units."""
-    h1_all = get_historical_readings(days=1, unit_id="unit01")
-    h2_all = get_historical_readings(days=1, unit_id="unit02")
+    # Both units from one pass over the index
+    history = get_historical_readings_multi(days=1, units=("unit01", "unit02"))
+    h1_all, h2_all = history["unit01"], history["unit02"]
     
     return render_template(
         'hikaku.html', 
@@ -68,7 +208,8 @@ def hikaku():
         history_u2=h2_all,
         read_interval_ms=1000,
         apiUrlU1=url_for('api_latest', unit_id='unit01'),
-        apiUrlU2=url_for('api_latest', unit_id='unit02')
+        apiUrlU2=url_for('api_latest', unit_id='unit02'),
+        stream_url=url_for('api_stream', units='unit01,unit02', since=min(filter(None, (_last_id(h1_all), _last_id(h2_all))), default=None))
     )
 
 # --- API Endpoints ---
@@ -76,147 +217,271 @@ def hikaku():
 @app.route('/api/<unit_id>/latest')
 def api_latest(unit_id):
     """Endpoint for real-time card updates via JavaScript."""
-    data = get_latest_from_db(unit_id)
-    if data:
-        return jsonify(data)
-    return jsonify({"error": "No data available"}), 404
+    # The collector's sample sequence (row id, else its timestamp) is the validator
+    data = latest.read(unit_id)
+    version = (data['id'] or data['timestamp']) if data else data_version()
+
+    def build():
+        row = data or get_latest_from_db(unit_id)
+        if row:
+            return jsonify(row)
+        return jsonify({"error": "No data available"}), 404
+    return conditional(f"latest:{unit_id}:{version}", CACHE_LIVE, build)
 
 @app.route('/api/<unit_id>/history')
 def api_history(unit_id):
-    """Endpoint for date-range filtered history."""
+    """Endpoint for date-range filtered history, downsampled to `points` rows (the chart width) or bucketed."""
+    args = _history_args()
+    if not isinstance(args, dict):
+        return args
+
+    def build():
+        if args['mode'] == 'buckets':
+            data = get_bucketed_readings_by_range(args['start_date'], args['end_date'], unit_id, args['points'])
+        else:
+            data = get_lttb_history(unit_id, **args)
+        return history_response(data, args['history_format'])
+    version, cache_control = range_cache(args['end_date'])
+    return conditional(f"{request.full_path}:{version}", cache_control, build)
+
+@app.route('/api/latest')
+def api_latest_batch():
+    """Latest reading of every unit in `units` (comma-separated): {unit_id: reading or null}."""
+    units = [u for u in request.args.get('units', 'unit01,unit02').split(',') if u]
+    data = {unit_id: latest.read(unit_id) for unit_id in units}
+    stale = [unit_id for unit_id, row in data.items() if row is None]
+    version = data_version() if stale else ','.join(str(row['id'] or row['timestamp']) for row in data.values())
+
+    def build():
+        try:
+            if stale:
+                # One statement for all units the collector has not published recently
+                data.update(get_latest_readings(stale))
+            return jsonify(data)
+        except Exception as e:
+            print(f"Latest DB Read Error: {e}")
+            return jsonify({"error": str(e)}), 500
+    return conditional(f"latest:{','.join(units)}:{version}", CACHE_LIVE, build)
+
+@app.route('/api/history')
+def api_history_batch():
+    """History of every unit in `units` from one query: {unit_id: rows}.
+
+    align=1 buckets all units on the same grid and returns
+    {'timestamp': [...], <unit_id>: [row or null, ...]} with one entry per timestamp.
+    """
+    units = [u for u in request.args.get('units', 'unit01,unit02').split(',') if u]
+    if not units:
+        return jsonify({"error": "units must name at least one unit"}), 400
+    args = _history_args()
+    if not isinstance(args, dict):
+        return args
+
+    align = request.args.get('align') in ('1', 'true')
+    if args['history_format'] == 'binary' or (align and args['history_format'] != 'rows'):
+        return jsonify({"error": "batch history is served as rows, or as columns when not aligned"}), 400
+
+    def build():
+        if args['mode'] == 'buckets' or align:
+            history = get_bucketed_readings_multi(args['start_date'], args['end_date'], units, args['points'])
+        else:
+            # LTTB picks different timestamps per series, so each unit is downsampled on its own
+            history = {unit_id: get_lttb_history(unit_id, **args) for unit_id in units}
+        if align:
+            return jsonify(align_buckets(history))
+        if args['history_format'] == 'columns':
+            return jsonify({unit_id: columns_to_lists(_columns(data)) for unit_id, data in history.items()})
+        return jsonify(history)
+    version, cache_control = range_cache(args['end_date'])
+    return conditional(f"{request.full_path}:{version}", cache_control, build)
+
+def _history_args():
+    """Validated start_date/end_date/points/field/mode of a history request, or an error response."""
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
     if not start_date or not end_date:
         return jsonify({"error": "Missing parameters"}), 400
     
-    # Calculate skip rate for performance
-    d1 = datetime.strptime(start_date, '%Y-%m-%d')
-    d2 = datetime.strptime(end_date, '%Y-%m-%d')
-    delta_days = (d2 - d1).days
-
-    if delta_days >= 7:    skip_rate = 300 
-    elif delta_days >= 3:  skip_rate = 60
-    elif delta_days >= 1:  skip_rate = 5
-    else:                  skip_rate = 1
-
-    history_objs = get_historical_readings_by_range(
-        start_date, end_date, unit_id, skip=skip_rate
+    try:
+        points = int(request.args.get('points', LTTB_DEFAULT_POINTS))
+    except ValueError:
+        return jsonify({"error": "points must be an integer"}), 400
+    points = max(3, min(points, LTTB_MAX_POINTS))
+    field = request.args.get('field', LTTB_FIELD)
+    if field not in LTTB_FIELDS:
+        return jsonify({"error": f"field must be one of {', '.join(LTTB_FIELDS)}"}), 400
+
+    # mode=buckets: min/max/mean/first/last per bucket, so envelope bands show every excursion
+    mode = request.args.get('mode', 'lttb')
+    if mode not in ('lttb', 'buckets'):
+        return jsonify({"error": "mode must be 'lttb' or 'buckets'"}), 400
+    # format=columns / binary: one array per field instead of one dict per row (see omron_formats)
+    history_format = request.args.get('format', 'rows')
+    if history_format not in HISTORY_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(HISTORY_FORMATS)}"}), 400
+    return {'start_date': start_date, 'end_date': end_date, 'points': points, 'field': field, 'mode': mode,
+            'history_format': history_format}
+
+def _columns(data):
+    return rows_to_columns(data) if isinstance(data, list) else data
+
+def history_response(data, history_format):
+    """Rows or a columns dict, sent in the requested format."""
+    if history_format == 'rows':
+        return jsonify(data)
+    if history_format == 'columns':
+        return jsonify(columns_to_lists(_columns(data)))
+    return Response(encode_binary(_columns(data)), mimetype=BINARY_MIMETYPE)
+
+def get_lttb_history(unit_id, start_date, end_date, points, field, mode='lttb', history_format='rows'):
+    """LTTB-downsampled rows of one unit from raw rows or the finest suitable rollup tier.
+
+    For the columnar formats a raw range is returned as columns read straight from the
+    columnar files, without building a dict per row.
+    """
+    # Ranges older than the raw/archive tiers are served from the finest rollup tier still kept;
+    # long raw ranges are read from the 1m rollups so the scan does not grow with the day count
+    resolution = pick_resolution(unit_id, start_date, end_date)
+    delta_days = (datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days + 1
+    if resolution == 'raw' and delta_days > LTTB_RAW_MAX_DAYS:
+        resolution = '1m'
+
+    if resolution not in ('raw', 'archive'):
+        end_next = (datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        rows = get_rollup_readings_by_range(start_date, end_date, unit_id, resolution)
+        return downsample_rows(rows, points, start_date, end_next, field)
+
+    # Columns come straight from raw storage; archive ranges are reconstructed row by row below
+    if resolution == 'raw' and history_format != 'rows':
+        columns = get_historical_columns(start_date, end_date, unit_id, points=points, field=field)
+        if columns is not None:
+            return columns
+    return get_historical_readings_by_range(
+        start_date, end_date, unit_id, points=points, field=field
     )
-    return jsonify(history_objs)
 
-@app.route('/api/weekly_summary')
-def get_weekly_summary():
-    """Aggregated average current for the last 7 days."""
+@app.route('/api/changes')
+def api_changes():
+    """Change feed over readings: rows after the `since` cursor plus the cursor for the next call."""
     try:
-        db = sqlite3.connect(DB_MAIN)
-        cursor = db.cursor()
-        
-        query = """
-            SELECT strftime('%m/%d', timestamp) as day, 
-                   AVG(val_current) as avg_val
-            FROM readings
-            WHERE unit_id = ? 
-            AND timestamp >= date('now', '-7 days')
-            GROUP BY day
-            ORDER BY timestamp ASC
-        """
-        
-        cursor.execute(query, ("unit01",))
-        u1_dict = {row[0]: row[1] for row in cursor.fetchall()}
-        
-        cursor.execute(query, ("unit02",))
-        u2_dict = {row[0]: row[1] for row in cursor.fetchall()}
-        db.close()
-
-        all_dates = sorted(list(set(u1_dict.keys()) | set(u2_dict.keys())))
-
-        return jsonify({
-            "labels": all_dates,
-            "u1": [round(u1_dict.get(day, 0), 3) for day in all_dates],
-            "u2": [round(u2_dict.get(day, 0), 3) for day in all_dates]
-        })
+        since = int(request.args.get('since', 0))
+        limit = int(request.args.get('limit', CHANGES_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "since and limit must be integers"}), 400
+    units = [u for u in request.args.get('units', '').split(',') if u]
+
+    try:
+        with read_connection(DB_MAIN) as db:
+            page = get_changes(db, since, limit, units)
+        return jsonify(page)
     except Exception as e:
-        print(f"Weekly Summary Error: {e}")
+        print(f"Change Feed Error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/stream')
+def api_stream():
+    """Live readings for `units` as server-sent events; resumes after Last-Event-ID (or `since`)."""
+    units = [u for u in request.args.get('units', 'unit01,unit02').split(',') if u]
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        since = int(since) if since else None
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID / since must be an integer"}), 400
+
+    return Response(stream_events(units, since), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/availability')
+def api_availability():
+    """Availability percentage and outage list per unit, read from the outage index."""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    units = request.args.get('units', 'unit01,unit02').split(',')
+
+    if not start_date or not end_date:
+        return jsonify({"error": "Missing parameters"}), 400
+
+    def build():
+        try:
+            start, end = day_range(start_date, end_date)
+            with read_connection(DB_MAIN) as db:
+                result = {unit_id: get_availability(db, unit_id, start, end) for unit_id in units}
+            return jsonify(result)
+        except Exception as e:
+            print(f"Availability Error: {e}")
+            return jsonify({"error": str(e)}), 500
+    version, cache_control = range_cache(end_date)
+    return conditional(f"{request.full_path}:{version}", cache_control, build)
+
+@app.route('/api/weekly_summary')
+def get_weekly_summary():
+    """Aggregated average current for the last 7 days."""
+    # Closed days are fixed; only today's bar moves, so it is refreshed every SUMMARY_MAX_AGE seconds
+    def build():
+        try:
+            # Daily averages come straight from the 1d rollups (sum / count)
+            u1_dict = {day: r['avg'] for day, r in get_daily_rollups("unit01", 'val_current', 7).items()}
+            u2_dict = {day: r['avg'] for day, r in get_daily_rollups("unit02", 'val_current', 7).items()}
+
+            all_dates = sorted(list(set(u1_dict.keys()) | set(u2_dict.keys())))
+
+            return jsonify({
+                "labels": all_dates,
+                "u1": [round(u1_dict.get(day, 0), 3) for day in all_dates],
+                "u2": [round(u2_dict.get(day, 0), 3) for day in all_dates]
+            })
+        except Exception as e:
+            print(f"Weekly Summary Error: {e}")
+            return jsonify({"error": str(e)}), 500
+    version, cache_control = summary_cache()
+    return conditional(f"{request.path}:{version}", cache_control, build)
+
 @app.route('/api/weekly_energy_summary')
 def get_weekly_energy_summary():
     """Calculates daily kWh consumption (Daily Max - Daily Min) for the last 7 days."""
-    try:
-        db = sqlite3.connect(DB_MAIN)
-        cursor = db.cursor()
-        
-        # This query calculates the delta (Max - Min) for each day
-        query = """
-            SELECT strftime('%m/%d', timestamp) as day, 
-                   (MAX(val_energy_kwh) - MIN(val_energy_kwh)) as daily_usage
-            FROM readings
-            WHERE unit_id = ? 
-            AND timestamp >= date('now', '-7 days')
-            GROUP BY day
-            ORDER BY timestamp ASC
-        """
-        
-        # Fetch for Unit 01
-        cursor.execute(query, ("unit01",))
-        u1_data = {row[0]: row[1] for row in cursor.fetchall()}
-        
-        # Fetch for Unit 02
-        cursor.execute(query, ("unit02",))
-        u2_data = {row[0]: row[1] for row in cursor.fetchall()}
-        db.close()
-
-        # Combine dates from both units to ensure the X-axis is aligned
-        all_dates = sorted(list(set(u1_data.keys()) | set(u2_data.keys())))
-
-        return jsonify({
-            "labels": all_dates,
-            "u1": [round(u1_data.get(day, 0), 3) for day in all_dates],
-            "u2": [round(u2_data.get(day, 0), 3) for day in all_dates]
-        })
-    except Exception as e:
-        print(f"Weekly Energy Summary Error: {e}")
-        return jsonify({"error": str(e)}), 500
+    def build():
+        try:
+            # Daily delta (Max - Min) read from the 1d rollups
+            u1_data = {day: r['max'] - r['min'] for day, r in get_daily_rollups("unit01", 'val_energy_kwh', 7).items()}
+            u2_data = {day: r['max'] - r['min'] for day, r in get_daily_rollups("unit02", 'val_energy_kwh', 7).items()}
+
+            # Combine dates from both units to ensure the X-axis is aligned
+            all_dates = sorted(list(set(u1_data.keys()) | set(u2_data.keys())))
+
+            return jsonify({
+                "labels": all_dates,
+                "u1": [round(u1_data.get(day, 0), 3) for day in all_dates],
+                "u2": [round(u2_data.get(day, 0), 3) for day in all_dates]
+            })
+        except Exception as e:
+            print(f"Weekly Energy Summary Error: {e}")
+            return jsonify({"error": str(e)}), 500
+    version, cache_control = summary_cache()
+    return conditional(f"{request.path}:{version}", cache_control, build)
 
 @app.route('/api/monthly_energy_summary')
 def get_monthly_energy_summary():
     """Calculates daily kWh consumption for the last 30 days for the monthly bar chart."""
-    try:
-        db = sqlite3.connect(DB_MAIN)
-        cursor = db.cursor()
-        
-        # Query to get daily usage (Max kWh - Min kWh) for each day in the last 30 days
-        query = """
-            SELECT strftime('%m/%d', timestamp) as day, 
-                   (MAX(val_energy_kwh) - MIN(val_energy_kwh)) as daily_usage
-            FROM readings
-            WHERE unit_id = ? 
-            AND timestamp >= date('now', '-30 days')
-            GROUP BY day
-            ORDER BY timestamp ASC
-        """
-        
-        # Fetch data for Unit 01
-        cursor.execute(query, ("unit01",))
-        u1_data = {row[0]: row[1] for row in cursor.fetchall()}
-        
-        # Fetch data for Unit 02
-        cursor.execute(query, ("unit02",))
-        u2_data = {row[0]: row[1] for row in cursor.fetchall()}
-        db.close()
-
-        # Merge all unique dates from both units to keep the chart X-axis synchronized
-        all_dates = sorted(list(set(u1_data.keys()) | set(u2_data.keys())))
-
-        return jsonify({
-            "labels": all_dates,
-            "u1": [round(u1_data.get(day, 0), 3) for day in all_dates],
-            "u2": [round(u2_data.get(day, 0), 3) for day in all_dates]
-        })
-    except Exception as e:
-        print(f"Monthly Energy Summary Error: {e}")
-        return jsonify({"error": str(e)}), 500
+    def build():
+        try:
+            # Daily usage (Max kWh - Min kWh) for each of the last 30 days, from the 1d rollups
+            u1_data = {day: r['max'] - r['min'] for day, r in get_daily_rollups("unit01", 'val_energy_kwh', 30).items()}
+            u2_data = {day: r['max'] - r['min'] for day, r in get_daily_rollups("unit02", 'val_energy_kwh', 30).items()}
+
+            # Merge all unique dates from both units to keep the chart X-axis synchronized
+            all_dates = sorted(list(set(u1_data.keys()) | set(u2_data.keys())))
+
+            return jsonify({
+                "labels": all_dates,
+                "u1": [round(u1_data.get(day, 0), 3) for day in all_dates],
+                "u2": [round(u2_data.get(day, 0), 3) for day in all_dates]
+            })
+        except Exception as e:
+            print(f"Monthly Energy Summary Error: {e}")
+            return jsonify({"error": str(e)}), 500
+    version, cache_control = summary_cache()
+    return conditional(f"{request.path}:{version}", cache_control, build)
 
 if __name__ == '__main__':
     # Flask is now just a web gateway. No hardware threads!
@@ -0,0 +1,262 @@
+import sqlite3
+import time
+from datetime import datetime
+
+# --- Configuration ---
+# Table rebuilds run online: a shadow table is filled in id-ordered chunks while
+# triggers mirror the collector's writes into it, then swapped in with one short
+# write transaction. Indexes are built on the shadow table before the backfill, so
+# the swap is only a drop and a rename. Progress is committed with every chunk, so
+# an interrupted run resumes where it stopped.
+MIGRATION_CHUNK_SIZE = 5000
+MIGRATION_PAUSE = 0.05          # Seconds between chunks so the collector can take the write lock
+MIGRATION_LOCK_TIMEOUT = 30     # Seconds to wait for the write lock at each chunk and at cutover
+MIGRATION_REPORT_EVERY = 10     # Chunks between progress lines
+
+READINGS_COLUMNS = ('id', 'timestamp', 'val_voltage', 'val_current', 'val_power_kw', 'val_energy_kwh', 'unit_id')
+
+READINGS_DDL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        val_voltage REAL NOT NULL,
+        val_current REAL NOT NULL,
+        val_power_kw REAL NOT NULL,
+        val_energy_kwh REAL NOT NULL,
+        unit_id TEXT NOT NULL
+    )
+'''
+
+def _table_columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [info[1] for info in cursor.fetchall()]
+
+def _has_legacy_readings(cursor):
+    """True while readings still carries val_power_factor or lacks val_power_kw."""
+    columns = _table_columns(cursor, 'readings')
+    return bool(columns) and ('val_power_factor' in columns or 'val_power_kw' not in columns)
+
+# Ordered steps. A step is either {'sql': [...]} (cheap DDL, applied in one
+# transaction) or a table rebuild {'table', 'ddl', 'columns', 'defaults',
+# 'indexes': {name: column list}}. 'needed' lets a step be recorded without
+# work when the schema already matches (e.g. databases created by setup_database()).
+MIGRATIONS = [
+    {
+        'version': 1,
+        'name': 'remove val_power_factor, add val_power_kw',
+        'needed': _has_legacy_readings,
+        'table': 'readings',
+        'ddl': READINGS_DDL,
+        'columns': READINGS_COLUMNS,
+        'defaults': {'val_power_kw': '0.0'},  # Used when the old table has no such column
+        'indexes': {'idx_unit_timestamp': '(unit_id, timestamp)'},
+    },
+]
+
+def setup_migrations(conn):
+    """Creates the schema version table and the per-migration copy progress table."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS migration_progress (
+            version INTEGER PRIMARY KEY,
+            last_id INTEGER NOT NULL,
+            target_id INTEGER NOT NULL,
+            rows_copied INTEGER NOT NULL,
+            started_at TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+
+def current_version(conn):
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def _mark_applied(cursor, migration):
+    cursor.execute("INSERT OR REPLACE INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                   (migration['version'], migration['name'], datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    cursor.execute("DELETE FROM migration_progress WHERE version = ?", (migration['version'],))
+
+def _source_expressions(migration, source_columns, prefix=''):
+    exprs = []
+    for column in migration['columns']:
+        if column in source_columns:
+            exprs.append(prefix + column)
+        else:
+            exprs.append(migration['defaults'][column])
+    return ', '.join(exprs)
+
+def _install_triggers(cursor, migration, shadow, source_columns):
+    """Mirrors every insert/update/delete on the live table into the shadow table."""
+    table = migration['table']
+    columns = ', '.join(migration['columns'])
+    new_values = _source_expressions(migration, source_columns, 'NEW.')
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {shadow}_ins AFTER INSERT ON {table} BEGIN
+            INSERT OR REPLACE INTO {shadow} ({columns}) VALUES ({new_values});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {shadow}_upd AFTER UPDATE ON {table} BEGIN
+            DELETE FROM {shadow} WHERE id = OLD.id;
+            INSERT OR REPLACE INTO {shadow} ({columns}) VALUES ({new_values});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {shadow}_del AFTER DELETE ON {table} BEGIN
+            DELETE FROM {shadow} WHERE id = OLD.id;
+        END
+    """)
+
+def _drop_triggers(cursor, shadow):
+    for suffix in ('ins', 'upd', 'del'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {shadow}_{suffix}")
+
+def _rename_index(cursor, old, new):
+    """Renames an index in place (SQLite has no ALTER INDEX). Run inside the cutover transaction.
+
+    Only the name changes, never the on-disk format, which is the case the SQLite docs
+    allow for writable_schema edits; the schema cookie bump makes other connections reload.
+    """
+    cursor.execute("PRAGMA schema_version")
+    version = cursor.fetchone()[0]
+    cursor.execute("PRAGMA writable_schema = ON")
+    cursor.execute("UPDATE sqlite_master SET name = ?, sql = replace(sql, ?, ?) WHERE type = 'index' AND name = ?",
+                   (new, old, new, old))
+    cursor.execute(f"PRAGMA schema_version = {version + 1}")
+    cursor.execute("PRAGMA writable_schema = OFF")
+
+def _copy_chunk(cursor, migration, shadow, select, last_id, limit):
+    """Copies the next id range; rows the triggers already mirrored are newer and are kept.
+
+    Returns (new last_id, rows inserted, done). The insert count is 0 whenever the triggers
+    already mirrored the whole range, so only `done` (no source row past last_id) ends a copy.
+    """
+    table = migration['table']
+    cursor.execute(f"SELECT MAX(id) FROM (SELECT id FROM {table} WHERE id > ? ORDER BY id LIMIT ?)",
+                   (last_id, limit))
+    upper = cursor.fetchone()[0]
+    if upper is None:
+        return last_id, 0, True
+    cursor.execute(f"""
+        INSERT OR IGNORE INTO {shadow} ({', '.join(migration['columns'])})
+        SELECT {select} FROM {table} WHERE id > ? AND id <= ?
+    """, (last_id, upper))
+    return upper, cursor.rowcount, False
+
+def rebuild_table(db_name, migration, chunk_size=MIGRATION_CHUNK_SIZE, pause=MIGRATION_PAUSE):
+    """Online rebuild of migration['table'] into its new definition. Safe to interrupt and re-run."""
+    table = migration['table']
+    shadow = f"{table}_v{migration['version']}"
+    conn = sqlite3.connect(db_name, timeout=MIGRATION_LOCK_TIMEOUT)
+    cursor = conn.cursor()
+    try:
+        source_columns = _table_columns(cursor, table)
+        select = _source_expressions(migration, source_columns)
+
+        # 1. Shadow table with its indexes (built while it is still empty, under a temporary
+        #    name), dual-write triggers and the copy bookmark, created together
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(migration['ddl'].format(table=shadow))
+        for name, columns in migration.get('indexes', {}).items():
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name}_v{migration['version']} ON {shadow} {columns}")
+        _install_triggers(cursor, migration, shadow, source_columns)
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+        cursor.execute("""
+            INSERT OR IGNORE INTO migration_progress (version, last_id, target_id, rows_copied, started_at)
+            VALUES (?, 0, ?, 0, ?)
+        """, (migration['version'], cursor.fetchone()[0], datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        conn.commit()
+
+        cursor.execute("SELECT last_id, target_id, rows_copied FROM migration_progress WHERE version = ?",
+                       (migration['version'],))
+        last_id, target_id, copied = cursor.fetchone()
+        if last_id:
+            print(f"[{datetime.now()}] MIGRATION {migration['version']}: resuming after id {last_id} ({copied} rows already copied)")
+
+        # 2. Backfill rows that existed before the triggers, one short transaction per chunk
+        started = time.time()
+        copied_this_run = 0
+        chunks = 0
+        while last_id < target_id:
+            cursor.execute("BEGIN IMMEDIATE")
+            last_id, count, done = _copy_chunk(cursor, migration, shadow, select, last_id, chunk_size)
+            copied += count
+            cursor.execute("UPDATE migration_progress SET last_id = ?, rows_copied = ? WHERE version = ?",
+                           (last_id, copied, migration['version']))
+            conn.commit()
+            if done:
+                break
+            copied_this_run += count
+            chunks += 1
+            if chunks % MIGRATION_REPORT_EVERY == 0:
+                elapsed = time.time() - started
+                print(f"[{datetime.now()}] MIGRATION {migration['version']}: id {last_id}/{target_id} "
+                      f"({100.0 * last_id / target_id:.1f}%), {copied_this_run / elapsed:.0f} rows/s")
+            time.sleep(pause)
+
+        # 3. Cutover: the only step that blocks the collector (rows past the target, drop, renames)
+        cutover_started = time.time()
+        cursor.execute("BEGIN IMMEDIATE")
+        done = False
+        while not done:
+            last_id, count, done = _copy_chunk(cursor, migration, shadow, select, last_id, chunk_size)
+            copied += count
+        _drop_triggers(cursor, shadow)
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"ALTER TABLE {shadow} RENAME TO {table}")
+        for name in migration.get('indexes', {}):
+            _rename_index(cursor, f"{name}_v{migration['version']}", name)
+        _mark_applied(cursor, migration)
+        conn.commit()
+
+        elapsed = time.time() - started
+        rate = copied_this_run / elapsed if elapsed else 0
+        print(f"[{datetime.now()}] MIGRATION {migration['version']}: {copied} rows copied "
+              f"({rate:.0f} rows/s), write pause at cutover {time.time() - cutover_started:.2f}s")
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def migrate(db_name, target=None):
+    """Applies every pending migration in version order up to `target` (default: latest)."""
+    conn = sqlite3.connect(db_name, timeout=MIGRATION_LOCK_TIMEOUT)
+    setup_migrations(conn)
+    version = current_version(conn)
+    pending = [m for m in sorted(MIGRATIONS, key=lambda m: m['version'])
+               if m['version'] > version and (target is None or m['version'] <= target)]
+    if not pending:
+        print(f"[{datetime.now()}] Schema is at version {version}, nothing to migrate.")
+        conn.close()
+        return version
+
+    for migration in pending:
+        cursor = conn.cursor()
+        needed = migration.get('needed')
+        if needed is not None and not needed(cursor):
+            _mark_applied(cursor, migration)
+            conn.commit()
+            print(f"[{datetime.now()}] MIGRATION {migration['version']} ({migration['name']}): schema already matches, recorded")
+            continue
+
+        print(f"[{datetime.now()}] MIGRATION {migration['version']} ({migration['name']}): starting")
+        if 'sql' in migration:
+            cursor.execute("BEGIN IMMEDIATE")
+            for sql in migration['sql']:
+                cursor.execute(sql)
+            _mark_applied(cursor, migration)
+            conn.commit()
+        else:
+            rebuild_table(db_name, migration)
+        version = migration['version']
+
+    conn.close()
+    print(f"[{datetime.now()}] Schema is now at version {version}")
+    return version
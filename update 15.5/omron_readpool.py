@@ -0,0 +1,96 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+
+# --- Configuration ---
+# Web requests borrow an already-open read-only connection instead of connecting,
+# reading the schema and closing every time. Connections are not tied to a thread
+# (the Flask server starts a thread per request), only to one request at a time.
+READ_POOL_SIZE = 8                 # Idle connections kept per database
+READ_CACHE_KIB = 8192              # Page cache per connection
+READ_MMAP_BYTES = 64 * 1024 * 1024 # Pages are read through the OS page cache without copying
+READ_CACHED_STATEMENTS = 256       # Prepared statements kept per connection across requests
+
+class ReadPool:
+    """Read-only connections to one database file, reopened when the file or its schema changes."""
+
+    def __init__(self, db_name, size=READ_POOL_SIZE):
+        self.path = os.path.abspath(db_name)
+        self.idle = queue.LifoQueue(maxsize=size)  # Most recently used first: its cache is warmest
+        self.opened = 0
+
+    def _identity(self):
+        st = os.stat(self.path)
+        return st.st_dev, st.st_ino
+
+    def _open(self):
+        conn = sqlite3.connect(f"file:{quote(self.path)}?mode=ro", uri=True, check_same_thread=False,
+                               cached_statements=READ_CACHED_STATEMENTS)
+        conn.execute('PRAGMA query_only=ON')
+        conn.execute(f'PRAGMA cache_size=-{READ_CACHE_KIB}')
+        conn.execute(f'PRAGMA mmap_size={READ_MMAP_BYTES}')
+        self.opened += 1
+        return [conn, self._identity(), conn.execute('PRAGMA schema_version').fetchone()[0]]
+
+    def _fresh(self, entry):
+        """False when the file was replaced (restore) or the schema changed (migration)."""
+        conn, identity, version = entry
+        try:
+            return identity == self._identity() and version == conn.execute('PRAGMA schema_version').fetchone()[0]
+        except (OSError, sqlite3.Error):
+            return False
+
+    @contextmanager
+    def connection(self):
+        try:
+            entry = self.idle.get_nowait()
+            if not self._fresh(entry):
+                entry[0].close()
+                entry = self._open()
+        except queue.Empty:
+            entry = self._open()
+
+        try:
+            yield entry[0]
+        except sqlite3.DatabaseError:
+            entry[0].close()  # Do not hand a connection in an unknown state to the next request
+            raise
+        except BaseException:
+            self._release(entry)
+            raise
+        self._release(entry)
+
+    def _release(self, entry):
+        try:
+            self.idle.put_nowait(entry)
+        except queue.Full:
+            entry[0].close()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait()[0].close()
+            except queue.Empty:
+                return
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def read_connection(db_name):
+    """Borrows a pooled read-only connection: `with read_connection(DB_NAME) as conn: ...`"""
+    path = os.path.abspath(db_name)
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, ReadPool(path))
+    return pool.connection()
+
+def close_read_pool(db_name):
+    """Closes and forgets the pool of one database (tools and tests that delete the file)."""
+    with _pools_lock:
+        pool = _pools.pop(os.path.abspath(db_name), None)
+    if pool is not None:
+        pool.close()
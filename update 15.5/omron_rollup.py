@@ -0,0 +1,293 @@
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+# --- Configuration ---
+# Rollups are kept next to the raw readings in omron.db and updated in the
+# same transaction as each INSERT, so summaries never rescan 1 Hz rows.
+ROLLUP_FIELDS = ('val_voltage', 'val_current', 'val_power_kw', 'val_energy_kwh')
+
+# Bucket start for each resolution, derived from the 'YYYY-MM-DD HH:MM:SS' text timestamp
+RESOLUTIONS = {
+    '1m': lambda ts: ts[:16] + ':00',
+    '1h': lambda ts: ts[:13] + ':00:00',
+    '1d': lambda ts: ts[:10] + ' 00:00:00',
+}
+
+# Same bucket expressions in SQL, used when rebuilding from raw rows
+_BUCKET_SQL = {
+    '1m': "substr(timestamp, 1, 16) || ':00'",
+    '1h': "substr(timestamp, 1, 13) || ':00:00'",
+    '1d': "substr(timestamp, 1, 10) || ' 00:00:00'",
+}
+
+_UPSERT = """
+    INSERT INTO rollups (resolution, unit_id, field, bucket, n, total, vmin, vmax,
+                         first_ts, first_val, last_ts, last_val, abs_total)
+    VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (resolution, unit_id, field, bucket) DO UPDATE SET
+        n = n + excluded.n,
+        total = total + excluded.total,
+        abs_total = abs_total + excluded.abs_total,
+        vmin = MIN(vmin, excluded.vmin),
+        vmax = MAX(vmax, excluded.vmax),
+        first_val = CASE WHEN excluded.first_ts < first_ts THEN excluded.first_val ELSE first_val END,
+        first_ts = MIN(first_ts, excluded.first_ts),
+        last_val = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last_val ELSE last_val END,
+        last_ts = MAX(last_ts, excluded.last_ts)
+"""
+
+def setup_rollups(conn):
+    """Creates the rollup table (one row per resolution/unit/field/bucket).
+
+    abs_total is the sum of |value|, so averages of a reversed-CT current that
+    crosses zero stay AVG(ABS(x)). NULL means unknown: a bucket that crossed
+    zero before the column existed.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rollups (
+            resolution TEXT NOT NULL,
+            unit_id TEXT NOT NULL,
+            field TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            total REAL NOT NULL,
+            vmin REAL NOT NULL,
+            vmax REAL NOT NULL,
+            first_ts TEXT NOT NULL,
+            first_val REAL NOT NULL,
+            last_ts TEXT NOT NULL,
+            last_val REAL NOT NULL,
+            abs_total REAL,
+            PRIMARY KEY (resolution, unit_id, field, bucket)
+        ) WITHOUT ROWID
+    ''')
+    if 'abs_total' not in [info[1] for info in conn.execute("PRAGMA table_info(rollups)")]:
+        # Older databases: |sum| equals the sum of |x| for every bucket that never crossed zero
+        conn.execute("ALTER TABLE rollups ADD COLUMN abs_total REAL")
+        conn.execute("UPDATE rollups SET abs_total = ABS(total) WHERE vmin >= 0 OR vmax <= 0")
+        print(f"[{datetime.now()}] ROLLUP: Added abs_total to existing buckets")
+    conn.commit()
+
+def unit_ids(cursor):
+    """Distinct unit_ids in readings, one index seek per unit instead of a DISTINCT scan of the whole index."""
+    cursor.execute("""
+        WITH RECURSIVE units(unit_id) AS (
+            SELECT MIN(unit_id) FROM readings
+            UNION ALL
+            SELECT (SELECT MIN(unit_id) FROM readings WHERE unit_id > units.unit_id) FROM units
+            WHERE units.unit_id IS NOT NULL
+        )
+        SELECT unit_id FROM units WHERE unit_id IS NOT NULL
+    """)
+    return [row[0] for row in cursor.fetchall()]
+
+def update_rollups(cursor, unit_id, reading):
+    """Folds one sample into its 1m/1h/1d buckets. Out-of-order samples keep first/last correct."""
+    ts = reading['timestamp']
+    params = []
+    for resolution, bucket_of in RESOLUTIONS.items():
+        bucket = bucket_of(ts)
+        for field in ROLLUP_FIELDS:
+            v = reading[field]
+            params.append((resolution, unit_id, field, bucket, v, v, v, ts, v, ts, v, abs(v)))
+    cursor.executemany(_UPSERT, params)
+
+def rebuild_rollups(conn, unit_id, start, end):
+    """Recomputes every bucket touching [start, end) from raw rows (after replays or corrections)."""
+    day_start = start[:10] + ' 00:00:00'
+    day_end = (datetime.strptime(end[:10], '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d 00:00:00')
+    cursor = conn.cursor()
+
+    for resolution, bucket_sql in _BUCKET_SQL.items():
+        for field in ROLLUP_FIELDS:
+            cursor.execute("""
+                DELETE FROM rollups
+                WHERE resolution = ? AND unit_id = ? AND field = ?
+                AND bucket >= ? AND bucket < ?
+            """, (resolution, unit_id, field, day_start, day_end))
+            # field comes from ROLLUP_FIELDS, never from user input
+            cursor.execute(f"""
+                INSERT INTO rollups (resolution, unit_id, field, bucket, n, total, vmin, vmax,
+                                     first_ts, first_val, last_ts, last_val, abs_total)
+                SELECT ?, g.unit_id, ?, g.bucket, g.n, g.total, g.vmin, g.vmax,
+                       g.first_ts,
+                       (SELECT {field} FROM readings r WHERE r.unit_id = g.unit_id AND r.timestamp = g.first_ts LIMIT 1),
+                       g.last_ts,
+                       (SELECT {field} FROM readings r WHERE r.unit_id = g.unit_id AND r.timestamp = g.last_ts LIMIT 1),
+                       g.abs_total
+                FROM (
+                    SELECT unit_id, {bucket_sql} AS bucket, COUNT(*) AS n, SUM({field}) AS total,
+                           SUM(ABS({field})) AS abs_total,
+                           MIN({field}) AS vmin, MAX({field}) AS vmax,
+                           MIN(timestamp) AS first_ts, MAX(timestamp) AS last_ts
+                    FROM readings
+                    WHERE unit_id = ? AND timestamp >= ? AND timestamp < ?
+                    GROUP BY bucket
+                ) g
+            """, (resolution, field, unit_id, day_start, day_end))
+    conn.commit()
+
+def catch_up_rollups(conn):
+    """Brings rollups up to date with the raw table when the collector starts.
+
+    A unit without rollups (first deploy) is rebuilt day by day from raw rows.
+    Otherwise only raw rows newer than the last folded sample are added, so
+    buckets of deadband-compressed days are never recomputed from thinned rows.
+    """
+    cursor = conn.cursor()
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    for unit_id in unit_ids(cursor):
+        cursor.execute("""
+            SELECT MAX(last_ts) FROM rollups
+            WHERE resolution = '1m' AND unit_id = ? AND field = 'val_voltage'
+        """, (unit_id,))
+        last_ts = cursor.fetchone()[0]
+
+        if last_ts is not None:
+            cursor.execute("""
+                SELECT timestamp, val_voltage, val_current, val_power_kw, val_energy_kwh
+                FROM readings
+                WHERE unit_id = ? AND timestamp > ?
+                ORDER BY timestamp ASC
+            """, (unit_id, last_ts))
+            rows = cursor.fetchall()
+            for row in rows:
+                update_rollups(cursor, unit_id, dict(zip(('timestamp',) + ROLLUP_FIELDS, row)))
+            conn.commit()
+            if rows:
+                print(f"[{datetime.now()}] ROLLUP: Folded {len(rows)} new rows for {unit_id}")
+            continue
+
+        cursor.execute("SELECT MIN(timestamp) FROM readings WHERE unit_id = ?", (unit_id,))
+        first_ts = cursor.fetchone()[0]
+        day = datetime.strptime(first_ts[:10], '%Y-%m-%d')
+        while day.strftime('%Y-%m-%d') <= now[:10]:
+            day_text = day.strftime('%Y-%m-%d')
+            rebuild_rollups(conn, unit_id, day_text, day_text)
+            print(f"[{datetime.now()}] ROLLUP: Rebuilt {unit_id} {day_text}")
+            day += timedelta(days=1)
+
+def get_rollups(conn, resolution, unit_id, field, start, end):
+    """Returns bucket rows for [start, end) as dicts: bucket, n, avg, abs_avg, min, max, first, last."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT bucket, n, total, vmin, vmax, first_val, last_val, abs_total
+        FROM rollups
+        WHERE resolution = ? AND unit_id = ? AND field = ?
+        AND bucket >= ? AND bucket < ?
+        ORDER BY bucket ASC
+    """, (resolution, unit_id, field, start, end))
+    return [{
+        'bucket': row[0],
+        'n': row[1],
+        'avg': row[2] / row[1] if row[1] else 0,
+        # Mean of |value|; |mean| is only the fallback for zero-crossing buckets from before abs_total
+        'abs_avg': (row[7] if row[7] is not None else abs(row[2])) / row[1] if row[1] else 0,
+        'min': row[3],
+        'max': row[4],
+        'first': row[5],
+        'last': row[6],
+    } for row in cursor.fetchall()]
+
+def get_rollup_history(conn, resolution, unit_id, start, end):
+    """Returns rollup buckets in [start, end) shaped like readings rows (bucket averages).
+
+    Each row also carries <field>_min / <field>_max so peaks are not lost.
+    """
+    rows = {}
+    for field in ROLLUP_FIELDS:
+        for r in get_rollups(conn, resolution, unit_id, field, start, end):
+            row = rows.setdefault(r['bucket'], {'id': None, 'timestamp': r['bucket'], 'unit_id': unit_id, 'resolution': resolution})
+            row[field] = round(r['avg'], 4)
+            row[f"{field}_min"] = r['min']
+            row[f"{field}_max"] = r['max']
+    return [rows[bucket] for bucket in sorted(rows)]
+
+def get_rollup_buckets(conn, resolution, units, start, end, origin, width):
+    """Regroups one rollup tier into `width`-second buckets counted from epoch `origin`, in SQL.
+
+    Returns {unit_id: readings-shaped rows} with <field> (mean) and <field>_min/_max/_first/_last,
+    all units from one statement. `width` should be a multiple of the tier's bucket size so no
+    rollup row straddles two buckets.
+    """
+    # first_ts/last_ts are raw timestamps, so the rollup row holding them is a primary key lookup
+    first_bucket = _BUCKET_SQL[resolution].replace('timestamp', 'g.first_ts')
+    last_bucket = _BUCKET_SQL[resolution].replace('timestamp', 'g.last_ts')
+    params = {'origin': int(origin), 'width': int(width), 'resolution': resolution, 'start': start, 'end': end}
+    params.update({f"u{i}": unit_id for i, unit_id in enumerate(units)})
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        WITH g AS (
+            SELECT unit_id, field, (CAST(strftime('%s', bucket) AS INTEGER) - :origin) / :width AS b,
+                   SUM(n) AS n, SUM(total) AS total, MIN(vmin) AS vmin, MAX(vmax) AS vmax,
+                   MIN(first_ts) AS first_ts, MAX(last_ts) AS last_ts
+            FROM rollups
+            WHERE resolution = :resolution AND unit_id IN ({', '.join(f":u{i}" for i in range(len(units)))})
+            AND bucket >= :start AND bucket < :end
+            GROUP BY unit_id, field, b
+        )
+        SELECT g.unit_id, datetime(:origin + g.b * :width, 'unixepoch'), g.field, g.n, g.total, g.vmin, g.vmax,
+               (SELECT first_val FROM rollups r
+                WHERE r.resolution = :resolution AND r.unit_id = g.unit_id AND r.field = g.field AND r.bucket = {first_bucket}),
+               (SELECT last_val FROM rollups r
+                WHERE r.resolution = :resolution AND r.unit_id = g.unit_id AND r.field = g.field AND r.bucket = {last_bucket})
+        FROM g
+    """, params)
+
+    rows = {unit_id: {} for unit_id in units}
+    for unit_id, bucket, field, n, total, vmin, vmax, first, last in cursor:
+        row = rows[unit_id].setdefault(bucket, {'id': None, 'timestamp': bucket, 'unit_id': unit_id, 'resolution': resolution, 'n': n})
+        row[field] = round(total / n, 4) if n else 0
+        row[f"{field}_min"] = vmin
+        row[f"{field}_max"] = vmax
+        row[f"{field}_first"] = first
+        row[f"{field}_last"] = last
+    return {unit_id: [buckets[b] for b in sorted(buckets)] for unit_id, buckets in rows.items()}
+
+def promote_expiring_days(conn, cutoff):
+    """Makes sure every raw day older than `cutoff` has rollups before retention deletes it."""
+    cursor = conn.cursor()
+    for unit_id in unit_ids(cursor):
+        cursor.execute("SELECT MIN(timestamp) FROM readings WHERE unit_id = ?", (unit_id,))
+        day = datetime.strptime(cursor.fetchone()[0][:10], '%Y-%m-%d')
+        while day.strftime('%Y-%m-%d') < cutoff[:10]:
+            day_text = day.strftime('%Y-%m-%d')
+            cursor.execute("""
+                SELECT 1 FROM rollups
+                WHERE resolution = '1d' AND unit_id = ? AND field = 'val_voltage' AND bucket = ?
+            """, (unit_id, day_text + ' 00:00:00'))
+            if cursor.fetchone() is None:
+                rebuild_rollups(conn, unit_id, day_text, day_text)
+                print(f"[{datetime.now()}] ROLLUP: Promoted {unit_id} {day_text} before retention")
+            day += timedelta(days=1)
+
+def cleanup_rollups(conn, resolution, days, batch_size=1000, pause=0.2):
+    """Deletes buckets of one resolution older than `days` in small batches. Returns rows deleted."""
+    cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT unit_id FROM rollups WHERE resolution = ?", (resolution,))
+    deleted = 0
+    for (unit_id,) in cursor.fetchall():
+        for field in ROLLUP_FIELDS:
+            while True:
+                cursor.execute("""
+                    DELETE FROM rollups
+                    WHERE resolution = ? AND unit_id = ? AND field = ? AND bucket IN (
+                        SELECT bucket FROM rollups
+                        WHERE resolution = ? AND unit_id = ? AND field = ? AND bucket < ?
+                        ORDER BY bucket LIMIT ?
+                    )
+                """, (resolution, unit_id, field, resolution, unit_id, field, cutoff, batch_size))
+                conn.commit()
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    break
+                time.sleep(pause)
+    return deleted
+
+if __name__ == "__main__":
+    # Manual catch-up after restoring or editing raw data: python omron_rollup.py
+    with sqlite3.connect('omron.db') as conn:
+        setup_rollups(conn)
+        catch_up_rollups(conn)
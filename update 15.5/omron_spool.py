@@ -0,0 +1,162 @@
+import glob
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+# --- Configuration ---
+# When omron.db is locked (migrations, fixDB.py, long checkpoints) samples are
+# appended to this file instead of being dropped, then replayed in order.
+SPOOL_PATH = 'omron_spool.bin'
+SPOOL_FSYNC_EVERY = 10      # fsync after this many records...
+SPOOL_FSYNC_INTERVAL = 5.0  # ...or this many seconds, whichever comes first
+SPOOL_REPLAY_INTERVAL = 2.0 # How often the replayer retries the database
+SPOOL_BATCH_KEEP_DAYS = 7   # Replayed-batch markers older than this are forgotten
+
+FIELDS = ('val_voltage', 'val_current', 'val_power_kw', 'val_energy_kwh')
+# timestamp, unit_id, keep_raw flag, 4 values; every record is followed by its CRC32
+RECORD = struct.Struct('<19s8s?4d')
+CRC = struct.Struct('<I')
+RECORD_SIZE = RECORD.size + CRC.size
+
+def setup_spool(conn):
+    """Creates the replayed-batch markers that make spool replay idempotent."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS spool_batches (
+            batch TEXT PRIMARY KEY,
+            records INTEGER NOT NULL,
+            quarantined INTEGER NOT NULL,
+            replayed_at TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+
+def batch_replayed(cursor, batch):
+    cursor.execute("SELECT 1 FROM spool_batches WHERE batch = ?", (batch,))
+    return cursor.fetchone() is not None
+
+def mark_replayed(cursor, batch, records, quarantined):
+    """Records a batch as applied; call inside the transaction that wrote its rows."""
+    now = datetime.now()
+    cursor.execute("INSERT INTO spool_batches (batch, records, quarantined, replayed_at) VALUES (?, ?, ?, ?)",
+                   (batch, records, quarantined, now.strftime('%Y-%m-%d %H:%M:%S')))
+    cursor.execute("DELETE FROM spool_batches WHERE replayed_at < ?",
+                   ((now - timedelta(days=SPOOL_BATCH_KEEP_DAYS)).strftime('%Y-%m-%d %H:%M:%S'),))
+
+def pack_record(unit_id, reading, keep_raw):
+    payload = RECORD.pack(reading['timestamp'].encode(), unit_id.encode(), keep_raw,
+                          *(reading[field] for field in FIELDS))
+    return payload + CRC.pack(zlib.crc32(payload))
+
+class Spool:
+    """Append-only, CRC-checked record file. Safe to share between the collector and the replayer."""
+
+    def __init__(self, path=SPOOL_PATH):
+        self.path = path
+        self.quarantine_path = path + '.quarantine'
+        self.lock = threading.Lock()
+        self.file = None
+        self.unsynced = 0
+        self.last_sync = time.time()
+
+    def pending(self):
+        """True while any spooled sample has not yet reached the database."""
+        with self.lock:
+            return self._has_data(self.path) or bool(self._replay_files())
+
+    def append(self, unit_id, reading, keep_raw=True):
+        record = pack_record(unit_id, reading, keep_raw)
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, 'ab')
+            self.file.write(record)
+            self.file.flush()  # Visible to pending()/replay() at once; fsync still happens in batches
+            self.unsynced += 1
+            if self.unsynced >= SPOOL_FSYNC_EVERY or time.time() - self.last_sync >= SPOOL_FSYNC_INTERVAL:
+                self._sync()
+
+    def replay(self, write_batch):
+        """Hands the oldest spooled batch to write_batch(batch, records, quarantine) in order.
+
+        Each batch file has a unique name. write_batch must commit the batch name together
+        with its rows (see mark_replayed) and skip a batch it has already applied, so a crash
+        before the file is removed never writes a sample twice. Returns the number of records.
+        """
+        with self.lock:
+            files = self._replay_files()
+            if not files:
+                if not self._has_data(self.path):
+                    return 0
+                # New samples keep appending to a fresh file while this batch is replayed
+                if self.file:
+                    self._sync()
+                    self.file.close()
+                    self.file = None
+                files = [f"{self.path}.{time.time_ns()}.replaying"]
+                os.replace(self.path, files[0])
+
+        records = list(read_records(files[0]))
+        if records:
+            # Raises if the database is still locked; the file is kept for the next try
+            write_batch(os.path.basename(files[0]), records, self.quarantine)
+        os.remove(files[0])
+        return len(records)
+
+    def quarantine(self, unit_id, reading, keep_raw, error):
+        """Sets aside a record the database rejects so it does not block every later replay."""
+        print(f"[{datetime.now()}] SPOOL: Quarantined {unit_id} {reading['timestamp']} ({error})")
+        with open(self.quarantine_path, 'ab') as f:
+            f.write(pack_record(unit_id, reading, keep_raw))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self._sync()
+                self.file.close()
+                self.file = None
+
+    def _sync(self):
+        if self.file:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.time()
+
+    def _replay_files(self):
+        # Oldest first; the names sort by the time the batch was cut
+        return sorted(glob.glob(glob.escape(self.path) + '*.replaying'))
+
+    @staticmethod
+    def _has_data(path):
+        return os.path.exists(path) and os.path.getsize(path) > 0
+
+def read_records(path):
+    """Yields (unit_id, reading, keep_raw) in file order. A torn or corrupt tail (crash mid-write) is skipped."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+        payload = data[offset:offset + RECORD.size]
+        (crc,) = CRC.unpack_from(data, offset + RECORD.size)
+        if zlib.crc32(payload) != crc:
+            print(f"[{datetime.now()}] SPOOL: Skipping corrupt record at byte {offset}")
+            continue
+        ts, unit_id, keep_raw, *values = RECORD.unpack(payload)
+        reading = {'timestamp': ts.decode(), **dict(zip(FIELDS, values))}
+        yield unit_id.rstrip(b'\0').decode(), reading, keep_raw
+
+def run_replayer(spool, write_batch, stop_event=None):
+    """Background loop: merges the spool into the database once the lock clears."""
+    while stop_event is None or not stop_event.is_set():
+        time.sleep(SPOOL_REPLAY_INTERVAL)
+        if not spool.pending():
+            continue
+        try:
+            count = spool.replay(write_batch)
+            if count:
+                print(f"[{datetime.now()}] --- SPOOL: Replayed {count} samples into the database ---")
+        except Exception as e:
+            print(f"[{datetime.now()}] SPOOL: Database still unavailable ({e}), will retry")
@@ -0,0 +1,351 @@
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+from omron_rollup import RESOLUTIONS, ROLLUP_FIELDS, get_rollups
+from omron_readpool import read_connection, close_read_pool
+
+try:
+    import duckdb
+except ImportError:  # Optional analytical engine; the SQLite and memory backends need nothing extra
+    duckdb = None
+
+# --- Configuration ---
+DB_NAME = 'omron.db'
+STORAGE_BACKEND = 'sqlite'  # Backend used by the web gateway and the nightly summary
+
+FIELDS = ROLLUP_FIELDS
+TS_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+class StorageBackend(ABC):
+    """Operations the collector, web gateway and summary job need from storage.
+
+    Rows are dicts shaped like the readings table; aggregate() returns the same
+    bucket dicts as omron_rollup.get_rollups (bucket, n, avg, abs_avg, min, max, first, last).
+    """
+
+    name = 'base'
+    aggregate_source = 'raw'  # 'raw': computed from readings per call; 'rollups': read from maintained buckets
+
+    def setup(self):
+        pass
+
+    @abstractmethod
+    def append_batch(self, records):
+        """Stores [(unit_id, reading), ...] in one transaction."""
+
+    @abstractmethod
+    def latest(self, unit_id):
+        """The newest reading of a unit, or None."""
+
+    @abstractmethod
+    def range_scan(self, unit_id, start, end):
+        """Readings in [start, end), oldest first."""
+
+    @abstractmethod
+    def aggregate(self, unit_id, field, resolution, start, end):
+        """Buckets of `resolution` ('1m', '1h', '1d') whose start lies in [start, end)."""
+
+    @abstractmethod
+    def retain(self, days, now=None):
+        """Deletes readings older than `days` before `now` (default: the current time). Returns the number of rows removed."""
+
+    def close(self):
+        pass
+
+class SQLiteBackend(StorageBackend):
+    """The production omron.db schema: readings plus incrementally maintained rollups.
+
+    The write helpers live in omron_database, which pulls in the Modbus client; they are
+    imported on first use so readers (web gateway, summary job) never load it.
+    """
+
+    name = 'sqlite'
+    aggregate_source = 'rollups'
+
+    def __init__(self, db_name=DB_NAME, cleanup_pause=None):
+        self.db_name = db_name
+        self.cleanup_pause = cleanup_pause  # None: omron_database.CLEANUP_PAUSE
+
+    def setup(self):
+        from omron_database import setup_database
+        setup_database(self.db_name)
+
+    def append_batch(self, records):
+        from omron_database import store_reading
+        conn = sqlite3.connect(self.db_name)
+        try:
+            cursor = conn.cursor()
+            for unit_id, reading in records:
+                store_reading(cursor, unit_id, reading)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def latest(self, unit_id):
+        with read_connection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            row = cursor.execute("""
+                SELECT * FROM readings
+                WHERE unit_id = ?
+                ORDER BY timestamp DESC LIMIT 1
+            """, (unit_id,)).fetchone()
+            return dict(row) if row else None
+
+    def range_scan(self, unit_id, start, end):
+        with read_connection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            rows = cursor.execute("""
+                SELECT * FROM readings
+                WHERE unit_id = ? AND timestamp >= ? AND timestamp < ?
+                ORDER BY timestamp ASC
+            """, (unit_id, start, end)).fetchall()
+            return [dict(row) for row in rows]
+
+    def aggregate(self, unit_id, field, resolution, start, end):
+        with read_connection(self.db_name) as conn:
+            return get_rollups(conn, resolution, unit_id, field, start, end)
+
+    def retain(self, days, now=None):
+        from omron_database import cleanup_old_data, CLEANUP_PAUSE
+        pause = CLEANUP_PAUSE if self.cleanup_pause is None else self.cleanup_pause
+        return cleanup_old_data(days, self.db_name, pause=pause, now=now)['rows_deleted']
+
+    def close(self):
+        close_read_pool(self.db_name)
+
+class MemoryBackend(StorageBackend):
+    """Per-unit sorted lists in process memory. Nothing survives a restart; used as a baseline and in tools."""
+
+    name = 'memory'
+
+    def __init__(self):
+        self.stamps = {}  # unit_id -> sorted timestamps
+        self.rows = {}    # unit_id -> rows in the same order
+        self.next_id = 1
+
+    def append_batch(self, records):
+        for unit_id, reading in records:
+            row = {'id': self.next_id, 'timestamp': reading['timestamp'], 'unit_id': unit_id,
+                   **{field: reading[field] for field in FIELDS}}
+            self.next_id += 1
+            stamps = self.stamps.setdefault(unit_id, [])
+            rows = self.rows.setdefault(unit_id, [])
+            if not stamps or stamps[-1] <= row['timestamp']:
+                stamps.append(row['timestamp'])
+                rows.append(row)
+            else:
+                i = bisect_left(stamps, row['timestamp'])
+                insort(stamps, row['timestamp'])
+                rows.insert(i, row)
+
+    def latest(self, unit_id):
+        rows = self.rows.get(unit_id)
+        return dict(rows[-1]) if rows else None
+
+    def range_scan(self, unit_id, start, end):
+        stamps = self.stamps.get(unit_id, [])
+        lo, hi = bisect_left(stamps, start), bisect_left(stamps, end)
+        return [dict(row) for row in self.rows[unit_id][lo:hi]] if hi > lo else []
+
+    def aggregate(self, unit_id, field, resolution, start, end):
+        bucket_of = RESOLUTIONS[resolution]
+        buckets = {}
+        stamps = self.stamps.get(unit_id, [])
+        # Rows in the first bucket can start before `start`; the bucket key is what is filtered
+        lo = bisect_left(stamps, bucket_of(start if len(start) > 10 else start + ' 00:00:00'))
+        for row in self.rows.get(unit_id, [])[lo:]:
+            bucket = bucket_of(row['timestamp'])
+            if bucket >= end:
+                break
+            if bucket < start:
+                continue
+            value = row[field]
+            b = buckets.get(bucket)
+            if b is None:
+                buckets[bucket] = {'bucket': bucket, 'n': 1, 'total': value, 'abs_total': abs(value),
+                                   'min': value, 'max': value, 'first': value, 'last': value}
+            else:
+                b['n'] += 1
+                b['total'] += value
+                b['abs_total'] += abs(value)
+                b['min'] = min(b['min'], value)
+                b['max'] = max(b['max'], value)
+                b['last'] = value
+        result = []
+        for bucket in sorted(buckets):
+            b = buckets[bucket]
+            b['avg'] = b.pop('total') / b['n']
+            b['abs_avg'] = b.pop('abs_total') / b['n']
+            result.append(b)
+        return result
+
+    def retain(self, days, now=None):
+        cutoff = ((now or datetime.now()) - timedelta(days=days)).strftime(TS_FORMAT)
+        removed = 0
+        for unit_id, stamps in self.stamps.items():
+            i = bisect_left(stamps, cutoff)
+            del stamps[:i]
+            del self.rows[unit_id][:i]
+            removed += i
+        return removed
+
+class DuckDBBackend(StorageBackend):
+    """Embedded columnar engine (pip install duckdb); aggregates are computed from raw rows at query time."""
+
+    name = 'duckdb'
+
+    def __init__(self, db_name='omron.duckdb'):
+        if duckdb is None:
+            raise RuntimeError("duckdb is not installed")
+        self.conn = duckdb.connect(db_name)
+        self.next_id = None
+
+    def setup(self):
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS readings (
+                id BIGINT, timestamp VARCHAR, {', '.join(f'{field} DOUBLE' for field in FIELDS)}, unit_id VARCHAR
+            )
+        """)
+        self.next_id = (self.conn.execute("SELECT MAX(id) FROM readings").fetchone()[0] or 0) + 1
+
+    def append_batch(self, records):
+        rows = []
+        for unit_id, reading in records:
+            rows.append((self.next_id, reading['timestamp'], *(reading[field] for field in FIELDS), unit_id))
+            self.next_id += 1
+        self.conn.executemany(f"INSERT INTO readings VALUES ({', '.join('?' * (len(FIELDS) + 3))})", rows)
+
+    def _dicts(self, cursor):
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def latest(self, unit_id):
+        rows = self._dicts(self.conn.execute(
+            "SELECT * FROM readings WHERE unit_id = ? ORDER BY timestamp DESC LIMIT 1", [unit_id]))
+        return rows[0] if rows else None
+
+    def range_scan(self, unit_id, start, end):
+        return self._dicts(self.conn.execute("""
+            SELECT * FROM readings
+            WHERE unit_id = ? AND timestamp >= ? AND timestamp < ?
+            ORDER BY timestamp
+        """, [unit_id, start, end]))
+
+    def aggregate(self, unit_id, field, resolution, start, end):
+        bucket_sql = {
+            '1m': "substr(timestamp, 1, 16) || ':00'",
+            '1h': "substr(timestamp, 1, 13) || ':00:00'",
+            '1d': "substr(timestamp, 1, 10) || ' 00:00:00'",
+        }[resolution]
+        # field is one of FIELDS, never user input
+        return self._dicts(self.conn.execute(f"""
+            SELECT bucket, n, avg, abs_avg, min, max, first, last FROM (
+                SELECT {bucket_sql} AS bucket, COUNT(*) AS n, AVG({field}) AS avg, AVG(ABS({field})) AS abs_avg,
+                       MIN({field}) AS min, MAX({field}) AS max,
+                       arg_min({field}, timestamp) AS first, arg_max({field}, timestamp) AS last
+                FROM readings
+                WHERE unit_id = ? AND timestamp >= ? AND timestamp < ?
+                GROUP BY bucket
+            ) WHERE bucket >= ? ORDER BY bucket
+        """, [unit_id, start[:10], end, start]))
+
+    def retain(self, days, now=None):
+        cutoff = ((now or datetime.now()) - timedelta(days=days)).strftime(TS_FORMAT)
+        count = self.conn.execute("SELECT COUNT(*) FROM readings WHERE timestamp < ?", [cutoff]).fetchone()[0]
+        self.conn.execute("DELETE FROM readings WHERE timestamp < ?", [cutoff])
+        return count
+
+    def close(self):
+        self.conn.close()
+
+BACKENDS = {
+    'sqlite': SQLiteBackend,
+    'memory': MemoryBackend,
+    'duckdb': DuckDBBackend,
+}
+
+def get_backend(name=STORAGE_BACKEND, **kwargs):
+    return BACKENDS[name](**kwargs)
+
+# --- Benchmark harness ---
+
+def _workload(hours, units=('unit01', 'unit02')):
+    """Deterministic 1 Hz samples ending now, shaped like the collector's readings."""
+    rng = random.Random(42)
+    end = datetime.now().replace(microsecond=0)
+    t = end - timedelta(hours=hours)
+    energy = {unit_id: 100.0 for unit_id in units}
+    records = []
+    while t < end:
+        ts = t.strftime(TS_FORMAT)
+        for unit_id in units:
+            current = round(rng.uniform(0, 10), 3)
+            energy[unit_id] += current * 0.2 / 3600
+            records.append((unit_id, {
+                'timestamp': ts, 'val_voltage': round(rng.uniform(199, 201), 1), 'val_current': current,
+                'val_power_kw': round(current * 0.2, 3), 'val_energy_kwh': round(energy[unit_id], 4),
+            }))
+        t += timedelta(seconds=1)
+    return records, end
+
+def _timed(fn, repeat=1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) / repeat, result
+
+def benchmark(names=None, hours=6, batch=60):
+    """Runs the same workload against each backend and prints one line of timings per backend.
+
+    Retention runs without the production pause between batches and against one cutoff
+    (`hours / 2` before the workload's end) for every backend. 'aggregate_from' tells a
+    rollup lookup (sqlite) apart from buckets computed from the raw rows.
+    """
+    names = names or [name for name in BACKENDS if name != 'duckdb' or duckdb is not None]
+    records, end = _workload(hours)
+    end_ts = end.strftime(TS_FORMAT)
+    window_start = (end - timedelta(hours=1)).strftime(TS_FORMAT)
+    day_start = (end - timedelta(hours=hours)).strftime('%Y-%m-%d')
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in names:
+            kwargs = {'db_name': os.path.join(tmp, f"bench_{name}.db")} if name != 'memory' else {}
+            if name == 'sqlite':
+                kwargs['cleanup_pause'] = 0
+            backend = get_backend(name, **kwargs)
+            backend.setup()
+
+            append_s, _ = _timed(lambda: [backend.append_batch(records[i:i + batch])
+                                          for i in range(0, len(records), batch)])
+            latest_s, _ = _timed(lambda: backend.latest('unit01'), repeat=200)
+            scan_s, rows = _timed(lambda: backend.range_scan('unit01', window_start, end_ts), repeat=5)
+            agg_s, buckets = _timed(lambda: backend.aggregate('unit01', 'val_current', '1h', day_start, end_ts), repeat=5)
+            retain_s, removed = _timed(lambda: backend.retain(hours / 48, now=end))
+            backend.close()
+
+            results[name] = {
+                'append_rows_per_s': int(len(records) / append_s),
+                'latest_ms': round(latest_s * 1000, 3),
+                'scan_1h_ms': round(scan_s * 1000, 2),
+                'scan_rows': len(rows),
+                'aggregate_1h_ms': round(agg_s * 1000, 2),
+                'aggregate_from': backend.aggregate_source,
+                'buckets': len(buckets),
+                'retention_s': round(retain_s, 2),
+                'rows_removed': removed,
+            }
+            print(f"[{datetime.now()}] STORAGE BENCHMARK {name}: {results[name]}")
+    return results
+
+if __name__ == "__main__":
+    # python omron_storage.py  -> compares every available backend on 6 hours of 1 Hz data
+    benchmark()
@@ -1,13 +1,16 @@
 import sqlite3
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from collections import namedtuple
+from omron_storage import get_backend
 
 # --- Configuration ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_MAIN = os.path.join(BASE_DIR, 'omron.db')
 DB_SUB = os.path.join(BASE_DIR, 'summary.db')
 
+storage = get_backend('sqlite', db_name=DB_MAIN)
+
 # Represents the aggregated data for the sub-database
 # kwh = daily delta (usage), kwh_total = absolute meter reading
 DailySummary = namedtuple('DailySummary', ['date', 'u1_avg_a', 'u1_kwh', 'u1_kwh_total', 'u2_avg_a', 'u2_kwh', 'u2_kwh_total'])
@@ -28,26 +31,21 @@ def init_sub_db():
         """)
 
 def get_daily_stats(unit_id, target_date):
-    """Queries main DB and returns aggregated stats for a specific unit."""
-    with sqlite3.connect(DB_MAIN) as conn:
-        cursor = conn.cursor()
-        # Query 1: Average and Delta Usage
-        # Query 2: Max Reading (Accumulated total)
-        query = """
-            SELECT AVG(ABS(val_current)), 
-                   MAX(val_energy_kwh) - MIN(val_energy_kwh),
-                   MAX(val_energy_kwh)
-            FROM readings 
-            WHERE unit_id = ? AND timestamp LIKE ?
-        """
-        cursor.execute(query, (unit_id, f"{target_date}%"))
-        row = cursor.fetchone()
-        
-        return {
-            'avg_a': round(row[0] or 0, 2),
-            'kwh_delta': round(row[1] or 0, 3),
-            'kwh_total': round(row[2] or 0, 3)
-        }
+    """Reads the 1d rollup buckets of the main DB and returns aggregated stats for a specific unit."""
+    next_day = (datetime.strptime(target_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    # Average |current| (abs sum / count) and Delta Usage (Max - Min) / Max Reading (Accumulated total)
+    current = storage.aggregate(unit_id, 'val_current', '1d', target_date, next_day)
+    energy = storage.aggregate(unit_id, 'val_energy_kwh', '1d', target_date, next_day)
+
+    avg_a = current[0]['abs_avg'] if current else 0
+    kwh_delta = energy[0]['max'] - energy[0]['min'] if energy else 0
+    kwh_total = energy[0]['max'] if energy else 0
+
+    return {
+        'avg_a': round(avg_a, 2),
+        'kwh_delta': round(kwh_delta, 3),
+        'kwh_total': round(kwh_total, 3)
+    }
 
 def save_summary(summary):
     """Saves the DailySummary namedtuple into the sub-database."""
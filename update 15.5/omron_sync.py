@@ -0,0 +1,279 @@
+import gzip
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import struct
+import sys
+import time
+from datetime import datetime
+
+from omron_changes import READINGS_COLUMNS, iter_change_batches
+
+# --- Configuration ---
+# Each Pi runs a sync agent that ships readings above its high-water mark to a
+# central aggregator in gzipped JSON batches. The aggregator keys rows by
+# (site_id, source id), so a batch that arrives twice changes nothing, and an
+# agent that was offline simply sends larger batches until it has caught up.
+#
+# Only inserts are shipped: a row is sent once, when its id passes the mark. Rows
+# rewritten in place afterwards (omron_corrections jobs) are NOT sent again, so the
+# aggregator keeps their original values; re-run the same correction there.
+#
+# A site whose omron.db was recreated restarts its ids below the aggregator's mark.
+# The agent detects this, warns, and moves the readings id sequence past the mark so
+# new rows are shipped; rows already in the new database at that point stay local.
+SITE_ID = socket.gethostname()
+SYNC_BATCH_ROWS = 20000
+SYNC_INTERVAL = 60            # Seconds between agent runs once caught up
+CENTRAL_DB = 'central.db'
+
+_LENGTH = struct.Struct('>I')
+
+# --- Batch format ---
+
+def encode_batch(site_id, rows):
+    return gzip.compress(json.dumps({
+        'site': site_id,
+        'columns': READINGS_COLUMNS,
+        'first_id': rows[0][0],
+        'last_id': rows[-1][0],
+        'rows': rows,
+    }, separators=(',', ':')).encode())
+
+def decode_batch(data):
+    return json.loads(gzip.decompress(data))
+
+# --- Agent (runs next to the collector on every Pi) ---
+
+def setup_sync_state(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            target TEXT PRIMARY KEY,
+            hwm INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+
+def _local_hwm(conn, target):
+    row = conn.execute("SELECT hwm FROM sync_state WHERE target = ?", (target,)).fetchone()
+    return row[0] if row else 0
+
+def _save_hwm(conn, target, hwm):
+    conn.execute("INSERT OR REPLACE INTO sync_state (target, hwm, updated_at) VALUES (?, ?, ?)",
+                 (target, hwm, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    conn.commit()
+
+def _check_id_space(conn, hwm):
+    """Moves the readings id sequence past `hwm` when the local ids restarted below it (database recreated)."""
+    local_max = conn.execute("SELECT MAX(id) FROM readings").fetchone()[0] or 0
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'readings'").fetchone()
+    if max(local_max, seq[0] if seq else 0) >= hwm:
+        return
+    print(f"[{datetime.now()}] SYNC WARNING: local ids end at {local_max} but the mark is {hwm} "
+          f"(database recreated?); {local_max} local rows are not shipped, new rows start after {hwm}")
+    if seq:
+        conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'readings'", (hwm,))
+    else:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('readings', ?)", (hwm,))
+    conn.commit()
+
+def sync_once(db_name, transport, site_id=SITE_ID, batch_rows=SYNC_BATCH_ROWS):
+    """Ships every change after the acknowledged high-water mark. Returns rows shipped."""
+    conn = sqlite3.connect(db_name, timeout=5)
+    try:
+        setup_sync_state(conn)
+        hwm = _local_hwm(conn, transport.name)
+        # The aggregator's mark wins when it knows more (e.g. the local state was lost)
+        remote = transport.hwm(site_id)
+        if remote is not None and remote > hwm:
+            hwm = remote
+        _check_id_space(conn, hwm)
+
+        shipped = 0
+        started = time.time()
+        # The change feed cursor is readings.id, the same value the aggregator acknowledges
+        for rows, cursor in iter_change_batches(db_name, hwm, batch_rows):
+            acked = transport.send(site_id, encode_batch(site_id, [[row[c] for c in READINGS_COLUMNS] for row in rows]))
+            hwm = acked if acked is not None else cursor
+            _save_hwm(conn, transport.name, hwm)
+            shipped += len(rows)
+
+        if shipped:
+            print(f"[{datetime.now()}] --- SYNC: {shipped} rows to {transport.name} "
+                  f"(hwm {hwm}, {time.time() - started:.1f}s) ---")
+        return shipped
+    finally:
+        conn.close()
+
+def run_agent(db_name, transport, site_id=SITE_ID):
+    """Agent loop: catches up in full batches, then ships new rows every SYNC_INTERVAL seconds."""
+    while True:
+        try:
+            sync_once(db_name, transport, site_id)
+        except (OSError, sqlite3.Error) as e:
+            print(f"[{datetime.now()}] SYNC: {transport.name} unavailable ({e}), will retry")
+        time.sleep(SYNC_INTERVAL)
+
+class FileTransport:
+    """Drops each batch as a file into an outbox (a shared folder, rsync target or USB stick)."""
+
+    def __init__(self, outbox):
+        self.outbox = outbox
+        self.name = f"file:{os.path.abspath(outbox)}"
+
+    def hwm(self, site_id):
+        return None  # One-way transport: the agent's own mark is authoritative
+
+    def send(self, site_id, data):
+        os.makedirs(self.outbox, exist_ok=True)
+        batch = decode_batch(data)
+        name = f"{site_id}_{batch['first_id']:012d}_{batch['last_id']:012d}.json.gz"
+        tmp_path = os.path.join(self.outbox, name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.outbox, name))  # The aggregator only picks up complete files
+        return batch['last_id']
+
+class SocketTransport:
+    """Length-prefixed request/acknowledge over a Unix socket (local tests, SSH-forwarded sockets)."""
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self.name = f"socket:{path}"
+
+    def _request(self, message):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            _send_message(sock, message)
+            return json.loads(_recv_message(sock))
+
+    def hwm(self, site_id):
+        return self._request(json.dumps({'hwm': site_id}).encode())['hwm']
+
+    def send(self, site_id, data):
+        return self._request(data)['hwm']
+
+def _send_message(sock, data):
+    sock.sendall(_LENGTH.pack(len(data)) + data)
+
+def _recv_exact(sock, count):
+    buf = bytearray()
+    while len(buf) < count:
+        chunk = sock.recv(count - len(buf))
+        if not chunk:
+            raise ConnectionError("connection closed mid-message")
+        buf += chunk
+    return bytes(buf)
+
+def _recv_message(sock):
+    (length,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    return _recv_exact(sock, length)
+
+# --- Aggregator (central store for all sites) ---
+
+def setup_central(conn):
+    """Creates the merged readings table keyed by site and source id, plus per-site marks."""
+    conn.execute('PRAGMA journal_mode=WAL;')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS site_readings (
+            site_id TEXT NOT NULL,
+            source_id INTEGER NOT NULL,
+            timestamp TEXT NOT NULL,
+            val_voltage REAL NOT NULL,
+            val_current REAL NOT NULL,
+            val_power_kw REAL NOT NULL,
+            val_energy_kwh REAL NOT NULL,
+            unit_id TEXT NOT NULL,
+            PRIMARY KEY (site_id, source_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_site_unit_timestamp ON site_readings (site_id, unit_id, timestamp)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sites (
+            site_id TEXT PRIMARY KEY,
+            hwm INTEGER NOT NULL,
+            rows_received INTEGER NOT NULL,
+            last_seen TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+
+def central_hwm(conn, site_id):
+    row = conn.execute("SELECT hwm FROM sites WHERE site_id = ?", (site_id,)).fetchone()
+    return row[0] if row else 0
+
+def ingest_batch(conn, batch):
+    """Merges one decoded batch. Re-delivered rows are ignored. Returns the site's new high-water mark."""
+    site_id = batch['site']
+    cursor = conn.cursor()
+    cursor.executemany("""
+        INSERT OR IGNORE INTO site_readings
+            (site_id, source_id, timestamp, val_voltage, val_current, val_power_kw, val_energy_kwh, unit_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(site_id, *row) for row in batch['rows']])
+    inserted = cursor.rowcount
+    cursor.execute("""
+        INSERT INTO sites (site_id, hwm, rows_received, last_seen) VALUES (?, ?, ?, ?)
+        ON CONFLICT (site_id) DO UPDATE SET
+            hwm = MAX(hwm, excluded.hwm),
+            rows_received = rows_received + excluded.rows_received,
+            last_seen = excluded.last_seen
+    """, (site_id, batch['last_id'], inserted, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    conn.commit()
+    return central_hwm(conn, site_id)
+
+def ingest_directory(conn, inbox):
+    """Merges every complete batch file in `inbox` in id order and removes it. Returns rows seen."""
+    total = 0
+    for name in sorted(n for n in os.listdir(inbox) if n.endswith('.json.gz')):
+        path = os.path.join(inbox, name)
+        with open(path, 'rb') as f:
+            batch = decode_batch(f.read())
+        ingest_batch(conn, batch)
+        os.remove(path)
+        total += len(batch['rows'])
+    return total
+
+class _SyncHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        data = _recv_message(self.request)
+        conn = self.server.conn
+        if data[:1] == b'{':
+            reply = {'hwm': central_hwm(conn, json.loads(data)['hwm'])}
+        else:
+            batch = decode_batch(data)
+            reply = {'hwm': ingest_batch(conn, batch)}
+            print(f"[{datetime.now()}] AGGREGATOR: {batch['site']} ids {batch['first_id']}-{batch['last_id']} "
+                  f"({len(batch['rows'])} rows)")
+        _send_message(self.request, json.dumps(reply).encode())
+
+def serve_socket(path, central_db=CENTRAL_DB):
+    """Runs the aggregator on a Unix socket (one request at a time, so merges never interleave)."""
+    if os.path.exists(path):
+        os.remove(path)
+    server = socketserver.UnixStreamServer(path, _SyncHandler)
+    server.conn = sqlite3.connect(central_db, check_same_thread=False)
+    setup_central(server.conn)
+    print(f"[{datetime.now()}] Aggregator listening on {path}")
+    return server
+
+if __name__ == "__main__":
+    # Agent:       python omron_sync.py agent  (outbox_dir | unix:socket_path)
+    # Aggregator:  python omron_sync.py aggregate  inbox_dir   |  python omron_sync.py serve socket_path
+    mode, target = sys.argv[1], sys.argv[2]
+    if mode == 'agent':
+        transport = SocketTransport(target[5:]) if target.startswith('unix:') else FileTransport(target)
+        run_agent('omron.db', transport)
+    elif mode == 'aggregate':
+        with sqlite3.connect(CENTRAL_DB) as central:
+            setup_central(central)
+            print(f"[{datetime.now()}] AGGREGATOR: merged {ingest_directory(central, target)} rows")
+    elif mode == 'serve':
+        serve_socket(target).serve_forever()
@@ -10,6 +10,10 @@ $(document).ready(function() {
     let currentDataU1 = config.historyU1;
     let currentDataU2 = config.historyU2;
 
+    // History is downsampled on the server to about one point per horizontal pixel
+    // (slides outside the carousel view report 0 width, so the viewport width stands in)
+    const historyPoints = () => Math.round(document.getElementById('currentChart24h_U1').clientWidth || viewport.clientWidth) || 1000;
+
     // --- 1. Carousel Navigation Logic ---
     $('#nextBtn').on('click', function() {
         viewport.scrollBy({ left: viewport.clientWidth, behavior: 'smooth' });
@@ -28,21 +32,30 @@ $(document).ready(function() {
                 return;
             }
 
-            const getStats = (arr) => ({
-                avg: (arr.reduce((a, b) => a + b, 0) / arr.length).toFixed(2),
-                max: Math.max(...arr).toFixed(2)
+            // Bucketed rows stand for `n` samples each; raw rows for one
+            const weights = data.map(d => d.n || 1);
+            const totalWeight = weights.reduce((a, b) => a + b, 0);
+            const getStats = (arr, peaks) => ({
+                avg: (arr.reduce((a, v, i) => a + v * weights[i], 0) / totalWeight).toFixed(2),
+                max: Math.max(...peaks).toFixed(2)
             });
+            // Bucketed rows carry the bucket's extremes, so peaks are not averaged away
+            const peakOf = (d, field) => d[field + '_max'] !== undefined
+                ? Math.max(Math.abs(d[field + '_min']), Math.abs(d[field + '_max']))
+                : Math.abs(d[field] || 0);
 
             const vList = data.map(d => d.val_voltage || 0);
             const aList = data.map(d => Math.abs(d.val_current || 0));
             const kwList = data.map(d => Math.abs(d.val_power_kw || 0));
 
-            const vStats = getStats(vList);
-            const aStats = getStats(aList);
-            const kwStats = getStats(kwList);
+            const vStats = getStats(vList, data.map(d => peakOf(d, 'val_voltage')));
+            const aStats = getStats(aList, data.map(d => peakOf(d, 'val_current')));
+            const kwStats = getStats(kwList, data.map(d => peakOf(d, 'val_power_kw')));
             
-            const firstEnergy = data[0].val_energy_kwh || 0;
-            const lastEnergy = data[data.length - 1].val_energy_kwh || 0;
+            // The counter at the range edges, not the means of the edge buckets
+            const first = data[0], last = data[data.length - 1];
+            const firstEnergy = (first.val_energy_kwh_first !== undefined ? first.val_energy_kwh_first : first.val_energy_kwh) || 0;
+            const lastEnergy = (last.val_energy_kwh_last !== undefined ? last.val_energy_kwh_last : last.val_energy_kwh) || 0;
             const energyDelta = Math.abs(lastEnergy - firstEnergy).toFixed(2);
 
             $(`#${prefix}_v_avg`).text(vStats.avg);
@@ -59,22 +72,30 @@ $(document).ready(function() {
     }
 
     // --- 3. Chart Creation Helpers ---
-    function createLineChart(id, color, maxVal) {
+    function createLineChart(id, color, maxVal, banded) {
         const canvas = document.getElementById(id);
         if (!canvas) return null;
+        const datasets = [{
+            data: [],
+            borderColor: color,
+            backgroundColor: color + '33',
+            fill: true,
+            tension: 0.1,
+            borderWidth: 2,
+            fullDates: [] 
+        }];
+        if (banded) {
+            // Min/max envelope of each history bucket (datasets 1 and 2), filled between the two
+            datasets.push(
+                { data: [], borderColor: 'transparent', pointRadius: 0, fill: false, fullDates: [] },
+                { data: [], borderColor: 'transparent', backgroundColor: color + '4D', pointRadius: 0, fill: '-1', fullDates: [] }
+            );
+        }
         return new Chart(canvas.getContext('2d'), {
             type: 'line',
             data: {
                 labels: [],
-                datasets: [{
-                    data: [],
-                    borderColor: color,
-                    backgroundColor: color + '33',
-                    fill: true,
-                    tension: 0.1,
-                    borderWidth: 2,
-                    fullDates: [] 
-                }]
+                datasets: datasets
             },
             options: {
                 responsive: true,
@@ -91,8 +112,8 @@ $(document).ready(function() {
     }
 
     // --- 4. Initialize All Charts ---
-    charts.histU1 = createLineChart('currentChart24h_U1', '#3B82F6', 70.0); 
-    charts.histU2 = createLineChart('currentChart24h_U2', '#FBBF24', 70.0); 
+    charts.histU1 = createLineChart('currentChart24h_U1', '#3B82F6', 70.0, true); 
+    charts.histU2 = createLineChart('currentChart24h_U2', '#FBBF24', 70.0, true); 
     charts.liveU1 = createLineChart('currentChart_U1', '#3B82F6', 70.0); 
     charts.liveU2 = createLineChart('currentChart_U2', '#FBBF24', 70.0); 
 
@@ -171,9 +192,20 @@ $(document).ready(function() {
 
     // --- 5. Data Update Functions ---
     function updateHistoryCharts(chart, data) {
+        const fullDates = data.map(d => d.timestamp);
+        const banded = data.some(d => d.val_current_max !== undefined);
         chart.data.labels = data.map(d => d.timestamp.split(' ')[1]);
-        chart.data.datasets[0].data = data.map(d => Math.abs(d.val_current || 0));
-        chart.data.datasets[0].fullDates = data.map(d => d.timestamp);
+        // Gaps (buckets where this unit has no samples) stay empty instead of dropping to zero
+        chart.data.datasets[0].data = data.map(d => d.gap ? null : Math.abs(d.val_current || 0));
+        chart.data.datasets[0].fill = !banded;
+        if (chart.data.datasets.length > 2) {
+            // Range of |current| in the bucket: touches zero when it crosses zero (reversed CT)
+            chart.data.datasets[1].data = !banded ? [] : data.map(d => d.gap ? null : (d.val_current_min <= 0 && d.val_current_max >= 0)
+                ? 0 : Math.min(Math.abs(d.val_current_min), Math.abs(d.val_current_max)));
+            chart.data.datasets[2].data = !banded ? [] : data.map(d => d.gap ? null :
+                Math.max(Math.abs(d.val_current_min), Math.abs(d.val_current_max)));
+        }
+        chart.data.datasets.forEach(ds => { ds.fullDates = fullDates; });
         chart.update(); 
     }
 
@@ -232,22 +264,21 @@ $(document).ready(function() {
     }
     loadHistoricalSummaries();
 
-    // --- 7. Polling ---
-    setInterval(() => {
-        $.getJSON(config.apiUrlU1, (data) => {
-            if (data && data.timestamp !== lastTsU1) {
-                updateLiveChart(charts.liveU1, data);
-                lastTsU1 = data.timestamp;
-                $('#lastUpdated').text("最終更新: " + data.timestamp.split(' ')[1]);
-            }
-        });
-        $.getJSON(config.apiUrlU2, (data) => {
-            if (data && data.timestamp !== lastTsU2) {
-                updateLiveChart(charts.liveU2, data);
-                lastTsU2 = data.timestamp;
-            }
-        });
-    }, config.readIntervalMs);
+    // --- 7. Live Stream ---
+    // One server-sent event per new reading of either unit; EventSource reconnects and resumes by itself
+    const stream = new EventSource(config.streamUrl);
+    stream.addEventListener('reading', (e) => {
+        const data = JSON.parse(e.data);
+        // A resumed stream can replay rows already drawn
+        if (data.unit_id === 'unit01' && data.timestamp > lastTsU1) {
+            updateLiveChart(charts.liveU1, data);
+            lastTsU1 = data.timestamp;
+            $('#lastUpdated').text("最終更新: " + data.timestamp.split(' ')[1]);
+        } else if (data.unit_id === 'unit02' && data.timestamp > lastTsU2) {
+            updateLiveChart(charts.liveU2, data);
+            lastTsU2 = data.timestamp;
+        }
+    });
 
     // --- 8. Events ---
     $(".date-picker").datepicker({ dateFormat: "yy-mm-dd" });
@@ -261,16 +292,17 @@ $(document).ready(function() {
         const $btn = $(this).find('button[type="submit"]');
         $btn.prop('disabled', true).html('<span class="spinner-border spinner-border-sm"></span>');
 
-        $.when(
-            $.getJSON('/api/unit01/history', { start_date: start, end_date: end }),
-            $.getJSON('/api/unit02/history', { start_date: start, end_date: end })
-        ).done(function(res1, res2) {
-            currentDataU1 = res1[0];
-            currentDataU2 = res2[0];
+        // Both units from one query, bucketed on the same time grid (null where a unit has no samples)
+        $.getJSON('/api/history', {
+            units: 'unit01,unit02', start_date: start, end_date: end, points: historyPoints(), mode: 'buckets', align: 1
+        }).done(function(res) {
+            const rows = (unit) => res[unit].map((d, i) => d || { timestamp: res.timestamp[i], gap: true });
+            currentDataU1 = rows('unit01');
+            currentDataU2 = rows('unit02');
 
             updateHistoryCharts(charts.histU1, currentDataU1);
             updateHistoryCharts(charts.histU2, currentDataU2);
-            calculateAndDisplayStats(currentDataU1, currentDataU2);
+            calculateAndDisplayStats(currentDataU1.filter(d => !d.gap), currentDataU2.filter(d => !d.gap));
             
             const rangeText = `${start} 〜 ${end}`;
             $('#currentRangeText').text(`表示範囲: ${rangeText}`);
@@ -292,10 +324,11 @@ $(document).ready(function() {
             const row1 = d1[i] || {};
             const row2 = d2[i] || {};
             const ts = row1.timestamp || row2.timestamp || "";
-            const a1 = Math.abs(row1.val_current || 0);
-            const p1 = Math.abs(row1.val_power_kw || 0);
-            const a2 = Math.abs(row2.val_current || 0);
-            const p2 = Math.abs(row2.val_power_kw || 0);
+            // Batch history is time-aligned, so row i of both units shares a timestamp; gaps stay blank
+            const a1 = row1.gap ? '' : Math.abs(row1.val_current || 0);
+            const p1 = row1.gap ? '' : Math.abs(row1.val_power_kw || 0);
+            const a2 = row2.gap ? '' : Math.abs(row2.val_current || 0);
+            const p2 = row2.gap ? '' : Math.abs(row2.val_power_kw || 0);
             csv += `${ts},${a1},${p1},${a2},${p2}\n`;
         }
 
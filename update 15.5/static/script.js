@@ -2,67 +2,113 @@ $(document).ready(function() {
     // 1. Configuration & Initialization
     const config = window.flaskData;
     let voltageChart, currentChart, voltageChart24h, currentChart24h;
-    let currentData = config.history; 
+    let currentData = rowsToColumns(config.history); 
     let lastTimestamp = ""; 
 
     const MAX_POINTS = 30; 
 
+    // History is downsampled on the server to about one point per horizontal pixel
+    const historyPoints = () => Math.round(document.getElementById('currentChart24h').clientWidth) || 1000;
+
+    // Bucketed history carries <field>_min/_max: drawn as a band (datasets 1 and 2) behind the bucket mean
+    const envelopeDatasets = (color) => [
+        { data: [], borderColor: 'transparent', pointRadius: 0, fill: false, fullDates: [] },
+        { data: [], borderColor: 'transparent', backgroundColor: color, pointRadius: 0, fill: '-1', fullDates: [] }
+    ];
+
     $(".date-picker").datepicker({ dateFormat: "yy-mm-dd" });
 
+    // History arrives as columns (format=binary): {t: epoch seconds, <field>: values, ...}
+    function decodeHistory(buffer) {
+        // Header: magic, version, column count, row count; then 32-byte column descriptors.
+        // Typed arrays use the platform byte order, which is little-endian in every browser we support.
+        const view = new DataView(buffer);
+        const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+        if (magic !== 'OMRH' || view.getUint16(4, true) !== 1) throw new Error('unknown history format');
+        const count = view.getUint16(6, true);
+        const rows = view.getUint32(8, true);
+        const types = { q: BigInt64Array, d: Float64Array, f: Float32Array };
+        const decoder = new TextDecoder();
+        const columns = {};
+        let offset = 16 + count * 32;
+        for (let i = 0; i < count; i++) {
+            const base = 16 + i * 32;
+            const name = decoder.decode(new Uint8Array(buffer, base, 24)).replace(/\0+$/, '');
+            const Type = types[String.fromCharCode(view.getUint8(base + 24))];
+            columns[name] = new Type(buffer, offset, rows);
+            offset += Math.ceil(rows * Type.BYTES_PER_ELEMENT / 8) * 8;
+        }
+        return columns;
+    }
+
+    function rowsToColumns(rows) {
+        const columns = { t: rows.map(d => new Date(d.timestamp.replace(' ', 'T')).getTime() / 1000) };
+        ['val_voltage', 'val_current', 'val_power_kw', 'val_energy_kwh'].forEach(f => { columns[f] = rows.map(d => d[f]); });
+        return columns;
+    }
+
+    const pad = (x) => String(x).padStart(2, '0');
+    function formatEpoch(t) {
+        const d = new Date(Number(t) * 1000);
+        return `${d.getFullYear()}-${pad(d.getMonth() + 1)}-${pad(d.getDate())} ${pad(d.getHours())}:${pad(d.getMinutes())}:${pad(d.getSeconds())}`;
+    }
+
+    // Float32 columns: drop the digits float32 adds (200.1 -> 200.10000610...); NaN is a gap
+    const clean = (v) => Number.isFinite(v) ? +v.toPrecision(7) : null;
+
     // Initialize charts with the history passed from Flask
-    initCharts(currentData);
+    initCharts(config.history);
 
-    // 2. Real-time Data Polling
-    setInterval(updateLiveMetrics, config.readIntervalMs);
+    // 2. Real-time Data (pushed by the server; EventSource reconnects and resumes by itself)
+    const stream = new EventSource(config.streamUrl);
+    stream.addEventListener('reading', (e) => updateLiveMetrics(JSON.parse(e.data)));
 
-    function updateLiveMetrics() {
-        $.getJSON(config.apiUrl, function(data) {
-            // Guard clause: error or duplicate data
-            if (data.error || data.timestamp === lastTimestamp) return;
-            lastTimestamp = data.timestamp;
+    function updateLiveMetrics(data) {
+        // Guard clause: error, duplicate or already shown (a resumed stream can replay a row)
+        if (data.error || data.timestamp <= lastTimestamp) return;
+        lastTimestamp = data.timestamp;
 
-            // Use Math.abs to ensure positive numbers even if CT is reversed
-            const absCurrent = Math.abs(data.val_current);
-            const absPower = Math.abs(data.val_power_kw !== undefined ? data.val_power_kw : 0.0);
+        // Use Math.abs to ensure positive numbers even if CT is reversed
+        const absCurrent = Math.abs(data.val_current);
+        const absPower = Math.abs(data.val_power_kw !== undefined ? data.val_power_kw : 0.0);
 
-            // --- Update UI Cards (Voltage & Current) ---
-            $('#live-voltage').text(data.val_voltage.toFixed(2));
-            $('#live-current').text(absCurrent.toFixed(3));
-            
-            // --- Updated Power (kW) Logic (Simplified/No Solar Text) ---
-            const powerElement = $('#live-power');
-            const powerLabel = powerElement.closest('.card').find('p');
-            
-            powerElement.text(absPower.toFixed(3));
-            
-            // Revert Label and Color to standard consumption mode
-            powerLabel.text("電力 (kW)");
-            powerElement.css('color', ''); // Reset to default theme color (usually dark or red)
-            
-            // --- Update Energy & Timestamp ---
-            $('#live-energy').text(data.val_energy_kwh.toFixed(3));
-            $('#lastUpdated').text("最終更新: " + data.timestamp.split(' ')[1]);
-
-            // --- Update Real-time Log Table ---
-            // Removed table-success class logic
-            const newRow = `<tr>
-                <td class="text-secondary">${data.timestamp.split(' ')[1]}</td>
-                <td>${data.val_voltage.toFixed(2)}</td>
-                <td>${absCurrent.toFixed(3)}</td>
-                <td>${absPower.toFixed(3)}</td>
-                <td>${data.val_energy_kwh.toFixed(3)}</td>
-            </tr>`;
-            
-            $('#logTableBody').prepend(newRow);
-            
-            // Keep only the latest 10 rows
-            if ($('#logTableBody tr').length > 10) {
-                $('#logTableBody tr:last').remove();
-            }
+        // --- Update UI Cards (Voltage & Current) ---
+        $('#live-voltage').text(data.val_voltage.toFixed(2));
+        $('#live-current').text(absCurrent.toFixed(3));
+        
+        // --- Updated Power (kW) Logic (Simplified/No Solar Text) ---
+        const powerElement = $('#live-power');
+        const powerLabel = powerElement.closest('.card').find('p');
+        
+        powerElement.text(absPower.toFixed(3));
+        
+        // Revert Label and Color to standard consumption mode
+        powerLabel.text("電力 (kW)");
+        powerElement.css('color', ''); // Reset to default theme color (usually dark or red)
+        
+        // --- Update Energy & Timestamp ---
+        $('#live-energy').text(data.val_energy_kwh.toFixed(3));
+        $('#lastUpdated').text("最終更新: " + data.timestamp.split(' ')[1]);
 
-            // --- Update Live Charts ---
-            updateChartsRealtime(data);
-        });
+        // --- Update Real-time Log Table ---
+        // Removed table-success class logic
+        const newRow = `<tr>
+            <td class="text-secondary">${data.timestamp.split(' ')[1]}</td>
+            <td>${data.val_voltage.toFixed(2)}</td>
+            <td>${absCurrent.toFixed(3)}</td>
+            <td>${absPower.toFixed(3)}</td>
+            <td>${data.val_energy_kwh.toFixed(3)}</td>
+        </tr>`;
+        
+        $('#logTableBody').prepend(newRow);
+        
+        // Keep only the latest 10 rows
+        if ($('#logTableBody tr').length > 10) {
+            $('#logTableBody tr:last').remove();
+        }
+
+        // --- Update Live Charts ---
+        updateChartsRealtime(data);
     }
 
     // 3. Chart Management
@@ -105,13 +151,13 @@ $(document).ready(function() {
 
         voltageChart24h = new Chart(document.getElementById('voltageChart24h'), {
             type: 'line',
-            data: { labels: histLabels, datasets: [{ data: histVoltages, borderColor: '#4CAF50', fill: true, fullDates: histFullDates }] },
+            data: { labels: histLabels, datasets: [{ data: histVoltages, borderColor: '#4CAF50', fill: true, fullDates: histFullDates }, ...envelopeDatasets('rgba(76, 175, 80, 0.25)')] },
             options: getOptions('history', 180, 230)
         });
 
         currentChart24h = new Chart(document.getElementById('currentChart24h'), {
             type: 'line',
-            data: { labels: histLabels, datasets: [{ data: histCurrents, borderColor: '#FBBF24', fill: true, fullDates: histFullDates }] },
+            data: { labels: histLabels, datasets: [{ data: histCurrents, borderColor: '#FBBF24', fill: true, fullDates: histFullDates }, ...envelopeDatasets('rgba(251, 191, 36, 0.3)')] },
             options: getOptions('history', 0, 70.0)
         });
 
@@ -129,18 +175,34 @@ $(document).ready(function() {
     }
 
     function updateHistoryOnly(data) {
-        const labels = data.map(d => d.timestamp.split(' ')[1]);
-        const fullDates = data.map(d => d.timestamp);
-        
-        voltageChart24h.data.labels = labels;
-        voltageChart24h.data.datasets[0].data = data.map(d => d.val_voltage);
-        voltageChart24h.data.datasets[0].fullDates = fullDates;
-        voltageChart24h.update();
-
-        currentChart24h.data.labels = labels;
-        currentChart24h.data.datasets[0].data = data.map(d => Math.abs(d.val_current)); // Force positive
-        currentChart24h.data.datasets[0].fullDates = fullDates;
-        currentChart24h.update();
+        setHistorySeries(voltageChart24h, data, 'val_voltage', false);
+        setHistorySeries(currentChart24h, data, 'val_current', true); // Force positive
+    }
+
+    function setHistorySeries(chart, data, field, absolute) {
+        const fullDates = Array.from(data.t, formatEpoch);
+        const banded = (field + '_max') in data;
+        const lo = banded ? data[field + '_min'] : [];
+        const hi = banded ? data[field + '_max'] : [];
+        const bounds = Array.from(data.t, (_, i) => banded ? envelope(clean(lo[i]), clean(hi[i]), absolute) : [null, null]);
+
+        chart.data.labels = fullDates.map(d => d.split(' ')[1]);
+        chart.data.datasets[0].data = Array.from(data[field], v => {
+            const value = clean(v);
+            return (absolute && value !== null) ? Math.abs(value) : value;
+        });
+        chart.data.datasets[0].fill = !banded;
+        chart.data.datasets[1].data = bounds.map(b => b[0]);
+        chart.data.datasets[2].data = bounds.map(b => b[1]);
+        chart.data.datasets.forEach(ds => { ds.fullDates = fullDates; });
+        chart.update();
+    }
+
+    function envelope(lo, hi, absolute) {
+        if (!absolute || lo === null || hi === null) return [lo, hi];
+        // Range of |x| for x in [lo, hi]: touches zero when the bucket crosses it (reversed CT)
+        const low = (lo <= 0 && hi >= 0) ? 0 : Math.min(Math.abs(lo), Math.abs(hi));
+        return [low, Math.max(Math.abs(lo), Math.abs(hi))];
     }
 
     function updateChartsRealtime(point) {
@@ -173,8 +235,13 @@ $(document).ready(function() {
 
         $btn.prop('disabled', true).html('<span class="spinner-border spinner-border-sm me-1"></span>');
 
-        $.getJSON(`/api/${config.unitId}/history`, { start_date: start, end_date: end }, function(data) {
-            if (data.length === 0) {
+        const query = $.param({ start_date: start, end_date: end, points: historyPoints(), mode: 'buckets', format: 'binary' });
+        fetch(`/api/${config.unitId}/history?${query}`).then(res => {
+            if (!res.ok) throw new Error(res.statusText);
+            return res.arrayBuffer();
+        }).then(buffer => {
+            const data = decodeHistory(buffer);
+            if (data.t.length === 0) {
                 alert("データが見つかりませんでした。");
                 return;
             }
@@ -187,17 +254,17 @@ $(document).ready(function() {
             
             updateHistoryOnly(data);
 
-        }).fail(() => alert("通信エラー")).always(() => $btn.prop('disabled', false).text('読込'));
+        }).catch(() => alert("通信エラー")).finally(() => $btn.prop('disabled', false).text('読込'));
     });
 
     // 5. Export CSV
     $('#exportCsvBtn').on('click', function() {
         let csv = "Timestamp,Voltage(V),Current(A),Power(kW),Energy(kWh)\n";
-        currentData.forEach(r => {
+        Array.from(currentData.t).forEach((t, i) => {
             // Export values as absolute for consistency with reversed CT fix
-            const c = Math.abs(r.val_current);
-            const p = Math.abs((r.val_power_kw !== undefined && r.val_power_kw !== null) ? r.val_power_kw : 0.0);
-            csv += `${r.timestamp},${r.val_voltage},${c},${p},${r.val_energy_kwh}\n`;
+            const c = Math.abs(clean(currentData.val_current[i]));
+            const p = Math.abs(clean(currentData.val_power_kw[i]) ?? 0.0);
+            csv += `${formatEpoch(t)},${clean(currentData.val_voltage[i])},${c},${p},${currentData.val_energy_kwh[i]}\n`;
         });
         const blob = new Blob([csv], { type: 'text/csv;charset=utf-8;' });
         const url = URL.createObjectURL(blob);
@@ -209,8 +276,8 @@ $(document).ready(function() {
 
     // 6. Reset to Live Mode
     $('#resetLiveBtn').on('click', function() {
-        currentData = config.history; 
-        updateHistoryOnly(config.history); 
+        currentData = rowsToColumns(config.history); 
+        updateHistoryOnly(currentData); 
         
         $('#cChartTitle').text('電流履歴 24h (A)');
         $('#vChartTitle').text('電圧履歴 24h (V)');
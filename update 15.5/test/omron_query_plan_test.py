@@ -0,0 +1,237 @@
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+import types
+import unittest
+from datetime import datetime, timedelta
+
+# Run from anywhere: python test/omron_query_plan_test.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# --- Configuration ---
+DAYS = 3                  # Days of 1-minute samples per unit in the test database
+STEP_SECONDS = 60
+UNITS = ('unit01', 'unit02')
+STREAM_WAIT = 10          # Seconds test_web_stream waits for the events it expects
+
+# A plan line like this means the query is not bounded by an index
+BAD_PLAN = re.compile(r'^(SCAN (readings|rollups|archive_points|archive_days|outages)\b|.*USE TEMP B-TREE)')
+
+# Only the unit prefix of idx_unit_timestamp is used: the time filter is a function or
+# pattern over the column (date(timestamp), LIKE) and every row of the unit is read.
+# Fine only for a MIN/MAX lookup or an ordered LIMIT (latest row, keyset batches).
+UNIT_ONLY = re.compile(r'^SEARCH readings USING (COVERING )?INDEX idx_unit_timestamp \(unit_id=\?\)$')
+UNIT_ONLY_ALLOWED = re.compile(r'\bLIMIT\b|\b(MIN|MAX)\(timestamp\)', re.I)
+
+# Time-bucket grouping keys are computed from the timestamp, so no index can deliver
+# them in order; these queries read a range bounded by an index SEARCH and group it
+GROUP_BY_ALLOWED = ('GROUP BY b', 'GROUP BY field, b', 'GROUP BY unit_id, b', 'GROUP BY unit_id, field, b',
+                    'GROUP BY bucket')
+
+_captured = []
+_connect = sqlite3.connect
+
+def _traced_connect(*args, **kwargs):
+    """sqlite3.connect that records every statement the application runs."""
+    conn = _connect(*args, **kwargs)
+    conn.set_trace_callback(_captured.append)
+    return conn
+
+def populate(db):
+    """Fills a fresh database through the collector's own insert path (raw rows and rollups)."""
+    db.setup_database()
+    conn = _connect(db.DB_NAME)
+    cursor = conn.cursor()
+    t = datetime.now().replace(microsecond=0) - timedelta(days=DAYS)
+    energy = 100.0
+    while t <= datetime.now():
+        for unit_id in UNITS:
+            current = 5 + (t.minute % 7)
+            db.store_reading(cursor, unit_id, {
+                'timestamp': t.strftime('%Y-%m-%d %H:%M:%S'),
+                'val_voltage': 200.0 + (t.second % 3),
+                'val_current': current,
+                'val_power_kw': current * 0.2,
+                'val_energy_kwh': energy,
+            })
+        energy += 0.01
+        t += timedelta(seconds=STEP_SECONDS)
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+
+class QueryPlanTest(unittest.TestCase):
+    """Runs the read paths against a populated database and checks every query's plan."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.cwd = os.getcwd()
+        os.chdir(cls.tmp.name)  # The modules open 'omron.db' relative to the working directory
+        import omron_database
+        populate(omron_database)
+        sqlite3.connect = _traced_connect
+
+    @classmethod
+    def tearDownClass(cls):
+        sqlite3.connect = _connect
+        os.chdir(cls.cwd)
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        del _captured[:]
+
+    def assertPlansIndexed(self):
+        statements = {s for s in _captured if re.match(r'\s*(SELECT|WITH|DELETE|UPDATE)\b', s, re.I)}
+        self.assertTrue(statements, "no queries were captured")
+        conn = _connect('omron.db')
+        failures = []
+        try:
+            for sql in sorted(statements):
+                for row in conn.execute('EXPLAIN QUERY PLAN ' + sql):
+                    detail = row[-1]
+                    if 'TEMP B-TREE FOR GROUP BY' in detail and any(k in sql for k in GROUP_BY_ALLOWED):
+                        continue
+                    if BAD_PLAN.match(detail) or (UNIT_ONLY.match(detail) and not UNIT_ONLY_ALLOWED.search(sql)):
+                        failures.append(f"{detail}\n    in: {' '.join(sql.split())}")
+        finally:
+            conn.close()
+        self.assertEqual(failures, [], "\n" + "\n".join(failures))
+
+    def test_web_history(self):
+        import omron_main_web
+        client = omron_main_web.app.test_client()
+        today = datetime.now().strftime('%Y-%m-%d')
+        week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
+        yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        for query in (
+            f'start_date={yesterday}&end_date={today}&points=500',
+            f'start_date={yesterday}&end_date={today}&points=500&format=binary',
+            f'start_date={week_ago}&end_date={today}&points=500',
+            f'start_date={yesterday}&end_date={today}&points=5000&mode=buckets',
+            f'start_date={week_ago}&end_date={today}&points=100&mode=buckets',
+        ):
+            for unit_id in UNITS:
+                self.assertEqual(client.get(f'/api/{unit_id}/history?{query}').status_code, 200)
+            for batch in ('&mode=buckets', '&align=1') if 'format=binary' not in query else ():
+                self.assertEqual(client.get(f'/api/history?units={",".join(UNITS)}&{query}{batch}').status_code, 200)
+        self.assertPlansIndexed()
+
+    def test_web_dashboard_and_summaries(self):
+        import omron_main_web
+        client = omron_main_web.app.test_client()
+        today = datetime.now().strftime('%Y-%m-%d')
+        for path in ('/dashboard/unit01', '/hikaku', '/api/unit01/latest', '/api/latest?units=unit01,unit02',
+                     '/api/weekly_summary', '/api/weekly_energy_summary', '/api/monthly_energy_summary',
+                     f'/api/availability?start_date={today}&end_date={today}',
+                     '/api/changes?since=100&limit=50&units=unit02'):
+            self.assertEqual(client.get(path).status_code, 200, path)
+        self.assertPlansIndexed()
+
+    def test_web_stream(self):
+        import omron_database
+        import omron_main_web
+        from omron_latest import LatestWriter
+        client = omron_main_web.app.test_client()
+        conn = _connect('omron.db')
+        newest = conn.execute("SELECT MAX(id) FROM readings").fetchone()[0]
+        response = client.get(f'/api/stream?units={",".join(UNITS)}&since={newest - 4}', buffered=False)
+        chunks = iter(response.response)
+
+        def events(count):
+            found = []
+            deadline = time.time() + STREAM_WAIT
+            while len(found) < count and time.time() < deadline:
+                chunk = next(chunks)
+                chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+                found += re.findall(r'^id: (\d+)\nevent: reading\ndata: .*"id": (\d+)', chunk, re.M)
+            return [(int(event_id), int(row_id)) for event_id, row_id in found]
+
+        # Small feed pages, and keepalives often enough that waiting for an event that never comes ends
+        saved = omron_main_web.CHANGES_DEFAULT_LIMIT, omron_main_web.STREAM_KEEPALIVE
+        omron_main_web.CHANGES_DEFAULT_LIMIT, omron_main_web.STREAM_KEEPALIVE = 2, 0.5
+        writer = LatestWriter()
+        try:
+            self.assertEqual([row_id for _, row_id in events(4)], list(range(newest - 3, newest + 1)))
+            # unit02 is followed through the change feed while unit01 is published live with a higher id:
+            # the feed pages of unit02 must not be skipped past by unit01's cursor
+            t = datetime.now() + timedelta(hours=1)
+            cursor = conn.cursor()
+            for i in range(5):
+                omron_database.store_reading(cursor, UNITS[1], {
+                    'timestamp': (t + timedelta(seconds=i)).strftime('%Y-%m-%d %H:%M:%S'),
+                    'val_voltage': 200.0, 'val_current': 5.0, 'val_power_kw': 1.0, 'val_energy_kwh': 200.0,
+                })
+            reading = {'timestamp': t.strftime('%Y-%m-%d %H:%M:%S'),
+                       'val_voltage': 200.0, 'val_current': 5.0, 'val_power_kw': 1.0, 'val_energy_kwh': 200.0}
+            omron_database.store_reading(cursor, UNITS[0], reading)
+            conn.commit()
+            writer.publish(UNITS[0], reading, cursor.lastrowid)
+            sent = events(6)
+            self.assertEqual(sorted(row_id for _, row_id in sent), list(range(newest + 1, newest + 7)))
+            # A resume id never passes a row that has not been sent yet
+            for i, (event_id, _) in enumerate(sent[:-1]):
+                self.assertLess(event_id, min(row_id for _, row_id in sent[i + 1:]))
+        finally:
+            omron_main_web.CHANGES_DEFAULT_LIMIT, omron_main_web.STREAM_KEEPALIVE = saved
+            response.close()
+            writer.close()
+            conn.close()
+        self.assertPlansIndexed()
+
+    def test_maintenance(self):
+        import omron_database
+        conn = sqlite3.connect('omron.db')
+        omron_database.catch_up_rollups(conn)
+        conn.close()
+        omron_database.run_maintenance(dict(omron_database.RETENTION_TIERS, raw=DAYS - 1))
+        self.assertPlansIndexed()
+
+class MigrationTest(unittest.TestCase):
+    """Online table rebuild while the collector keeps updating rows."""
+
+    def test_rebuild_keeps_rows_updated_during_backfill(self):
+        import omron_migrations
+        with tempfile.TemporaryDirectory() as tmp:
+            db_name = os.path.join(tmp, 'omron.db')
+            conn = _connect(db_name)
+            conn.execute("""
+                CREATE TABLE readings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL, val_voltage REAL NOT NULL,
+                    val_current REAL NOT NULL, val_power_factor REAL NOT NULL, val_energy_kwh REAL NOT NULL,
+                    unit_id TEXT NOT NULL
+                )
+            """)
+            conn.execute('CREATE INDEX idx_unit_timestamp ON readings (unit_id, timestamp)')
+            conn.executemany("INSERT INTO readings VALUES (?, ?, 200.0, 1.0, 0.9, ?, 'unit01')",
+                             [(i, f'2026-01-01 00:00:{i:02d}', float(i)) for i in range(1, 61)])
+            conn.commit()
+
+            # The pause between chunks is where the collector writes: update whole chunks the backfill
+            # has not reached, so the triggers mirror them first and their INSERT OR IGNORE copies nothing
+            updates = [(11, 20), (31, 40)]
+            def collector_writes(seconds):
+                while updates:
+                    conn.execute("UPDATE readings SET val_voltage = 201.0 WHERE id BETWEEN ? AND ?", updates.pop())
+                    conn.commit()
+            omron_migrations.time = types.SimpleNamespace(time=time.time, sleep=collector_writes)
+            try:
+                omron_migrations.setup_migrations(conn)
+                omron_migrations.rebuild_table(db_name, omron_migrations.MIGRATIONS[0], chunk_size=10)
+            finally:
+                omron_migrations.time = time
+
+            ids = [row[0] for row in conn.execute("SELECT id FROM readings ORDER BY id")]
+            self.assertEqual(ids, list(range(1, 61)))
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM readings WHERE val_voltage = 201.0").fetchone()[0], 20)
+            self.assertIn('val_power_kw', [info[1] for info in conn.execute("PRAGMA table_info(readings)")])
+            self.assertEqual([row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'readings'")], ['idx_unit_timestamp'])
+            self.assertEqual(conn.execute('PRAGMA integrity_check').fetchone()[0], 'ok')
+            conn.close()
+
+if __name__ == '__main__':
+    unittest.main()